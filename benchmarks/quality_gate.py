@@ -0,0 +1,311 @@
+"""
+Plan-quality-aware performance regression gate.
+
+Runs every registered optimization engine on fixed-seed datasets and records
+runtime together with the plan quality metrics from evaluate_plan_impact.
+Fails when runtime or quality drifts beyond the configured tolerances, so
+speedups cannot silently trade away plan quality.
+
+Usage:
+    python benchmarks/quality_gate.py save-baseline
+    python benchmarks/quality_gate.py check --runtime-tolerance 0.25 --total-transport-cost-tolerance 0.01
+
+Runtime is the fastest of --repeats runs; engines faster than
+--min-runtime in the baseline are only checked for plan quality, since their
+timings are dominated by noise.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+from run_benchmarks import (
+    BENCHMARK_SEED,
+    RESULTS_DIR,
+    SCALES,
+    load_json,
+    save_json,
+    scaled_store_cities,
+)
+
+from data_generator.data_generator_main import generate_all_data
+from engine.analyzer import InventoryAnalyzer
+from engine.registry import create_engine, get_engine_names
+
+
+QUALITY_BASELINE_FILE = RESULTS_DIR / "quality_baseline.json"
+
+# Timed runs per engine (the fastest is kept) and the baseline runtime below
+# which runtime drift is not checked
+RUNTIME_REPEATS = 3
+MIN_RUNTIME_S = 0.5
+
+# metric name: (impact_df row, impact_df column, higher_is_worse)
+QUALITY_METRICS = {
+    "total_transport_cost": ("Total Transport Cost", "Transfer Plan", True),
+    "reduction_in_needed_items": ("Reduction in Needed Items", "Improvement", False),
+    "imbalance_std_dev": ("Inventory Imbalance (StdDev)", "After Transfer", True),
+    "cost_per_unit": ("Avg Cost Per Unit", "Transfer Plan", True),
+    "total_units": ("Total Units Transferred", "Transfer Plan", False),
+}
+
+DEFAULT_TOLERANCES = {
+    "runtime_s": 0.25,
+    "total_transport_cost": 0.01,
+    "reduction_in_needed_items": 0.0,
+    "imbalance_std_dev": 0.01,
+    "cost_per_unit": 0.01,
+    "total_units": 0.05,
+}
+
+
+def extract_quality_metrics(impact_df):
+    """
+    Extract the plan quality metrics from an impact summary.
+
+    Args:
+        impact_df: Impact summary DataFrame from evaluate_plan_impact
+
+    Returns:
+        Dictionary of quality metrics
+    """
+    metrics = {}
+    for metric, (row, column, _) in QUALITY_METRICS.items():
+        if impact_df is None:
+            metrics[metric] = 0.0
+        else:
+            metrics[metric] = float(impact_df.loc[row, column])
+    return metrics
+
+
+def run_engines_on_scale(scale, work_dir, engine_names, seed=BENCHMARK_SEED, repeats=RUNTIME_REPEATS):
+    """
+    Run the selected engines on one fixed-seed dataset.
+
+    Args:
+        scale: Scale parameters (store_multiplier, num_products, days)
+        work_dir: Directory for generated data
+        engine_names: Names of the engines to run
+        seed: Random seed used for data generation
+        repeats: Timed runs per engine; the fastest is recorded
+
+    Returns:
+        Dictionary mapping engine name to runtime and quality metrics
+    """
+    data_dir = os.path.join(work_dir, "data")
+    results = {}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_all_data(
+            num_products=scale["num_products"],
+            days=scale["days"],
+            output_dir=data_dir,
+            random_seed=seed,
+            store_cities=scaled_store_cities(scale["store_multiplier"]),
+        )
+
+        analyzer = InventoryAnalyzer()
+        analyzer.load_data(
+            sales_path=os.path.join(data_dir, "sales_data.csv"),
+            inventory_path=os.path.join(data_dir, "inventory_data.csv"),
+            stores_path=os.path.join(data_dir, "stores.csv"),
+            products_path=os.path.join(data_dir, "products.csv"),
+        )
+        analyzer.analyze_sales_data()
+        excess_df, needed_df = analyzer.identify_inventory_imbalances()
+
+        for engine_name in engine_names:
+            engine = create_engine(engine_name)
+            engine.load_matrices(
+                distance_path=os.path.join(data_dir, "distance_matrix.csv"),
+                cost_path=os.path.join(data_dir, "transport_cost_matrix.csv"),
+            )
+
+            runtimes = []
+            for _ in range(max(1, repeats)):
+                start_time = perf_counter()
+                transfer_plan = engine.optimize(excess_df.copy(), needed_df.copy())
+                runtimes.append(perf_counter() - start_time)
+            runtime = min(runtimes)
+
+            impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
+
+            results[engine_name] = {
+                "runtime_s": runtime,
+                "transfers": len(transfer_plan),
+                **extract_quality_metrics(impact_df),
+            }
+
+    return results
+
+
+def run_quality_suite(scale_names, engine_names, seed=BENCHMARK_SEED, repeats=RUNTIME_REPEATS):
+    """
+    Run the selected engines on every selected scale.
+
+    Returns:
+        Quality run dictionary
+    """
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "scales": {},
+    }
+
+    for scale_name in scale_names:
+        print(f"Running engines {', '.join(engine_names)} on scale '{scale_name}'...")
+        with tempfile.TemporaryDirectory(prefix=f"quality_{scale_name}_") as work_dir:
+            run["scales"][scale_name] = run_engines_on_scale(
+                SCALES[scale_name], work_dir, engine_names, seed, repeats
+            )
+
+        for engine_name, record in run["scales"][scale_name].items():
+            print(
+                f"  {engine_name:<20} {record['runtime_s']:>8.3f}s  "
+                f"cost {record['total_transport_cost']:>16,.0f}  "
+                f"needed -{record['reduction_in_needed_items']:<6.0f} "
+                f"std {record['imbalance_std_dev']:>8.2f}  "
+                f"cost/unit {record['cost_per_unit']:>10,.0f}"
+            )
+
+    return run
+
+
+def check_against_baseline(baseline, current, tolerances, min_runtime=MIN_RUNTIME_S):
+    """
+    Check a quality run against the baseline.
+
+    Args:
+        baseline: Baseline quality run
+        current: Current quality run
+        tolerances: Allowed relative drift per metric
+        min_runtime: Minimum baseline runtime for runtime comparisons
+
+    Returns:
+        List of violation dictionaries
+    """
+    directions = {"runtime_s": True}
+    directions.update({metric: spec[2] for metric, spec in QUALITY_METRICS.items()})
+
+    violations = []
+
+    for scale_name, engines in current["scales"].items():
+        for engine_name, record in engines.items():
+            base_record = baseline["scales"].get(scale_name, {}).get(engine_name)
+            if base_record is None:
+                print(f"No baseline for {engine_name} on '{scale_name}', skipping.")
+                continue
+
+            for metric, higher_is_worse in directions.items():
+                base_value = base_record.get(metric)
+                value = record.get(metric)
+                if base_value is None or value is None:
+                    continue
+                if metric == "runtime_s" and base_value < min_runtime:
+                    continue
+
+                allowed = abs(base_value) * tolerances[metric]
+                drift = value - base_value if higher_is_worse else base_value - value
+
+                if drift > allowed + 1e-9:
+                    violations.append(
+                        {
+                            "scale": scale_name,
+                            "engine": engine_name,
+                            "metric": metric,
+                            "baseline": base_value,
+                            "current": value,
+                            "tolerance": tolerances[metric],
+                        }
+                    )
+
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan-quality-aware regression gate")
+    parser.add_argument("command", choices=["save-baseline", "check"])
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        choices=list(SCALES),
+        default=["small", "medium"],
+        help="Dataset scales to run",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        default=None,
+        help="Engines to run (default: all registered engines)",
+    )
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED, help="Random seed")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=RUNTIME_REPEATS,
+        help="Timed runs per engine; the fastest is compared",
+    )
+    parser.add_argument(
+        "--min-runtime",
+        type=float,
+        default=MIN_RUNTIME_S,
+        help="Baseline runtime (seconds) below which runtime drift is not checked",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=str(QUALITY_BASELINE_FILE),
+        help="Quality baseline JSON file",
+    )
+    for metric, default in DEFAULT_TOLERANCES.items():
+        option = "runtime" if metric == "runtime_s" else metric
+        parser.add_argument(
+            f"--{option.replace('_', '-')}-tolerance",
+            dest=f"{metric}_tolerance",
+            type=float,
+            default=default,
+            help=f"Allowed relative drift of {metric} (default: {default})",
+        )
+
+    args = parser.parse_args()
+    engine_names = args.engines or get_engine_names()
+
+    if args.command == "check":
+        baseline = load_json(args.baseline)
+        if baseline is None:
+            print(f"Quality baseline {args.baseline} not found. Run save-baseline first.")
+            sys.exit(2)
+
+    run = run_quality_suite(args.scales, engine_names, args.seed, args.repeats)
+
+    if args.command == "save-baseline":
+        save_json(args.baseline, run)
+        print(f"Saved quality baseline to {args.baseline}")
+        return
+
+    tolerances = {
+        metric: getattr(args, f"{metric}_tolerance") for metric in DEFAULT_TOLERANCES
+    }
+    violations = check_against_baseline(baseline, run, tolerances, args.min_runtime)
+
+    print(f"\n=== QUALITY GATE AGAINST BASELINE ({baseline['timestamp']}) ===")
+    if not violations:
+        print("All engines within runtime and plan quality tolerances.")
+        return
+
+    for violation in violations:
+        print(
+            f"FAILED [{violation['scale']}] {violation['engine']} {violation['metric']}: "
+            f"{violation['baseline']:,.3f} -> {violation['current']:,.3f} "
+            f"(tolerance {violation['tolerance']:.0%})"
+        )
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Benchmark suite for the Goods Allocation Optimizer.
+
+Generates fixed-seed datasets at several scales through the data generators and
+times every pipeline stage: data generation, sales analysis, imbalance detection,
+rule-based optimization, plan impact evaluation and results creation.
+
+Usage:
+    python benchmarks/run_benchmarks.py run --scales small medium
+    python benchmarks/run_benchmarks.py save-baseline
+    python benchmarks/run_benchmarks.py compare --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+
+import pandas as pd  # noqa: E402
+
+from config import STORE_CITIES  # noqa: E402
+from data_generator.data_generator_main import generate_all_data  # noqa: E402
+from engine.analyzer import InventoryAnalyzer  # noqa: E402
+from engine.results_manager import ResultsManager  # noqa: E402
+from engine.rule_based import RuleBasedOptimizer  # noqa: E402
+from utils.profiler import StageProfiler  # noqa: E402
+
+
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+HISTORY_FILE = RESULTS_DIR / "history.json"
+BASELINE_FILE = RESULTS_DIR / "baseline.json"
+
+BENCHMARK_SEED = 42
+
+# Each scale multiplies the store count of every configured city
+SCALES = {
+    "small": {"store_multiplier": 1, "num_products": 30, "days": 30},
+    "medium": {"store_multiplier": 2, "num_products": 60, "days": 90},
+    "large": {"store_multiplier": 5, "num_products": 100, "days": 180},
+}
+
+# Stage metrics compared against the baseline (higher is worse)
+COMPARED_METRICS = ["wall_time_s", "tracemalloc_peak_mb"]
+
+
+def scaled_store_cities(multiplier):
+    """
+    Scale the number of stores per city in the configured city layout.
+
+    Args:
+        multiplier: Store count multiplier
+
+    Returns:
+        City configuration dictionary for StoreGenerator
+    """
+    return {
+        city: {**info, "count": info["count"] * multiplier}
+        for city, info in STORE_CITIES.items()
+    }
+
+
+def run_scale(scale_name, scale, work_dir, seed=BENCHMARK_SEED, verbose=False):
+    """
+    Run the full pipeline on one dataset scale and record every stage.
+
+    Args:
+        scale_name: Name of the scale
+        scale: Scale parameters (store_multiplier, num_products, days)
+        work_dir: Directory for generated data and results
+        seed: Random seed used for data generation
+        verbose: Whether to show pipeline output
+
+    Returns:
+        Dictionary with the scale parameters and per-stage records
+    """
+    data_dir = os.path.join(work_dir, "data")
+    results_dir = os.path.join(work_dir, "results")
+    profiler = StageProfiler(enabled=True)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    with output:
+        with profiler.stage("generate_all_data") as span:
+            summary = generate_all_data(
+                num_products=scale["num_products"],
+                days=scale["days"],
+                output_dir=data_dir,
+                random_seed=seed,
+                store_cities=scaled_store_cities(scale["store_multiplier"]),
+            )
+            span["rows"] = summary["sales_records"]
+
+        analyzer = InventoryAnalyzer()
+        analyzer.load_data(
+            sales_path=os.path.join(data_dir, "sales_data.csv"),
+            inventory_path=os.path.join(data_dir, "inventory_data.csv"),
+            stores_path=os.path.join(data_dir, "stores.csv"),
+            products_path=os.path.join(data_dir, "products.csv"),
+        )
+
+        with profiler.stage("analyze_sales_data", rows=len(analyzer.sales_df)):
+            analysis_df = analyzer.analyze_sales_data()
+
+        with profiler.stage("identify_inventory_imbalances", rows=len(analysis_df)):
+            excess_df, needed_df = analyzer.identify_inventory_imbalances()
+
+        optimizer = RuleBasedOptimizer()
+        optimizer.load_matrices(
+            distance_path=os.path.join(data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(data_dir, "transport_cost_matrix.csv"),
+        )
+
+        with profiler.stage("optimize", rows=len(needed_df)) as span:
+            transfer_plan = optimizer.optimize(excess_df, needed_df)
+            span["transfers"] = len(transfer_plan)
+
+        with profiler.stage("evaluate_plan_impact", rows=len(transfer_plan)):
+            impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
+
+        stores_df = pd.read_csv(os.path.join(data_dir, "stores.csv"))
+        products_df = pd.read_csv(os.path.join(data_dir, "products.csv"))
+
+        with profiler.stage("create_final_results", rows=len(transfer_plan)):
+            ResultsManager(results_dir).create_final_results(
+                {"Rule-based": (transfer_plan, impact_df)}, stores_df, products_df
+            )
+
+    stages = {}
+    for span in profiler.stages:
+        record = {
+            "wall_time_s": span["wall_time_s"],
+            "cpu_time_s": span["cpu_time_s"],
+            "tracemalloc_peak_mb": span["tracemalloc_peak_mb"],
+            "rows": span["rows"],
+            "rows_per_s": span.get("rows_per_s"),
+        }
+        if "transfers" in span:
+            record["transfers"] = span["transfers"]
+            record["transfers_per_s"] = (
+                span["transfers"] / span["wall_time_s"] if span["wall_time_s"] > 0 else None
+            )
+        stages[span["stage"]] = record
+
+    return {
+        "scale": scale,
+        "stores": summary["stores_created"],
+        "products": summary["products_created"],
+        "sales_records": summary["sales_records"],
+        "transfers": len(transfer_plan),
+        "stages": stages,
+        "peak_rss_mb": profiler.get_report()["totals"]["peak_rss_mb"],
+    }
+
+
+def run_benchmarks(scale_names, repeat=1, seed=BENCHMARK_SEED, verbose=False):
+    """
+    Run the benchmark suite for the selected scales.
+
+    When repeating, the fastest run of every stage is kept.
+
+    Args:
+        scale_names: Names of scales to run
+        repeat: Number of repetitions per scale
+        seed: Random seed used for data generation
+        verbose: Whether to show pipeline output
+
+    Returns:
+        Benchmark run dictionary
+    """
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "seed": seed,
+        "repeat": repeat,
+        "scales": {},
+    }
+
+    for scale_name in scale_names:
+        best = None
+        for i in range(repeat):
+            print(f"Running scale '{scale_name}' ({i + 1}/{repeat})...")
+            with tempfile.TemporaryDirectory(prefix=f"bench_{scale_name}_") as work_dir:
+                result = run_scale(scale_name, SCALES[scale_name], work_dir, seed, verbose)
+
+            if best is None:
+                best = result
+                continue
+            for stage, record in result["stages"].items():
+                if record["wall_time_s"] < best["stages"][stage]["wall_time_s"]:
+                    best["stages"][stage] = record
+
+        run["scales"][scale_name] = best
+        print_scale(scale_name, best)
+
+    return run
+
+
+def print_scale(scale_name, result):
+    """Print the per-stage results of one scale."""
+    print(
+        f"\n[{scale_name}] {result['stores']} stores, {result['products']} products, "
+        f"{result['sales_records']} sales records, {result['transfers']} transfers"
+    )
+    print(f"{'Stage':<32}{'Wall (s)':>10}{'Peak MB':>10}{'Rows/s':>14}{'Transfers/s':>14}")
+    for stage, record in result["stages"].items():
+        rows_per_s = f"{record['rows_per_s']:,.0f}" if record.get("rows_per_s") else "-"
+        transfers_per_s = (
+            f"{record['transfers_per_s']:,.0f}" if record.get("transfers_per_s") else "-"
+        )
+        print(
+            f"{stage:<32}{record['wall_time_s']:>10.3f}{record['tracemalloc_peak_mb']:>10.1f}"
+            f"{rows_per_s:>14}{transfers_per_s:>14}"
+        )
+
+
+def load_json(path, default=None):
+    if not Path(path).exists():
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def append_history(run, history_path=HISTORY_FILE):
+    """Append a benchmark run to the JSON history file."""
+    history = load_json(history_path, default=[])
+    history.append(run)
+    save_json(history_path, history)
+    print(f"\nAppended benchmark run to {history_path}")
+
+
+def compare_runs(baseline, current, tolerance=0.2, min_wall_time=0.05):
+    """
+    Compare a benchmark run against a baseline run.
+
+    A stage regresses when one of its compared metrics grows by more than
+    the tolerance. Stages faster than min_wall_time are only checked for memory,
+    since their timings are dominated by noise.
+
+    Args:
+        baseline: Baseline benchmark run
+        current: Current benchmark run
+        tolerance: Allowed relative increase (0.2 = 20%)
+        min_wall_time: Minimum baseline wall time for timing comparisons
+
+    Returns:
+        List of regression dictionaries
+    """
+    regressions = []
+
+    for scale_name, result in current["scales"].items():
+        base_result = baseline["scales"].get(scale_name)
+        if base_result is None:
+            continue
+
+        for stage, record in result["stages"].items():
+            base_record = base_result["stages"].get(stage)
+            if base_record is None:
+                continue
+
+            for metric in COMPARED_METRICS:
+                base_value = base_record.get(metric)
+                value = record.get(metric)
+                if not base_value or value is None:
+                    continue
+                if metric == "wall_time_s" and base_value < min_wall_time:
+                    continue
+
+                change = (value - base_value) / base_value
+                if change > tolerance:
+                    regressions.append(
+                        {
+                            "scale": scale_name,
+                            "stage": stage,
+                            "metric": metric,
+                            "baseline": base_value,
+                            "current": value,
+                            "change": change,
+                        }
+                    )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goods Allocation Optimizer benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run benchmarks and append to history")
+    baseline_parser = subparsers.add_parser(
+        "save-baseline", help="Run benchmarks and save them as the baseline"
+    )
+    compare_parser = subparsers.add_parser(
+        "compare", help="Run benchmarks and flag regressions against the baseline"
+    )
+
+    for sub in (run_parser, baseline_parser, compare_parser):
+        sub.add_argument(
+            "--scales",
+            nargs="+",
+            choices=list(SCALES),
+            default=["small", "medium"],
+            help="Dataset scales to run",
+        )
+        sub.add_argument("--repeat", type=int, default=1, help="Repetitions per scale")
+        sub.add_argument("--seed", type=int, default=BENCHMARK_SEED, help="Random seed")
+        sub.add_argument("--verbose", action="store_true", help="Show pipeline output")
+
+    compare_parser.add_argument(
+        "--baseline", type=str, default=str(BASELINE_FILE), help="Baseline JSON file"
+    )
+    compare_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative increase before flagging a regression",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        baseline = load_json(args.baseline)
+        if baseline is None:
+            print(f"Baseline {args.baseline} not found. Run save-baseline first.")
+            sys.exit(2)
+
+    run = run_benchmarks(args.scales, args.repeat, args.seed, args.verbose)
+    append_history(run)
+
+    if args.command == "save-baseline":
+        save_json(BASELINE_FILE, run)
+        print(f"Saved baseline to {BASELINE_FILE}")
+
+    elif args.command == "compare":
+        regressions = compare_runs(baseline, run, tolerance=args.tolerance)
+
+        print(f"\n=== COMPARISON AGAINST BASELINE ({baseline['timestamp']}) ===")
+        if not regressions:
+            print(f"No regressions beyond {args.tolerance:.0%} tolerance.")
+            return
+
+        for regression in regressions:
+            print(
+                f"REGRESSION [{regression['scale']}] {regression['stage']} "
+                f"{regression['metric']}: {regression['baseline']:.3f} -> "
+                f"{regression['current']:.3f} (+{regression['change']:.0%})"
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Long-running planning service with warm in-memory state.
+
+Loads the data once into the analyzer and optimizer structures and answers
+HTTP/JSON requests from a fixed worker pool:
+
+    GET  /health      Service status
+    GET  /metrics     Request counts and latency percentiles per endpoint
+    GET  /plan        Current transfer plan (?store_id=N for one store's receipts)
+    POST /optimize    Re-solve, optionally with other min_days / max_days
+    POST /evaluate    Evaluate a submitted plan with evaluate_plan_impact
+    POST /inventory   Apply stock corrections and re-solve affected products
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from config import SERVICE_LATENCY_WINDOW
+from engine.analyzer import InventoryAnalyzer
+from engine.incremental import IncrementalOptimizer
+from engine.rule_based import RuleBasedOptimizer
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def to_json_value(value):
+    """Convert numpy/pandas scalars so they can be serialized to JSON."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def frame_to_records(df):
+    if df is None or df.empty:
+        return []
+    return json.loads(df.to_json(orient="records"))
+
+
+class PlanningState:
+    def __init__(self, data_dir, min_days=None, max_days=None):
+        """
+        Warm analyzer and optimizer state shared by all requests.
+
+        Args:
+            data_dir: Directory containing the input data files
+            min_days: Shortage threshold (days of inventory)
+            max_days: Excess threshold (days of inventory)
+        """
+        self.data_dir = data_dir
+        self.lock = threading.RLock()
+
+        self.analyzer = InventoryAnalyzer()
+        self.analyzer.load_data(
+            sales_path=os.path.join(data_dir, "sales_data.csv"),
+            inventory_path=os.path.join(data_dir, "inventory_data.csv"),
+            stores_path=os.path.join(data_dir, "stores.csv"),
+            products_path=os.path.join(data_dir, "products.csv"),
+        )
+        self.analyzer.analyze_sales_data()
+        excess_df, needed_df = self.analyzer.identify_inventory_imbalances(
+            min_days=min_days, max_days=max_days
+        )
+
+        self.optimizer = RuleBasedOptimizer()
+        self.optimizer.load_matrices(
+            distance_path=os.path.join(data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(data_dir, "transport_cost_matrix.csv"),
+        )
+
+        self.incremental = IncrementalOptimizer(
+            self.analyzer, self.optimizer, min_days=min_days, max_days=max_days
+        )
+        self.incremental.initialize(excess_df, needed_df)
+
+        self.store_names = self.analyzer.stores.set_index("store_id")["store_name"].to_dict()
+        self.product_names = self.analyzer.products.set_index("product_id")[
+            "product_name"
+        ].to_dict()
+
+    def _with_names(self, transfer_plan):
+        plan = transfer_plan.copy()
+        if not plan.empty:
+            plan["from_store"] = plan["from_store_id"].map(self.store_names)
+            plan["to_store"] = plan["to_store_id"].map(self.store_names)
+            plan["product"] = plan["product_id"].map(self.product_names)
+        return plan
+
+    def get_plan(self, store_id=None):
+        with self.lock:
+            plan = self.incremental.transfer_plan
+        if store_id is not None and not plan.empty:
+            plan = plan[plan["to_store_id"] == store_id]
+        return self._with_names(plan)
+
+    def optimize(self, min_days=None, max_days=None):
+        """
+        Re-solve the plan. Uses the warm plan when thresholds are unchanged.
+        """
+        with self.lock:
+            same_thresholds = (min_days is None or min_days == self.incremental.min_days) and (
+                max_days is None or max_days == self.incremental.max_days
+            )
+            if same_thresholds:
+                return self._with_names(self.incremental.transfer_plan)
+
+            excess_df, needed_df = self.analyzer.split_imbalances(
+                self.analyzer.analysis_df,
+                self.incremental.min_days if min_days is None else min_days,
+                self.incremental.max_days if max_days is None else max_days,
+            )
+            return self._with_names(self.optimizer.optimize(excess_df, needed_df))
+
+    def evaluate(self, transfer_plan):
+        with self.lock:
+            impact_df, _ = self.analyzer.evaluate_plan_impact(transfer_plan)
+        return impact_df
+
+    def update_inventory(self, inventory_delta):
+        with self.lock:
+            self.incremental.apply_delta(inventory_delta)
+            return self._with_names(self.incremental.transfer_plan)
+
+
+class LatencyTracker:
+    def __init__(self, window=SERVICE_LATENCY_WINDOW):
+        """
+        Args:
+            window: Number of most recent requests kept per endpoint
+        """
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, failed=False):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.counts[endpoint] += 1
+            if failed:
+                self.errors[endpoint] += 1
+
+    def summary(self):
+        with self.lock:
+            snapshot = {endpoint: list(values) for endpoint, values in self.latencies.items()}
+            counts = dict(self.counts)
+            errors = dict(self.errors)
+
+        metrics = {}
+        for endpoint, values in snapshot.items():
+            p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+            metrics[endpoint] = {
+                "requests": counts[endpoint],
+                "errors": errors.get(endpoint, 0),
+                "p50_ms": p50,
+                "p90_ms": p90,
+                "p99_ms": p99,
+                "max_ms": max(values) * 1000,
+            }
+        return metrics
+
+
+class PlanningRequestHandler(BaseHTTPRequestHandler):
+    server_version = "GoodsAllocationPlanner/1.0"
+
+    def log_message(self, format, *args):
+        # Latency is tracked in /metrics; keep the console quiet
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as e:
+            raise ServiceError(400, f"Invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise ServiceError(400, "Request body must be a JSON object")
+        return body
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=to_json_value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        endpoint = f"{method} {url.path}"
+        routes = {
+            "GET /health": self._health,
+            "GET /metrics": self._metrics,
+            "GET /plan": self._plan,
+            "POST /optimize": self._optimize,
+            "POST /evaluate": self._evaluate,
+            "POST /inventory": self._inventory,
+        }
+
+        start_time = perf_counter()
+        failed = False
+        try:
+            handler = routes.get(endpoint)
+            if handler is None:
+                raise ServiceError(404, f"Unknown endpoint {endpoint}")
+            status, payload = handler(parse_qs(url.query))
+        except ServiceError as e:
+            failed = True
+            status, payload = e.status, {"error": e.message}
+        except (KeyError, ValueError) as e:
+            failed = True
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:  # noqa: BLE001 - report to the client instead of dropping
+            failed = True
+            status, payload = 500, {"error": str(e)}
+
+        self._send_json(status, payload)
+        self.server.latency.record(endpoint, perf_counter() - start_time, failed)
+
+    def _health(self, query):
+        state = self.server.state
+        return 200, {
+            "status": "ok",
+            "data_dir": state.data_dir,
+            "analysis_rows": len(state.analyzer.analysis_df),
+            "transfers": len(state.incremental.transfer_plan),
+            "workers": self.server.workers,
+        }
+
+    def _metrics(self, query):
+        return 200, {"endpoints": self.server.latency.summary()}
+
+    def _plan(self, query):
+        store_id = int(query["store_id"][0]) if "store_id" in query else None
+        plan = self.server.state.get_plan(store_id)
+        return 200, {"transfers": frame_to_records(plan)}
+
+    def _optimize(self, query):
+        body = self._read_json()
+        thresholds = {}
+        for field in ("min_days", "max_days"):
+            value = body.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+                raise ServiceError(400, f"'{field}' must be a positive number")
+            thresholds[field] = value
+        incremental = self.server.state.incremental
+        min_days = thresholds.get("min_days", incremental.min_days)
+        max_days = thresholds.get("max_days", incremental.max_days)
+        if not min_days < max_days:
+            raise ServiceError(400, f"'min_days' ({min_days}) must be less than 'max_days' ({max_days})")
+        if body.get("store_id") is not None and (
+            isinstance(body["store_id"], bool) or not isinstance(body["store_id"], int)
+        ):
+            raise ServiceError(400, "'store_id' must be an integer")
+        plan = self.server.state.optimize(thresholds.get("min_days"), thresholds.get("max_days"))
+        if body.get("store_id") is not None and not plan.empty:
+            plan = plan[plan["to_store_id"] == int(body["store_id"])]
+        return 200, {
+            "transfers": frame_to_records(plan),
+            "total_units": int(plan["units"].sum()) if not plan.empty else 0,
+            "total_transport_cost": float(plan["transport_cost"].sum()) if not plan.empty else 0,
+        }
+
+    def _evaluate(self, query):
+        body = self._read_json()
+        transfers = body.get("transfers")
+        if not transfers:
+            raise ServiceError(400, "Request body must contain a non-empty 'transfers' list")
+        impact_df = self.server.state.evaluate(pd.DataFrame(transfers))
+        impact = json.loads(impact_df.to_json(orient="columns")) if impact_df is not None else {}
+        return 200, {"impact": impact}
+
+    def _inventory(self, query):
+        body = self._read_json()
+        updates = body.get("updates")
+        if not updates:
+            raise ServiceError(400, "Request body must contain a non-empty 'updates' list")
+        inventory_delta = pd.DataFrame(updates)
+        missing = {"store_id", "product_id", "current_stock"} - set(inventory_delta.columns)
+        if missing:
+            raise ServiceError(400, f"Updates are missing fields: {', '.join(sorted(missing))}")
+        for field in ("store_id", "product_id"):
+            if not all(isinstance(value, int) and not isinstance(value, bool) for value in inventory_delta[field]):
+                raise ServiceError(400, f"'{field}' must be an integer in every update")
+        try:
+            stock = pd.to_numeric(inventory_delta["current_stock"], errors="raise")
+        except (TypeError, ValueError):
+            raise ServiceError(400, "'current_stock' must be a number in every update")
+        if stock.isna().any() or (stock < 0).any():
+            raise ServiceError(400, "'current_stock' must be a non-negative number in every update")
+        inventory_delta["current_stock"] = stock
+
+        unknown_stores = sorted(set(inventory_delta["store_id"]) - set(self.server.state.store_names))
+        if unknown_stores:
+            raise ServiceError(400, f"Unknown store_id: {', '.join(map(str, unknown_stores))}")
+        unknown_products = sorted(set(inventory_delta["product_id"]) - set(self.server.state.product_names))
+        if unknown_products:
+            raise ServiceError(400, f"Unknown product_id: {', '.join(map(str, unknown_products))}")
+        plan = self.server.state.update_inventory(inventory_delta)
+        return 200, {"updated_rows": len(inventory_delta), "transfers": len(plan)}
+
+
+class PlanningServer(HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state, workers=4):
+        """
+        HTTP server dispatching requests to a fixed worker pool.
+
+        Args:
+            address: (host, port) tuple
+            state: PlanningState shared by all workers
+            workers: Number of worker threads
+        """
+        super().__init__(address, PlanningRequestHandler)
+        self.state = state
+        self.workers = workers
+        self.latency = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="planner")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def run_service(data_dir, host, port, workers=4, min_days=None, max_days=None):
+    """
+    Load the data once and serve planning requests until interrupted.
+
+    Args:
+        data_dir: Directory containing the input data files
+        host: Interface to bind to
+        port: Port to listen on
+        workers: Number of worker threads
+        min_days: Shortage threshold (days of inventory)
+        max_days: Excess threshold (days of inventory)
+    """
+    print("\n=== PLANNING SERVICE ===")
+    start_time = perf_counter()
+    state = PlanningState(data_dir, min_days=min_days, max_days=max_days)
+    print(f"Loaded planning state in {perf_counter() - start_time:.2f} seconds.")
+
+    server = PlanningServer((host, port), state, workers=workers)
+    print(f"Serving on http://{host}:{port} with {workers} workers (Ctrl+C to stop)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down planning service...")
+    finally:
+        server.server_close()
@@ -8,6 +8,7 @@ DATA_DIR = "data"
 RESULTS_DIR = "results"
 VISUALIZATIONS_DIR = "visualizations"
 LOGS_DIR = "logs"
+CACHE_DIR = "cache"
 
 REQUIRED_DATA_FILES = [
     "sales_data.csv",
@@ -55,6 +56,105 @@ NEEDED_WEIGHT = 0.3
 MAX_TRANSFER_DISTANCE_KM = 500
 BASE_TRANSPORT_COST_PER_KM = 100
 
+# Transport cost model (VND per unit per km); short lanes carry fixed costs,
+# long lanes get economies of scale: {distance below km: factor}
+TRANSPORT_COST_PER_KM = 2_000
+INTERCITY_COST_FACTOR = 1.2
+DISTANCE_COST_FACTORS = {100: 1.2, 500: 1.0, 9999: 0.5}
+
+# Offline road network (road_nodes.csv / road_edges.csv) and its route cache
+ROAD_NODES_FILE = "road_nodes.csv"
+ROAD_EDGES_FILE = "road_edges.csv"
+ROUTE_CACHE_FILE = "route_cache.npz"
+ROAD_DIJKSTRA_CHUNK = 64
+
+# Sparse k-nearest lane matrix (replaces the dense matrices for large networks)
+SPARSE_LANES_FILE = "transport_cost_sparse.npz"
+SPARSE_NEIGHBORS_K = 50
+
+# Hub-and-spoke transshipment (--hubs): warehouses as hub nodes. Hub-to-hub
+# linehaul costs HUB_LINEHAUL_FACTOR of a direct lane per km and each unit
+# leaving a hub pays its handling cost (VND); graphs above HUB_FLOYD_MAX_NODES
+# nodes use Dijkstra in chunks of HUB_DIJKSTRA_CHUNK source stores
+WAREHOUSES_FILE = "warehouses.csv"
+HUB_HANDLING_COST = 20_000
+HUB_LINEHAUL_FACTOR = 0.4
+HUB_FLOYD_MAX_NODES = 3000
+HUB_DIJKSTRA_CHUNK = 64
+
+# Spatial index: nearest donors queried per need (doubled until the need is met)
+SPATIAL_INDEX_K = 8
+
+# Demand forecasting (--forecast)
+FORECAST_ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+FORECAST_HOLDOUT_DAYS = 14
+FORECAST_HORIZON_DAYS = 14
+FORECAST_BATCH_SERIES = 250_000
+
+# Dynamic safety stock (--service-level): thresholds are shifted per row by
+# z(service level) * demand CV * sqrt(lead time) days, capped at SAFETY_STOCK_MAX_DAYS
+SAFETY_STOCK_LEAD_TIME_DAYS = 2
+SAFETY_STOCK_MAX_DAYS = 14
+
+# Stochastic optimizer: sampled demand scenarios over a horizon, need/excess
+# split into lots, scenario tensor processed in blocks of at most STOCHASTIC_BLOCK_MB
+STOCHASTIC_SCENARIOS = 200
+STOCHASTIC_HORIZON_DAYS = 7
+STOCHASTIC_LOTS = 4
+STOCHASTIC_BLOCK_MB = 256
+# Lost margin per unit short when products.csv has no price/cost
+STOCHASTIC_STOCKOUT_COST = 100_000
+
+# Shipment consolidation: fixed cost (VND) per truck trip on a lane, units per
+# truck and nearest donor stores considered per receiver
+CONSOLIDATION_TRIP_COST = 500_000
+CONSOLIDATION_TRUCK_CAPACITY = 500
+CONSOLIDATION_CANDIDATES = 64
+
+# Budget-constrained optimizer: weekly transport budget (VND), cheapest donors
+# per receiver and product in the candidate graph, subgradient iterations and
+# relative duality gap at which to stop
+TRANSPORT_BUDGET = 150_000_000
+BUDGET_CANDIDATES = 16
+BUDGET_MAX_ITERATIONS = 30
+BUDGET_GAP_TOLERANCE = 0.005
+
+# Pareto mode (--pareto): cost weights solved for the cost-vs-balance front
+PARETO_POINTS = 20
+
+# Route building (--routes): units per vehicle and nearest stops each stop may
+# be joined to by the savings heuristic
+ROUTING_VEHICLE_CAPACITY = 500
+ROUTING_NEIGHBORS = 40
+
+# Rolling-horizon planner: days planned ahead, transfer lead time, days simulated
+ROLLING_HORIZON_DAYS = 7
+ROLLING_LEAD_TIME_DAYS = 1
+ROLLING_SIMULATION_DAYS = 14
+
+# Backtesting: trailing sales window and transfer lead time
+BACKTEST_REVIEW_DAYS = 7
+BACKTEST_LEAD_TIME_DAYS = 2
+BACKTEST_SALES_WINDOW_DAYS = 28
+
+# Anytime optimizer: wall-clock budget (seconds) for seed + local search
+ANYTIME_TIME_BUDGET_S = 30
+
+# Local search: nearest cheaper donors examined per lane for swap moves
+LOCAL_SEARCH_MAX_CANDIDATES = 10
+
+# Per-engine time budget (seconds) when running all engines concurrently
+ENGINE_TIME_BUDGET_S = 600
+
+# Plan cache settings
+PLAN_CACHE_MAX_MB = 512
+
+# Planning service settings
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_WORKERS = 4
+SERVICE_LATENCY_WINDOW = 10_000
+
 
 def create_directories(base_path: Optional[Path] = None) -> Dict:
     if base_path is None:
@@ -6,8 +6,9 @@ import os
 from time import time
 
 import pandas as pd
-from config import DATA_DIR, EXCESS_PERCENT, MAX_INVENTORY_DAYS, MIN_INVENTORY_DAYS, NUM_PRODUCTS, RANDOM_SEED, SHORTAGE_PERCENT, SALE_DAYS
+from config import ROUTE_CACHE_FILE, SPARSE_LANES_FILE, WAREHOUSES_FILE, DATA_DIR, EXCESS_PERCENT, MAX_INVENTORY_DAYS, MIN_INVENTORY_DAYS, NUM_PRODUCTS, RANDOM_SEED, SHORTAGE_PERCENT, SALE_DAYS
 from data_generator.distance_calculator import DistanceCalculator
+from data_generator.road_network import RoadNetwork
 from data_generator.inventory_generator import InventoryGenerator
 from data_generator.product_generator import ProductGenerator
 from data_generator.sales_generator import SalesGenerator
@@ -24,11 +25,24 @@ def generate_all_data(
     max_days=None,
     excess_percent=None,
     shortage_percent=None,
+    store_cities=None,
+    sparse_k=None,
+    road_network_dir=None,
 ):
     """
     Generate all required data for the inventory optimization system.
     Uses config defaults if parameters are not provided.
+
+    store_cities optionally overrides STORE_CITIES to generate larger networks.
+    sparse_k writes a sparse k-nearest lane matrix instead of the dense matrices.
+    road_network_dir computes road distances from a local road graph (offline).
     """
+    if sparse_k and road_network_dir:
+        # The sparse lanes are k-nearest by straight-line distance; road distances are dense only
+        raise ValueError(
+            "sparse_k and road_network_dir cannot be combined: the sparse lane matrix "
+            "is built from haversine distances. Generate dense road-distance matrices instead."
+        )
     
     num_products = num_products or NUM_PRODUCTS
     days = days or SALE_DAYS
@@ -41,7 +55,7 @@ def generate_all_data(
     
     logger_system = get_optimization_logger()
     
-    start_time = time.time()
+    start_time = time()
     parameters = {
         "num_products": num_products,
         "days": days,
@@ -51,13 +65,16 @@ def generate_all_data(
         "max_days": max_days,
         "excess_percent": excess_percent,
         "shortage_percent": shortage_percent,
+        "store_cities": list(store_cities) if store_cities else "default",
+        "sparse_k": sparse_k or "dense",
+        "road_network_dir": road_network_dir or "haversine",
     }
     
-    logger_system.info(f"data_generation", parameters)
+    logger_system.log_execution_start("data_generation", parameters)
     
     print(f"Generating all data with seed {random_seed}...")
     
-    os.make_dirs(output_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
     
     stores_path = os.path.join(output_dir, "stores.csv")
     products_path = os.path.join(output_dir, "products.csv")
@@ -68,10 +85,11 @@ def generate_all_data(
     
     print("\n1. Generating store data...")
     logger_system.log_progress("data_generation", "Step 1: Generating store data...")
-    store_gen = StoreGenerator(random_seed=random_seed)
+    store_gen = StoreGenerator(random_seed=random_seed, cities=store_cities)
     stores = store_gen.generate_stores(stores_path)
+    warehouses = store_gen.generate_warehouses(os.path.join(output_dir, WAREHOUSES_FILE))
     logger_system.log_progress(
-        "data_generation", f"Generated {len(stores)} stores successfully."
+        "data_generation", f"Generated {len(stores)} stores and {len(warehouses)} warehouses successfully."
     )
     
     print("\n2. Generating sales data...")
@@ -112,15 +130,33 @@ def generate_all_data(
     logger_system.log_progress(
         "data_generation", "Step 5: Generating distance and cost matrices..."
     )
-    distance_calc = DistanceCalculator(stores)
-    distance_matrix = distance_calc.generate_disstance_matrix(distance_path)
-    cost_matrix = distance_calc.generate_transport_cost_matrix(
-        distance_matrix, cost_path
-    )
-    logger_system.log_progress(
-        "data_generation",
-        f"Generated {len(distance_matrix)} x {len(distance_matrix.columns)} distance and cost matrices",
+    distance_calc = DistanceCalculator(
+        stores,
+        road_network=RoadNetwork.from_dir(road_network_dir) if road_network_dir else None,
+        route_cache_path=os.path.join(output_dir, ROUTE_CACHE_FILE),
     )
+    if sparse_k:
+        sparse_lanes = distance_calc.generate_sparse_cost_matrix(
+            sparse_k, os.path.join(output_dir, SPARSE_LANES_FILE)
+        )
+        logger_system.log_progress(
+            "data_generation",
+            f"Generated sparse lane matrix: {len(sparse_lanes.neighbors)} lanes for {len(sparse_lanes.store_ids)} stores",
+        )
+        # Dense matrices from an earlier run would describe other stores and take precedence
+        for stale_path in (distance_path, cost_path):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+                print(f"Removed stale dense matrix {stale_path}")
+    else:
+        distance_matrix = distance_calc.generate_disstance_matrix(distance_path)
+        cost_matrix = distance_calc.generate_transport_cost_matrix(
+            distance_matrix, cost_path
+        )
+        logger_system.log_progress(
+            "data_generation",
+            f"Generated {len(distance_matrix)} x {len(distance_matrix.columns)} distance and cost matrices",
+        )
     
     print("\nData generation complete!")
     print(f"All files saved to directory: {output_dir}")
@@ -200,7 +236,7 @@ def generate_all_data(
         logger_system.log_progress("data_generation", success_msg)
         logger_system.log_progress("data_generation", "Ready for optimization!")
 
-    execution_time = time.time() - start_time
+    execution_time = time() - start_time
     results = {
         "stores_created": len(stores),
         "products_created": len(products),
@@ -214,3 +250,5 @@ def generate_all_data(
     }
 
     logger_system.log_execution_end("data_generation", execution_time, results)
+
+    return results
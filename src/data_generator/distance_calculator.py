@@ -1,18 +1,26 @@
 import pandas as pd
-import numpy as np
+
+from config import SPARSE_NEIGHBORS_K
+from utils.geo import haversine_km, transport_cost_per_unit
+from data_generator.road_network import RoadDistanceEngine
+from utils.sparse_lanes import SparseLaneMatrix
 
 class DistanceCalculator:
-    def __init__(self, stores, use_google_maps=False, api_key=None):
+    def __init__(self, stores, use_google_maps=False, api_key=None, road_network=None, route_cache_path=None):
         """
         Initialize with store data and calculation method.
         Args:
             stores (list): List of store data.
             use_google_maps (bool): Whether to use Google Maps API for distance calculation.
             api_key (str, optional): Google Maps API key if use_google_maps is True.
+            road_network (RoadNetwork, optional): Offline road graph; takes precedence over Google Maps.
+            route_cache_path (str, optional): Route cache file used with road_network.
         """
         self.stores = stores
         self.use_google_maps = use_google_maps
         self.api_key = api_key
+        self.road_network = road_network
+        self.route_cache_path = route_cache_path
         
         if isinstance(stores, pd.DataFrame):
             self.store_data = stores
@@ -35,14 +43,7 @@ class DistanceCalculator:
         Calculate the great circle distance between 2 points 
         on the earth (specified in decimal degrees).
         """
-        lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-        
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
-        c = 2 * np.arcsin(np.sqrt(a))
-        r = 6371 # Earth radius in kilometers
-        return c * r
+        return haversine_km(lat1, lon1, lat2, lon2)
     
     def generate_disstance_matrix(self, output_path=None):
         """
@@ -56,6 +57,17 @@ class DistanceCalculator:
         """
         print('Generating distance matrix...')
         
+        if self.road_network is not None:
+            distance_matrix = RoadDistanceEngine(
+                self.road_network, self.route_cache_path
+            ).distance_matrix(self.store_data)
+            print("Used offline road network for distance calculations")
+            
+            if output_path:
+                distance_matrix.to_csv(output_path)
+                print(f"Saved distance matrix to {output_path}")
+            return distance_matrix
+        
         num_stores = len(self.store_data)
         store_ids = self.store_data["store_id"].tolist()
         
@@ -147,7 +159,7 @@ class DistanceCalculator:
         print("Generating transport cost matrix...")
 
         if distance_matrix is None:
-            distance_matrix = self.generate_distance_matrix()
+            distance_matrix = self.generate_disstance_matrix()
 
         transport_cost_matrix = pd.DataFrame(
             index=distance_matrix.index, columns=distance_matrix.columns
@@ -155,40 +167,15 @@ class DistanceCalculator:
 
         store_city_map = self.store_data.set_index("store_id")["city"].to_dict()
 
-        base_cost = 2_000  # Base cost per km in VND
-        intercity_factor = 1.2  # 50% more expensive between cities
-
-        # Distance factors (shorter distances are less efficient due to fixed costs)
-        distance_factors = {
-            100: 1.2,  # < 100 km: 20% more expensive per km
-            500: 1.0,  # 50-500 km: standard rate
-            9999: 0.5,  # > 500 km: 50% less expensive per km (economies of scale)
-        }
-
-        # Calculate transport costs
+        # Calculate transport costs (see utils.geo for the cost model)
         for from_id in transport_cost_matrix.index:
             for to_id in transport_cost_matrix.columns:
                 if from_id != to_id:
                     distance = distance_matrix.loc[from_id, to_id]
-
-                    # Determine city factor
-                    from_city = store_city_map[from_id]
-                    to_city = store_city_map[to_id]
-                    city_factor = intercity_factor if from_city != to_city else 1.0
-
-                    # Determine distance factor
-                    distance_factor = None
-                    for threshold, factor in sorted(distance_factors.items()):
-                        if distance < threshold:
-                            distance_factor = factor
-                            break
-
-                    if distance_factor is None:
-                        distance_factor = list(distance_factors.values())[-1]
-
-                    # Calculate cost
-                    cost = base_cost * distance * city_factor * distance_factor
-                    transport_cost_matrix.loc[from_id, to_id] = cost
+                    same_city = store_city_map[from_id] == store_city_map[to_id]
+                    transport_cost_matrix.loc[from_id, to_id] = transport_cost_per_unit(
+                        distance, same_city
+                    )
 
         if output_path:
             transport_cost_matrix.index = transport_cost_matrix.index.astype(int)
@@ -196,4 +183,29 @@ class DistanceCalculator:
             transport_cost_matrix.to_csv(output_path)
             print(f"Saved transport cost matrix to {output_path}")
 
-        return transport_cost_matrix
\ No newline at end of file
+        return transport_cost_matrix
+
+    def generate_sparse_cost_matrix(self, k=SPARSE_NEIGHBORS_K, output_path=None):
+        """
+        Generate a sparse k-nearest-neighbour distance and cost representation.
+        Only the k nearest lanes of every store are kept, so size is O(n * k)
+        instead of O(n^2).
+
+        Args:
+            k: Neighbours kept per store
+            output_path: Optional path to save the matrix as a binary .npz file
+
+        Returns:
+            SparseLaneMatrix
+        """
+        print(f"Generating sparse {k}-nearest lane matrix...")
+
+        sparse_lanes = SparseLaneMatrix.from_stores(self.store_data, k)
+
+        if output_path:
+            sparse_lanes.save(output_path)
+            print(
+                f"Saved sparse lane matrix ({sparse_lanes.nbytes / 1024 / 1024:.1f} MB) to {output_path}"
+            )
+
+        return sparse_lanes
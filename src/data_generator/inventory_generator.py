@@ -3,7 +3,7 @@ import datetime as dt
 import numpy as np
 import pandas as pd
 
-from src.config import (
+from config import (
     EXCESS_PERCENT,
     MAX_INVENTORY_DAYS,
     MIN_INVENTORY_DAYS,
@@ -0,0 +1,302 @@
+"""
+Incremental distance/cost matrix updates.
+
+When stores are added, removed or relocated only their rows and columns of the
+distance and cost matrices change, so instead of regenerating the O(n²)
+matrices the affected cells are recomputed (O(n) per changed store) with the
+haversine/cost model of DistanceCalculator. Both storage formats are
+supported: the dense CSV matrices and the sparse k-nearest lane file.
+
+Dense matrices built from road distances are not haversine: they are updated
+through RoadDistanceEngine, whose route cache limits the work to the new
+stores, and refused when the road network is not given.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import ROUTE_CACHE_FILE, SPARSE_LANES_FILE
+from data_generator.road_network import RoadDistanceEngine, RoadNetwork
+from utils.geo import haversine_km, transport_cost_per_unit
+from utils.sparse_lanes import SparseLaneMatrix, nearest_lanes
+
+
+def diff_stores(old_stores, new_stores):
+    """
+    Compare two versions of stores.csv.
+
+    Args:
+        old_stores: Stores the current matrices were built from
+        new_stores: Updated stores
+
+    Returns:
+        Tuple of (added, removed, moved) store id lists
+    """
+    old = old_stores.set_index("store_id")
+    new = new_stores.set_index("store_id")
+
+    added = [int(s) for s in new.index.difference(old.index)]
+    removed = [int(s) for s in old.index.difference(new.index)]
+
+    common = new.index.intersection(old.index)
+    columns = ["latitude", "longitude", "city"]
+    changed = (old.loc[common, columns] != new.loc[common, columns]).any(axis=1)
+    moved = [int(s) for s in common[changed.to_numpy()]]
+
+    return added, removed, moved
+
+
+class MatrixUpdater:
+    def __init__(self, stores, road_network_dir=None):
+        """
+        Args:
+            stores: Updated stores DataFrame (store_id, city, latitude, longitude)
+            road_network_dir: Road graph the dense matrices were built from (None = haversine)
+        """
+        self.stores = stores.reset_index(drop=True)
+        self.road_network_dir = road_network_dir
+        self.store_ids = self.stores["store_id"].astype(int).to_numpy()
+        self.latitudes = self.stores["latitude"].to_numpy(dtype=np.float64)
+        self.longitudes = self.stores["longitude"].to_numpy(dtype=np.float64)
+        self.cities = self.stores["city"].astype(str).to_numpy()
+        self.positions = {store_id: i for i, store_id in enumerate(self.store_ids)}
+
+    def lanes(self, store_ids):
+        """
+        Distances and costs per unit from some stores to every store.
+
+        Returns:
+            Tuple of (distances, costs), each (len(store_ids) x number of stores)
+        """
+        rows = np.array([self.positions[s] for s in store_ids], dtype=np.int64)
+        distances = haversine_km(
+            self.latitudes[rows, None], self.longitudes[rows, None],
+            self.latitudes[None, :], self.longitudes[None, :],
+        )
+        costs = transport_cost_per_unit(distances, self.cities[rows, None] == self.cities[None, :])
+        return np.atleast_2d(distances), np.atleast_2d(costs)
+
+    def matches_haversine(self, distance_matrix, unchanged, sample=5):
+        """
+        Whether a dense distance matrix follows the haversine model, checked on
+        the rows of a few stores whose location did not change.
+
+        Args:
+            distance_matrix: Distance matrix DataFrame (store ids on both axes)
+            unchanged: Ids of stores present before and after the update, not moved
+            sample: Number of rows checked
+
+        Returns:
+            False if any checked distance differs from haversine (road or Google Maps distances)
+        """
+        if len(unchanged) < 2:
+            return True
+        rows = list(unchanged)[:sample]
+        distances, _ = self.lanes(rows)
+        columns = np.array([self.positions[s] for s in unchanged], dtype=np.int64)
+        stored = distance_matrix.loc[rows, list(unchanged)].to_numpy(dtype=np.float64)
+        return bool(np.allclose(stored, distances[:, columns], rtol=1e-6, atol=1e-6))
+
+    def update_road_dense(self, data_dir):
+        """
+        Recompute the dense matrices from road distances. Routes between stores
+        already in the route cache are reused, so only the changed stores'
+        shortest paths are computed.
+
+        Returns:
+            Tuple of (distance_matrix, cost_matrix)
+        """
+        network = RoadNetwork.from_dir(self.road_network_dir)
+        distance_matrix = RoadDistanceEngine(
+            network, os.path.join(data_dir, ROUTE_CACHE_FILE)
+        ).distance_matrix(self.stores)
+        distance_matrix = distance_matrix.reindex(index=self.store_ids, columns=self.store_ids)
+
+        distances = distance_matrix.to_numpy(dtype=np.float64)
+        costs = transport_cost_per_unit(distances, self.cities[:, None] == self.cities[None, :])
+        np.fill_diagonal(costs, np.nan)
+        cost_matrix = pd.DataFrame(costs, index=self.store_ids, columns=self.store_ids)
+        return distance_matrix, cost_matrix
+
+    def update_dense(self, distance_matrix, cost_matrix, added=(), removed=(), moved=()):
+        """
+        Update dense matrices. If stores were only moved, the given DataFrames
+        are modified in place; otherwise they are reindexed to the new stores.
+
+        Args:
+            distance_matrix: Distance matrix DataFrame (store ids on both axes)
+            cost_matrix: Transport cost matrix DataFrame
+            added: Ids of new stores
+            removed: Ids of closed stores
+            moved: Ids of relocated stores
+
+        Returns:
+            Tuple of (distance_matrix, cost_matrix)
+        """
+        changed = list(added) + list(moved)
+
+        if added or removed:
+            ids = self.store_ids.tolist()
+            distance_matrix = distance_matrix.reindex(index=ids, columns=ids)
+            cost_matrix = cost_matrix.reindex(index=ids, columns=ids)
+
+        if changed:
+            distances, costs = self.lanes(changed)
+            for matrix, values in ((distance_matrix, distances), (cost_matrix, costs)):
+                frame = pd.DataFrame(values, index=changed, columns=self.store_ids)
+                matrix.loc[changed, self.store_ids] = frame
+                matrix.loc[self.store_ids, changed] = frame.T
+
+            # Diagonal conventions of DistanceCalculator: 0 km, no cost
+            for store_id in changed:
+                distance_matrix.loc[store_id, store_id] = 0
+                cost_matrix.loc[store_id, store_id] = np.nan
+
+        return distance_matrix, cost_matrix
+
+    def update_sparse(self, sparse_lanes, added=(), removed=(), moved=()):
+        """
+        Update a sparse k-nearest lane matrix. Besides the changed stores, a row
+        is recomputed if it referenced a removed/moved store or if a new or
+        moved store is now closer than its current k-th neighbour.
+
+        Args:
+            sparse_lanes: SparseLaneMatrix built on the old stores
+            added: Ids of new stores
+            removed: Ids of closed stores
+            moved: Ids of relocated stores
+
+        Returns:
+            Tuple of (updated SparseLaneMatrix, number of recomputed rows)
+        """
+        old_k = int(sparse_lanes.indptr[1] - sparse_lanes.indptr[0]) if len(sparse_lanes.store_ids) else 0
+        k = min(old_k, len(self.store_ids) - 1)
+        changed = set(added) | set(moved)
+        stale = set(removed) | set(moved)
+
+        old_neighbors = sparse_lanes.neighbors.reshape(-1, old_k) if old_k else None
+        old_distances = sparse_lanes.distances.reshape(-1, old_k) if old_k else None
+        old_costs = sparse_lanes.costs.reshape(-1, old_k) if old_k else None
+        stale_positions = np.array(
+            [sparse_lanes.positions[s] for s in stale if s in sparse_lanes], dtype=np.int64
+        )
+
+        neighbors = np.zeros((len(self.store_ids), k), dtype=np.int64)
+        distances = np.zeros((len(self.store_ids), k))
+        costs = np.zeros((len(self.store_ids), k))
+
+        recompute = np.zeros(len(self.store_ids), dtype=bool)
+        kept = []
+        for i, store_id in enumerate(self.store_ids):
+            if store_id in changed or store_id not in sparse_lanes or k != old_k:
+                recompute[i] = True
+            else:
+                kept.append(i)
+        kept = np.array(kept, dtype=np.int64)
+
+        if len(kept):
+            old_rows = np.array([sparse_lanes.positions[s] for s in self.store_ids[kept]], dtype=np.int64)
+            # Rows pointing at a store that closed or moved
+            recompute[kept[np.isin(old_neighbors[old_rows], stale_positions).any(axis=1)]] = True
+
+            # Rows where a new/moved store lands inside the k-nearest radius
+            if changed:
+                new_distances, _ = self.lanes(sorted(changed))
+                kth = old_distances[old_rows, -1]
+                recompute[kept[(new_distances[:, kept] < kth[None, :]).any(axis=0)]] = True
+
+            still_kept = ~recompute[kept]
+            rows, old_rows = kept[still_kept], old_rows[still_kept]
+            # Neighbour positions are re-addressed to the new store order
+            new_position = np.array(
+                [self.positions.get(int(s), -1) for s in sparse_lanes.store_ids], dtype=np.int64
+            )
+            neighbors[rows] = new_position[old_neighbors[old_rows]]
+            distances[rows] = old_distances[old_rows]
+            costs[rows] = old_costs[old_rows]
+
+        rows = np.flatnonzero(recompute)
+        if len(rows) and k > 0:
+            neighbors[rows], distances[rows], costs[rows] = nearest_lanes(
+                self.latitudes, self.longitudes, self.cities, k, rows
+            )
+
+        updated = SparseLaneMatrix(
+            self.store_ids,
+            self.latitudes,
+            self.longitudes,
+            self.cities,
+            np.arange(len(self.store_ids) + 1) * k,
+            neighbors.ravel(),
+            distances.ravel(),
+            costs.ravel(),
+        )
+        return updated, len(rows)
+
+    def update_data_dir(self, data_dir, old_stores=None):
+        """
+        Update the matrices stored in a data directory to the new stores and
+        write stores.csv. Dense CSV matrices are rewritten with only the
+        changed rows/columns recomputed; the sparse lane file is rewritten
+        with only the affected rows recomputed.
+
+        Args:
+            data_dir: Directory with stores.csv and the matrices
+            old_stores: Stores the matrices were built from (default: data_dir/stores.csv)
+
+        Returns:
+            Dictionary with the added, removed and moved store ids
+        """
+        stores_path = os.path.join(data_dir, "stores.csv")
+        if old_stores is None:
+            old_stores = pd.read_csv(stores_path)
+        added, removed, moved = diff_stores(old_stores, self.stores)
+        print(f"Store changes: {len(added)} added, {len(removed)} removed, {len(moved)} moved")
+
+        distance_path = os.path.join(data_dir, "distance_matrix.csv")
+        cost_path = os.path.join(data_dir, "transport_cost_matrix.csv")
+        sparse_path = os.path.join(data_dir, SPARSE_LANES_FILE)
+
+        if added or removed or moved:
+            if os.path.exists(distance_path) and os.path.exists(cost_path):
+                distance_matrix = pd.read_csv(distance_path, index_col=0)
+                cost_matrix = pd.read_csv(cost_path, index_col=0)
+                for matrix in (distance_matrix, cost_matrix):
+                    matrix.index = matrix.index.astype(int)
+                    matrix.columns = matrix.columns.astype(int)
+
+                unchanged = [
+                    s for s in self.store_ids.tolist()
+                    if s in distance_matrix.index and s not in set(added) | set(moved)
+                ]
+                if self.road_network_dir:
+                    distance_matrix, cost_matrix = self.update_road_dense(data_dir)
+                elif not self.matches_haversine(distance_matrix, unchanged):
+                    raise ValueError(
+                        f"{distance_path} does not follow the haversine model (built from a road "
+                        "network or Google Maps); recomputing only the changed stores with haversine "
+                        "would mix two distance models. Pass --road-network with the road graph the "
+                        "matrices were built from, or regenerate the data."
+                    )
+                else:
+                    distance_matrix, cost_matrix = self.update_dense(
+                        distance_matrix, cost_matrix, added, removed, moved
+                    )
+                distance_matrix.to_csv(distance_path)
+                cost_matrix.to_csv(cost_path)
+                print(
+                    f"Updated {len(added) + len(moved)} rows/columns of the "
+                    f"{len(distance_matrix)} x {len(distance_matrix)} dense matrices"
+                )
+
+            if os.path.exists(sparse_path):
+                sparse_lanes, recomputed = self.update_sparse(
+                    SparseLaneMatrix.load(sparse_path), added, removed, moved
+                )
+                sparse_lanes.save(sparse_path)
+                print(f"Updated sparse lane matrix: {recomputed} of {len(self.store_ids)} rows recomputed")
+
+        self.stores.to_csv(stores_path, index=False)
+        return {"added": added, "removed": removed, "moved": moved}
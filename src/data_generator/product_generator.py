@@ -305,8 +305,8 @@ class ProductGenerator:
             products_df = pd.DataFrame(
                 [
                     {
-                        "product_id": product.product_id,
-                        "product_name": product.product_name,
+                        "product_id": product.id,
+                        "product_name": product.name,
                         "category": product.category,
                         "price": product.price,
                         "cost": product.cost,
@@ -0,0 +1,290 @@
+"""
+Offline road-network distances.
+
+A local road graph (road_nodes.csv + road_edges.csv) is loaded into a CSR
+adjacency matrix. Every store is snapped to its nearest graph node, and
+store-to-store distances are the shortest road path between the snapped nodes
+plus the straight-line access legs to and from them. Shortest paths are
+computed with multi-source Dijkstra (scipy.sparse.csgraph), in chunks of
+sources spread across a process pool.
+
+Results are persisted in a route cache: an index of store coordinates plus a
+dense distance array, so adding a store only computes that store's row and
+column of the matrix, and cached rows and columns are sliced out as arrays.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from config import ROAD_DIJKSTRA_CHUNK, ROAD_EDGES_FILE, ROAD_NODES_FILE
+from utils.geo import haversine_km
+from utils.spatial_index import to_unit_vectors
+
+
+def shortest_paths(graph, sources, targets):
+    """
+    Shortest path lengths from each source node to each target node.
+
+    Args:
+        graph: CSR adjacency matrix of edge lengths (km)
+        sources: Source node positions
+        targets: Target node positions
+
+    Returns:
+        (sources x targets) array of km, inf where unreachable
+    """
+    return dijkstra(graph, directed=True, indices=sources)[:, targets]
+
+
+class RoadNetwork:
+    def __init__(self, nodes, edges):
+        """
+        Args:
+            nodes: DataFrame with node_id, latitude and longitude
+            edges: DataFrame with from_node, to_node and optionally length_km
+                (defaults to the straight-line length) and oneway (default False)
+        """
+        self.node_ids = nodes["node_id"].to_numpy()
+        self.latitudes = nodes["latitude"].to_numpy(dtype=np.float64)
+        self.longitudes = nodes["longitude"].to_numpy(dtype=np.float64)
+        positions = pd.Series(np.arange(len(nodes)), index=self.node_ids)
+
+        heads = positions.loc[edges["from_node"]].to_numpy()
+        tails = positions.loc[edges["to_node"]].to_numpy()
+        if "length_km" in edges.columns:
+            lengths = edges["length_km"].to_numpy(dtype=np.float64)
+        else:
+            lengths = haversine_km(
+                self.latitudes[heads], self.longitudes[heads],
+                self.latitudes[tails], self.longitudes[tails],
+            )
+        oneway = (
+            edges["oneway"].fillna(False).astype(bool).to_numpy()
+            if "oneway" in edges.columns
+            else np.zeros(len(edges), dtype=bool)
+        )
+
+        two_way = ~oneway
+        rows = np.concatenate([heads, tails[two_way]])
+        cols = np.concatenate([tails, heads[two_way]])
+        data = np.concatenate([lengths, lengths[two_way]])
+
+        # Parallel edges keep the shortest one; csr_matrix would sum them
+        order = np.lexsort((data, cols, rows))
+        rows, cols, data = rows[order], cols[order], data[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+
+        num_nodes = len(nodes)
+        self.graph = csr_matrix((data[first], (rows[first], cols[first])), shape=(num_nodes, num_nodes))
+        self.reverse_graph = self.graph.transpose().tocsr()
+        self.tree = cKDTree(to_unit_vectors(self.latitudes, self.longitudes))
+
+        digest = hashlib.sha256()
+        for array in (self.latitudes, self.longitudes, rows[first], cols[first], data[first]):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    @classmethod
+    def from_dir(cls, directory):
+        """Load road_nodes.csv and road_edges.csv from a directory."""
+        print(f"Loading road network from {directory}...")
+        return cls(
+            pd.read_csv(os.path.join(directory, ROAD_NODES_FILE)),
+            pd.read_csv(os.path.join(directory, ROAD_EDGES_FILE)),
+        )
+
+    def snap(self, latitudes, longitudes):
+        """
+        Snap points to their nearest graph node.
+
+        Returns:
+            Tuple of (node positions, access distance in km to the node)
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        _, nodes = self.tree.query(to_unit_vectors(latitudes, longitudes))
+        access_km = haversine_km(latitudes, longitudes, self.latitudes[nodes], self.longitudes[nodes])
+        return nodes, np.asarray(access_km)
+
+
+class RouteCache:
+    def __init__(self, path=None, fingerprint=None):
+        """
+        Road distances between store locations: an index of the cached
+        coordinates and a dense (locations x locations) array of km, NaN where
+        a pair was never computed.
+
+        Args:
+            path: .npz file the cache is loaded from and saved to (None = in memory only)
+            fingerprint: Road network fingerprint; a cache built on another network is discarded
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.coordinates = np.empty((0, 2))
+        self.distances = np.empty((0, 0))
+        self.index = {}
+        self.modified = False
+
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                if "coordinates" not in data or str(data["fingerprint"]) != fingerprint:
+                    print(f"Route cache {path} was built on another road network or format, ignoring it")
+                else:
+                    self.coordinates = data["coordinates"]
+                    self.distances = data["distances"]
+                    self.index = {tuple(c): i for i, c in enumerate(self.coordinates.tolist())}
+
+    @staticmethod
+    def keys(latitudes, longitudes):
+        """Cache keys (rounded coordinates) of points."""
+        return np.column_stack([np.round(latitudes, 6), np.round(longitudes, 6)])
+
+    def positions(self, keys):
+        """Cache position of every key, -1 where the location is not cached."""
+        return np.array([self.index.get(key, -1) for key in map(tuple, keys.tolist())], dtype=np.int64)
+
+    def block(self, keys):
+        """
+        Cached distances between the given locations.
+
+        Returns:
+            (keys x keys) array of km, NaN where not cached, 0 on the diagonal
+        """
+        positions = self.positions(keys)
+        distances = np.full((len(keys), len(keys)), np.nan)
+        cached = np.flatnonzero(positions >= 0)
+        distances[np.ix_(cached, cached)] = self.distances[np.ix_(positions[cached], positions[cached])]
+        np.fill_diagonal(distances, 0.0)
+        return distances
+
+    def put_block(self, keys, distances):
+        """Store the distances between the given locations, adding new locations."""
+        positions = self.positions(keys)
+        new_keys = list(dict.fromkeys(map(tuple, keys[positions < 0].tolist())))
+        if new_keys:
+            size = len(self.coordinates)
+            grown = np.full((size + len(new_keys),) * 2, np.nan)
+            grown[:size, :size] = self.distances
+            self.distances = grown
+            self.coordinates = np.vstack([self.coordinates, np.array(new_keys, dtype=np.float64)])
+            for offset, key in enumerate(new_keys):
+                self.index[key] = size + offset
+            positions = self.positions(keys)
+        self.distances[np.ix_(positions, positions)] = distances
+        self.modified = True
+
+    def save(self):
+        """Write the cache back to its file if anything was added."""
+        if not self.path or not self.modified:
+            return
+        np.savez(
+            self.path,
+            fingerprint=np.array(self.fingerprint),
+            coordinates=self.coordinates,
+            distances=self.distances,
+        )
+        self.modified = False
+        print(f"Saved routes between {len(self.coordinates)} locations to {self.path}")
+
+
+class RoadDistanceEngine:
+    def __init__(self, network, cache_path=None, max_workers=None, chunk_size=ROAD_DIJKSTRA_CHUNK):
+        """
+        Args:
+            network: RoadNetwork
+            cache_path: Route cache file (.npz); None keeps the cache in memory only
+            max_workers: Dijkstra worker processes (default: CPU count)
+            chunk_size: Source nodes per Dijkstra task
+        """
+        self.network = network
+        self.cache = RouteCache(cache_path, network.fingerprint)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+    def distance_matrix(self, stores):
+        """
+        Road distances between all stores.
+
+        Args:
+            stores: DataFrame with store_id, latitude and longitude
+
+        Returns:
+            DataFrame of km indexed by store_id on both axes
+        """
+        store_ids = stores["store_id"].astype(int).tolist()
+        latitudes = stores["latitude"].to_numpy(dtype=np.float64)
+        longitudes = stores["longitude"].to_numpy(dtype=np.float64)
+        keys = RouteCache.keys(latitudes, longitudes)
+        num_stores = len(store_ids)
+
+        distances = self.cache.block(keys)
+        missing = np.isnan(distances)
+
+        if missing.any():
+            nodes, access_km = self.network.snap(latitudes, longitudes)
+            paths = np.full((num_stores, num_stores), np.nan)
+
+            # Stores absent from the cache: their row forward, their column backward
+            new = np.flatnonzero(missing.sum(axis=1) >= num_stores - 1)
+            cached = np.setdiff1d(np.arange(num_stores), new)
+            print(
+                f"Road distances: {len(cached)} stores cached, "
+                f"computing routes for {len(new)} new stores"
+            )
+            if len(new):
+                paths[new, :] = self._paths(self.network.graph, nodes[new], nodes)
+            if len(new) and len(cached):
+                paths[cached[:, None], new] = self._paths(
+                    self.network.reverse_graph, nodes[new], nodes[cached]
+                ).T
+
+            # Any other gap (e.g. a cache written for another store set): recompute those rows
+            partial = np.flatnonzero((missing & np.isnan(paths)).any(axis=1))
+            if len(partial):
+                paths[partial, :] = self._paths(self.network.graph, nodes[partial], nodes)
+
+            paths += access_km[:, None] + access_km[None, :]
+            unreachable = missing & ~np.isfinite(paths)
+            if unreachable.any():
+                rows, cols = np.nonzero(unreachable)
+                paths[rows, cols] = haversine_km(
+                    latitudes[rows], longitudes[rows], latitudes[cols], longitudes[cols]
+                )
+                print(
+                    f"Road distances: {len(rows)} unreachable store pairs fall back to haversine"
+                )
+
+            distances[missing] = paths[missing]
+            self.cache.put_block(keys, distances)
+            self.cache.save()
+
+        return pd.DataFrame(distances, index=store_ids, columns=store_ids)
+
+    def _paths(self, graph, sources, targets):
+        """Shortest paths from every source to every target, in parallel chunks."""
+        unique_sources, inverse = np.unique(sources, return_inverse=True)
+        chunks = [
+            unique_sources[start:start + self.chunk_size]
+            for start in range(0, len(unique_sources), self.chunk_size)
+        ]
+
+        workers = min(self.max_workers or os.cpu_count() or 1, len(chunks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(
+                        shortest_paths, [graph] * len(chunks), chunks, [targets] * len(chunks)
+                    )
+                )
+        else:
+            results = [shortest_paths(graph, chunk, targets) for chunk in chunks]
+
+        return np.vstack(results)[inverse]
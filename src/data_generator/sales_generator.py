@@ -1,4 +1,4 @@
-from random import random
+import random
 import numpy as np
 from datetime import datetime, timedelta
 import pandas as pd
@@ -70,7 +70,7 @@ class SalesGenerator:
                     category_factors["Clothing"] *= 1.2
                     category_factors["Beauty"] *= 1.3
                     
-                num_products_sold = np.random.randint(10, 30)
+                num_products_sold = min(np.random.randint(10, 30), len(self.products))
                 products_sold = random.sample(self.products, num_products_sold)
                 
                 for product in products_sold:
@@ -1,22 +1,28 @@
 
 
-from random import random
+import random
 import numpy as np
 import pandas as pd
 
-from config import RANDOM_SEED, STORE_CITIES
+from config import HUB_HANDLING_COST, RANDOM_SEED, STORE_CITIES
 from data_generator.data_model import Store
 
 
 class StoreGenerator:
-    def __int__(self, random_seed=None):
-        """Initialize with optional random seed for reproducibility."""
+    def __init__(self, random_seed=None, cities=None):
+        """
+        Initialize with optional random seed for reproducibility.
+
+        Args:
+            random_seed: Optional random seed (uses config default if None)
+            cities: Optional city configuration overriding STORE_CITIES
+        """
         self.random_seed = random_seed or RANDOM_SEED
         np.random.seed(self.random_seed)
         random.seed(self.random_seed)
 
         # Use city configuration from config
-        self.cities = STORE_CITIES
+        self.cities = cities or STORE_CITIES
 
         # Define realistic store name patterns
         self.brand_names = [
@@ -167,6 +173,37 @@ class StoreGenerator:
             
         return stores
 
+    def generate_warehouses(self, output_path=None):
+        """
+        Generate one distribution center per city, at the center of the city.
+
+        Args:
+            output_path: Optional path to save the warehouses to CSV
+
+        Returns:
+            DataFrame with warehouse_id, warehouse_name, city, latitude,
+            longitude and handling_cost
+        """
+        warehouses_df = pd.DataFrame(
+            [
+                {
+                    "warehouse_id": warehouse_id,
+                    "warehouse_name": f"{city} Distribution Center",
+                    "city": city,
+                    "latitude": sum(info["lat_range"]) / 2,
+                    "longitude": sum(info["lon_range"]) / 2,
+                    "handling_cost": HUB_HANDLING_COST,
+                }
+                for warehouse_id, (city, info) in enumerate(self.cities.items(), start=1)
+            ]
+        )
+
+        if output_path:
+            warehouses_df.to_csv(output_path, index=False)
+            print(f"Saved {len(warehouses_df)} warehouses to {output_path}")
+
+        return warehouses_df
+
 
 if __name__ == "__main__":
     generator = StoreGenerator()
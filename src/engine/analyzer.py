@@ -1,19 +1,42 @@
+from statistics import NormalDist
+
 import numpy as np
 import pandas as pd
 
-from config import MAX_INVENTORY_DAYS, MIN_INVENTORY_DAYS
+from config import (
+    MAX_INVENTORY_DAYS,
+    MIN_INVENTORY_DAYS,
+    SAFETY_STOCK_LEAD_TIME_DAYS,
+    SAFETY_STOCK_MAX_DAYS,
+)
+from engine.forecasting import DemandForecaster
 
 
 
 class InventoryAnalyzer:
-    def __init__(self, sales_df=None, inventory_df=None, stores=None, products=None):
+    def __init__(
+        self,
+        sales_df=None,
+        inventory_df=None,
+        stores=None,
+        products=None,
+        use_forecast=False,
+        service_level=None,
+        lead_time_days=SAFETY_STOCK_LEAD_TIME_DAYS,
+    ):
         self.sales_df = sales_df
         self.inventory_df = inventory_df
         self.stores = stores
         self.products = products
+        # Forecast daily demand (engine/forecasting.py) instead of the flat average
+        self.use_forecast = use_forecast
+        # Per-row safety-stock days on top of the thresholds (None = global thresholds only)
+        self.service_level = service_level
+        self.lead_time_days = lead_time_days
         self.analysis_df = None
         self.excess_inventory = None
         self.needed_inventory = None
+        self._row_positions = None
         
         if self.sales_df is not None and "date" in self.sales_df.columns:
             if self.sales_df["date"].dtype == "object":
@@ -52,14 +75,14 @@ class InventoryAnalyzer:
             product_category_map = self.products.set_index("product_id")["category"].to_dict()
             self.sales_df["category"] = self.sales_df["product_id"].map(product_category_map)
 
-        sales_metrics = {
+        sales_metrics = (
             self.sales_df.groupby(["store_id", "product_id"])
             .agg({
                 "quantity": ["sum", "mean", "std", "count"],
                 "revenue": ["sum", "mean"],
             })
             .reset_index()
-        }
+        )
         
         sales_metrics.columns = [
             "_".join(col).strip("_") for col in sales_metrics.columns.values
@@ -67,7 +90,262 @@ class InventoryAnalyzer:
         
         sales_metrics["quantity_cv"] = (
             sales_metrics["quantity_std"] / sales_metrics["quantity_mean"]
-        ).fillna(0, inplace=True)
+        ).fillna(0)
+        
+        inventory = self.inventory_df[["store_id", "product_id", "current_stock"]].copy()
+        inventory["store_id"] = inventory["store_id"].astype(int)
+        inventory["product_id"] = inventory["product_id"].astype(int)
+        
+        analysis_df = pd.merge(
+            inventory, sales_metrics, on=["store_id", "product_id"], how="left"
+        )
+        
+        analysis_df["avg_daily_sales"] = analysis_df["quantity_mean"].fillna(0.01)
+        
+        if self.use_forecast:
+            print("Forecasting daily demand for every store-product series...")
+            forecast = DemandForecaster().forecast(
+                self.sales_df, analysis_df, self.stores, self.products
+            )
+            analysis_df["forecast_model"] = forecast["forecast_model"]
+            analysis_df["avg_daily_sales"] = forecast["forecast_daily_sales"].clip(lower=0.01)
+            
+        analysis_df["days_of_inventory"] = (
+            analysis_df["current_stock"] / analysis_df["avg_daily_sales"]
+        )
+        
+        if self.service_level is not None:
+            analysis_df["safety_days"] = self.safety_stock_days(
+                analysis_df["quantity_cv"], self.service_level, self.lead_time_days
+            )
+            
+        analysis_df["inventory_status"] = self.inventory_status(
+            analysis_df, MIN_INVENTORY_DAYS, MAX_INVENTORY_DAYS
+        )
+        
+        self.analysis_df = analysis_df
+        self._row_positions = None
+        
+        print(f"Analyzed {len(self.analysis_df)} store-product combinations.")
+        
+        return self.analysis_df
+        
+    def identify_inventory_imbalances(self, min_days=None, max_days=None):
+        """
+        Identify store-product combinations with excess or needed inventory.
+
+        Args:
+            min_days: Days of inventory below which an item is needed
+            max_days: Days of inventory above which an item is in excess
+
+        Returns:
+            Tuple of (excess_inventory_df, needed_inventory_df)
+        """
+        min_days = min_days or MIN_INVENTORY_DAYS
+        max_days = max_days or MAX_INVENTORY_DAYS
+        
+        if self.analysis_df is None:
+            self.analyze_sales_data()
+            
+        if "safety_days" in self.analysis_df.columns:
+            print(
+                f"Identifying inventory imbalances (min {min_days} days, max {max_days} days "
+                f"+ safety stock at {self.service_level:.0%} service level)..."
+            )
+        else:
+            print(f"Identifying inventory imbalances (min {min_days} days, max {max_days} days)...")
+        
+        excess_df, needed_df = self.split_imbalances(self.analysis_df, min_days, max_days)
+        
+        self.excess_inventory = excess_df.reset_index(drop=True)
+        self.needed_inventory = needed_df.reset_index(drop=True)
+        
+        print(f"Found {len(self.excess_inventory)} excess and {len(self.needed_inventory)} needed items.")
+        
+        return self.excess_inventory, self.needed_inventory
+        
+    @staticmethod
+    def safety_stock_days(cv, service_level, lead_time_days, max_days=SAFETY_STOCK_MAX_DAYS):
+        """
+        Safety stock of every row expressed in days of demand.
+
+        Safety stock is z * sigma * sqrt(lead time) units, i.e.
+        z * cv * sqrt(lead time) days, where z is the standard normal quantile
+        of the service level. Computed in place on a single float32 array.
+
+        Args:
+            cv: Coefficient of variation of daily demand per row
+            service_level: Target probability of not stocking out (e.g. 0.95)
+            lead_time_days: Replenishment lead time in days
+            max_days: Upper bound of the safety days of a row
+
+        Returns:
+            float32 array of safety days
+        """
+        z = NormalDist().inv_cdf(service_level)
+        safety = np.asarray(cv, dtype=np.float32).copy()
+        np.nan_to_num(safety, copy=False)
+        np.multiply(safety, z * np.sqrt(lead_time_days), out=safety)
+        np.clip(safety, 0, max_days, out=safety)
+        return safety
+        
+    @staticmethod
+    def row_thresholds(rows, min_days, max_days):
+        """
+        Per-row (min_days, max_days): the global thresholds shifted by the
+        safety days of each row, or the scalars when rows carry no safety days.
+        """
+        if "safety_days" not in rows.columns:
+            return min_days, max_days
+        
+        safety = np.nan_to_num(rows["safety_days"].to_numpy(dtype=np.float32))
+        return safety + np.float32(min_days), safety + np.float32(max_days)
+        
+    @classmethod
+    def inventory_status(cls, rows, min_days, max_days, days_of_inventory=None):
+        """
+        Excess / Needed / Balanced status of every row.
+
+        Returns:
+            Array of status strings
+        """
+        min_days, max_days = cls.row_thresholds(rows, min_days, max_days)
+        if days_of_inventory is None:
+            days_of_inventory = rows["days_of_inventory"].to_numpy()
+        
+        return np.where(
+            days_of_inventory > max_days,
+            "Excess",
+            np.where(days_of_inventory < min_days, "Needed", "Balanced"),
+        )
+        
+    @classmethod
+    def split_imbalances(cls, rows, min_days, max_days):
+        """
+        Split analysis rows into excess and needed inventory. Rows with a
+        safety_days column get their thresholds shifted by it.
+
+        Args:
+            rows: Analysis rows with current_stock, avg_daily_sales and days_of_inventory
+            min_days: Days of inventory below which an item is needed
+            max_days: Days of inventory above which an item is in excess
+
+        Returns:
+            Tuple of (excess_inventory_df, needed_inventory_df)
+        """
+        columns = ["store_id", "product_id", "current_stock", "avg_daily_sales", "days_of_inventory"]
+        # Demand variability is kept for engines that sample demand
+        columns += [column for column in ("quantity_std",) if column in rows.columns]
+        min_days, max_days = cls.row_thresholds(rows, min_days, max_days)
+        days = rows["days_of_inventory"].to_numpy()
+        
+        excess_mask = days > max_days
+        excess_df = rows.loc[excess_mask, columns].copy()
+        excess_df["excess_units"] = (
+            excess_df["current_stock"]
+            - excess_df["avg_daily_sales"] * (max_days[excess_mask] if np.ndim(max_days) else max_days)
+        ).astype(int)
+        excess_df = excess_df[excess_df["excess_units"] > 0]
+        
+        needed_mask = days < min_days
+        needed_df = rows.loc[needed_mask, columns].copy()
+        needed_df["needed_units"] = (
+            needed_df["avg_daily_sales"] * (min_days[needed_mask] if np.ndim(min_days) else min_days)
+            - needed_df["current_stock"]
+        ).astype(int)
+        needed_df = needed_df[needed_df["needed_units"] > 0]
+        
+        return excess_df, needed_df
+        
+    def update_inventory(self, inventory_delta, min_days=None, max_days=None):
+        """
+        Apply stock corrections and recompute days of inventory for the changed rows only.
+
+        Args:
+            inventory_delta: DataFrame with store_id, product_id and the new current_stock
+            min_days: Shortage threshold of the recomputed status (default: MIN_INVENTORY_DAYS)
+            max_days: Excess threshold of the recomputed status (default: MAX_INVENTORY_DAYS)
+
+        Returns:
+            Updated analysis rows for the changed store-product combinations
+        """
+        if self.analysis_df is None:
+            self.analyze_sales_data()
+            
+        if self._row_positions is None:
+            self._row_positions = {
+                key: position
+                for position, key in enumerate(
+                    zip(self.analysis_df["store_id"], self.analysis_df["product_id"])
+                )
+            }
+            
+        delta = inventory_delta.drop_duplicates(["store_id", "product_id"], keep="last")
+        
+        # Coerce and check every value before touching analysis_df or the row index,
+        # so a malformed delta leaves the state unchanged
+        store_ids = pd.to_numeric(delta["store_id"], errors="raise").to_numpy(dtype=float)
+        product_ids = pd.to_numeric(delta["product_id"], errors="raise").to_numpy(dtype=float)
+        stocks = pd.to_numeric(delta["current_stock"], errors="raise").to_numpy(dtype=float)
+        if not (np.isfinite(store_ids).all() and np.isfinite(product_ids).all()):
+            raise ValueError("store_id and product_id must be integers")
+        if (store_ids != np.round(store_ids)).any() or (product_ids != np.round(product_ids)).any():
+            raise ValueError("store_id and product_id must be integers")
+        if not np.isfinite(stocks).all() or (stocks < 0).any():
+            raise ValueError("current_stock must be a non-negative number")
+        
+        positions = []
+        new_rows = []
+        
+        for store_id, product_id, stock in zip(
+            store_ids.astype(int).tolist(), product_ids.astype(int).tolist(), stocks.tolist()
+        ):
+            position = self._row_positions.get((store_id, product_id))
+            if position is None:
+                # No sales history for this combination
+                new_rows.append(
+                    {
+                        "store_id": store_id,
+                        "product_id": product_id,
+                        "current_stock": stock,
+                        "avg_daily_sales": 0.01,
+                    }
+                )
+            else:
+                positions.append((position, stock))
+                
+        if new_rows:
+            start = len(self.analysis_df)
+            self.analysis_df = pd.concat(
+                [self.analysis_df, pd.DataFrame(new_rows)], ignore_index=True
+            )
+            for offset, row in enumerate(new_rows):
+                self._row_positions[(row["store_id"], row["product_id"])] = start + offset
+                positions.append((start + offset, row["current_stock"]))
+                
+        row_index = np.array([position for position, _ in positions], dtype=int)
+        stock = np.array([value for _, value in positions], dtype=float)
+        
+        stock_col = self.analysis_df.columns.get_loc("current_stock")
+        avg_col = self.analysis_df.columns.get_loc("avg_daily_sales")
+        days_col = self.analysis_df.columns.get_loc("days_of_inventory")
+        status_col = self.analysis_df.columns.get_loc("inventory_status")
+        
+        days = stock / self.analysis_df.iloc[row_index, avg_col].to_numpy(dtype=float)
+        status = self.inventory_status(
+            self.analysis_df.iloc[row_index],
+            MIN_INVENTORY_DAYS if min_days is None else min_days,
+            MAX_INVENTORY_DAYS if max_days is None else max_days,
+            days,
+        )
+        
+        self.analysis_df.iloc[row_index, stock_col] = stock.astype(
+            self.analysis_df["current_stock"].dtype
+        )
+        self.analysis_df.iloc[row_index, days_col] = days
+        self.analysis_df.iloc[row_index, status_col] = status
+        
+        return self.analysis_df.iloc[row_index]
         
     def evaluate_plan_impact(self, transfer_plan):
         """
@@ -88,36 +366,28 @@ class InventoryAnalyzer:
             print("No transfer plan to evaluate")
             return None, self.analysis_df
         
-        post_inventory = self.inventory_df.copy()
+        # Net units per store-product, joined once instead of masking per transfer
+        keys = pd.MultiIndex.from_frame(self.analysis_df[["store_id", "product_id"]].astype(int))
+        received = transfer_plan.groupby(["to_store_id", "product_id"])["units"].sum()
+        shipped = transfer_plan.groupby(["from_store_id", "product_id"])["units"].sum()
         
-        for _, transfer in transfer_plan.itterows():
-            from_store_id = transfer["from_store_id"]
-            to_store_id = transfer["to_store_id"]
-            product_id = transfer["product_id"]
-            units = transfer["units"]
-            
-            from_mask = (post_inventory["store_id"] == from_store_id) & (
-                post_inventory["product_id"] == product_id
-            )
-            post_inventory.loc[from_mask, "current_stock"] -= units
-            
-            to_mask = (post_inventory["store_id"] == to_store_id) & (
-                post_inventory["product_id"] == product_id
-            )
-            post_inventory.loc[to_mask, "current_stock"] += units
-            
         post_analysis = self.analysis_df.copy()
-        post_analysis["current_stock"] = post_inventory["current_stock"]
+        post_analysis["current_stock"] = (
+            post_analysis["current_stock"]
+            + received.reindex(keys).fillna(0).to_numpy()
+            - shipped.reindex(keys).fillna(0).to_numpy()
+        ).astype(self.analysis_df["current_stock"].dtype)
         
         post_analysis["days_of_inventory"] = (
             post_analysis["current_stock"] / post_analysis["avg_daily_sales"]
         )
-        post_analysis["days_of_inventory"].replace(
-            np.inf, 365, inplace=True
+        post_analysis["days_of_inventory"] = post_analysis["days_of_inventory"].replace(
+            np.inf, 365
         ) # Cap at 1 year for zero sales
         
-        min_days = MIN_INVENTORY_DAYS
-        max_days = MAX_INVENTORY_DAYS
+        min_days, max_days = self.row_thresholds(
+            post_analysis, MIN_INVENTORY_DAYS, MAX_INVENTORY_DAYS
+        )
         
         post_analysis["post_inventory_status"] = "Balanced"
         
@@ -131,7 +401,7 @@ class InventoryAnalyzer:
         
         before_counts = self.analysis_df["inventory_status"].value_counts()
         
-        after_counts = post_analysis["days_of_inventory"].value_counts()
+        after_counts = post_analysis["post_inventory_status"].value_counts()
         
         avg_days_before = self.analysis_df["days_of_inventory"].mean()
         avg_days_after = post_analysis["days_of_inventory"].mean()
@@ -173,6 +443,9 @@ class InventoryAnalyzer:
                 self.analysis_df["current_stock"] 
                 * self.analysis_df["product_id"].map(product_value_map)
             ).sum()
+            inventory_value_after = (
+                post_analysis["current_stock"] * post_analysis["product_value"]
+            ).sum()
             
             excess_value_before = (
                 self.analysis_df.loc[
@@ -196,7 +469,7 @@ class InventoryAnalyzer:
             inventory_value_after = post_analysis["current_stock"].sum()
             excess_value_before = self.analysis_df.loc[
                 self.analysis_df["inventory_status"] == "Excess", "current_stock"
-            ]
+            ].sum()
             excess_value_after = post_analysis.loc[
                 post_analysis["post_inventory_status"] == "Excess", "current_stock"
             ].sum()
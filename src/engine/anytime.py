@@ -0,0 +1,117 @@
+"""
+Deadline-aware (anytime) optimizer.
+
+The greedy rule-based plan is produced first, so a feasible plan exists almost
+immediately. The remaining time budget is spent improving it with local search;
+whatever the best plan is when the budget expires is returned.
+"""
+
+from time import perf_counter
+
+from config import ANYTIME_TIME_BUDGET_S
+from engine.local_search import LocalSearchImprover
+from engine.rule_based import RuleBasedOptimizer
+
+
+class AnytimeOptimizer(RuleBasedOptimizer):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        time_budget=ANYTIME_TIME_BUDGET_S,
+    ):
+        """
+        Args:
+            distance_matrix: Matrix of distances between stores
+            transport_cost_matrix: Matrix of transport costs between stores
+            time_budget: Wall-clock seconds available for the whole optimization
+        """
+        super().__init__(distance_matrix, transport_cost_matrix)
+        self.time_budget = time_budget
+        self.trajectory = []
+
+    def optimize(self, excess_inventory, needed_inventory):
+        """
+        Generate a transfer plan within the time budget.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            DataFrame containing the best transfer plan found
+        """
+        start_time = perf_counter()
+        deadline = start_time + self.time_budget
+
+        self.logger_system.log_execution_start(
+            "anytime_optimization",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "time_budget_s": self.time_budget,
+                "algorithm": "Greedy seed + local search",
+            },
+        )
+
+        seed_plan = super().optimize(excess_inventory, needed_inventory)
+        self.trajectory = []
+
+        if seed_plan.empty or self.transport_cost_matrix is None:
+            if not seed_plan.empty:
+                print("Anytime optimization: no dense cost matrix loaded, returning the greedy plan.")
+            self.logger_system.log_execution_end(
+                "anytime_optimization",
+                perf_counter() - start_time,
+                {"transfers_generated": len(seed_plan)},
+            )
+            return self.transfer_plan
+
+        improver = LocalSearchImprover(self.distance_matrix, self.transport_cost_matrix)
+        improver.load_plan(seed_plan, excess_inventory)
+        self._record(start_time, "seed", improver.total_cost)
+
+        improver.improve(
+            deadline=deadline,
+            on_pass=lambda passes, cost: self._record(start_time, f"pass {passes}", cost),
+        )
+
+        if improver.total_cost < improver.initial_cost:
+            self.transfer_plan = improver.to_dataframe()
+
+        saved = improver.initial_cost - improver.total_cost
+        execution_time = perf_counter() - start_time
+        message = (
+            f"Anytime optimization: {improver.initial_cost:,.0f} -> {improver.total_cost:,.0f} VND "
+            f"({saved:,.0f} VND saved, {sum(improver.moves.values())} moves) "
+            f"in {execution_time:.2f} seconds"
+        )
+        print(message)
+        self.logger_system.log_progress("anytime_optimization", message)
+
+        self.logger_system.log_execution_end(
+            "anytime_optimization",
+            execution_time,
+            {
+                "transfers_generated": len(self.transfer_plan),
+                "seed_cost": improver.initial_cost,
+                "best_cost": improver.total_cost,
+                "cost_saved": saved,
+                **{f"{move}_moves": count for move, count in improver.moves.items()},
+                "deadline_reached": perf_counter() >= deadline,
+                "trajectory": [
+                    f"{elapsed:.3f}s={cost:,.0f}" for elapsed, _, cost in self.trajectory
+                ],
+            },
+        )
+
+        return self.transfer_plan
+
+    def _record(self, start_time, label, cost):
+        """Append a point to the cost trajectory and log it."""
+        elapsed = perf_counter() - start_time
+        self.trajectory.append((elapsed, label, cost))
+        self.logger_system.log_progress(
+            "anytime_optimization",
+            f"[{elapsed:8.3f}s] {label}: total transport cost {cost:,.0f} VND",
+        )
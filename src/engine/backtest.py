@@ -0,0 +1,322 @@
+"""
+Historical backtesting of transfer plans.
+
+Sales history is replayed day by day over the store x product grid, held as
+flat numpy arrays (one cell per store-product combination). Each day:
+
+1. Supplier receipts of the day (if given) and transfers whose lead time
+   has elapsed arrive.
+2. On review days, days of inventory are computed from the trailing sales
+   window, excess/needed items are split with the analyzer's thresholds and
+   the optimizer produces a plan. Donor stock leaves immediately; receivers
+   get it after the lead time.
+3. Stock is decremented by the actual sales of the day. Demand that cannot
+   be served counts as a stockout-day and lost revenue.
+
+A configuration without reviews is the no-transfer baseline. Independent
+configurations run in parallel worker processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    BACKTEST_LEAD_TIME_DAYS,
+    BACKTEST_SALES_WINDOW_DAYS,
+    MAX_INVENTORY_DAYS,
+    MIN_INVENTORY_DAYS,
+)
+from engine.analyzer import InventoryAnalyzer
+from engine.registry import create_engine
+from utils.logger import get_optimization_logger
+
+
+class Backtester:
+    def __init__(
+        self,
+        sales_df,
+        initial_inventory,
+        engine_name="Rule-based",
+        engine_params=None,
+        engine_state=None,
+        receipts_df=None,
+    ):
+        """
+        Args:
+            sales_df: Sales history (date, store_id, product_id, quantity, revenue)
+            initial_inventory: Stock at the start of the history (store_id, product_id, current_stock)
+            engine_name: Registered engine producing the transfer plans
+            engine_params: Constructor parameter overrides of the engine
+            engine_state: Loaded engine attributes to reuse (e.g. distance/cost matrices)
+            receipts_df: Optional supplier receipts (date, store_id, product_id, units);
+                without them stock is only replenished by transfers
+        """
+        self.engine_name = engine_name
+        self.engine_params = engine_params or {}
+        self.engine_state = engine_state or {}
+        self.logger_system = get_optimization_logger()
+
+        sales = sales_df.assign(
+            date=pd.to_datetime(sales_df["date"]),
+            store_id=sales_df["store_id"].astype(int),
+            product_id=sales_df["product_id"].astype(int),
+        )
+        sales = sales.groupby(["date", "store_id", "product_id"], as_index=False)[
+            ["quantity", "revenue"]
+        ].sum()
+        inventory = initial_inventory.assign(
+            store_id=initial_inventory["store_id"].astype(int),
+            product_id=initial_inventory["product_id"].astype(int),
+        )
+
+        # One cell per store-product combination seen in stock or in sales
+        cells = (
+            pd.concat([inventory[["store_id", "product_id"]], sales[["store_id", "product_id"]]])
+            .drop_duplicates()
+            .sort_values(["store_id", "product_id"])
+        )
+        self.cell_index = pd.MultiIndex.from_frame(cells)
+        self.store_ids = cells["store_id"].to_numpy()
+        self.product_ids = cells["product_id"].to_numpy()
+        self.num_cells = len(cells)
+
+        self.start_date = sales["date"].min()
+        self.num_days = (sales["date"].max() - self.start_date).days + 1
+
+        # Sales sorted by day, sliced per day with a CSR-style pointer
+        sales["day"] = (sales["date"] - self.start_date).dt.days
+        sales = sales.sort_values("day")
+        self.sale_cells = self.cell_index.get_indexer(
+            pd.MultiIndex.from_frame(sales[["store_id", "product_id"]])
+        )
+        self.sale_quantities = sales["quantity"].to_numpy(dtype=np.float64)
+        self.day_pointer = np.searchsorted(sales["day"].to_numpy(), np.arange(self.num_days + 1))
+
+        # Average selling price per cell, falling back to the product's price
+        revenue = np.bincount(self.sale_cells, sales["revenue"].to_numpy(), minlength=self.num_cells)
+        quantity = np.bincount(self.sale_cells, self.sale_quantities, minlength=self.num_cells)
+        product_price = sales.groupby("product_id")["revenue"].sum() / sales.groupby("product_id")["quantity"].sum()
+        fallback = pd.Series(self.product_ids).map(product_price).fillna(0).to_numpy()
+        self.unit_prices = np.where(quantity > 0, revenue / np.maximum(quantity, 1), fallback)
+
+        self.initial_stock = np.zeros(self.num_cells)
+        positions = self.cell_index.get_indexer(pd.MultiIndex.from_frame(inventory[["store_id", "product_id"]]))
+        self.initial_stock[positions] = inventory["current_stock"].to_numpy(dtype=np.float64)
+
+        self.receipts = {}
+        if receipts_df is not None and not receipts_df.empty:
+            receipts = receipts_df.assign(day=(pd.to_datetime(receipts_df["date"]) - self.start_date).dt.days)
+            receipts = receipts[(receipts["day"] >= 0) & (receipts["day"] < self.num_days)]
+            receipt_cells = self.cell_index.get_indexer(
+                pd.MultiIndex.from_arrays(
+                    [receipts["store_id"].astype(int), receipts["product_id"].astype(int)]
+                )
+            )
+            known = receipt_cells >= 0
+            for day, group in pd.DataFrame(
+                {"day": receipts["day"].to_numpy()[known], "cell": receipt_cells[known],
+                 "units": receipts["units"].to_numpy(dtype=np.float64)[known]}
+            ).groupby("day"):
+                self.receipts[day] = (group["cell"].to_numpy(), group["units"].to_numpy())
+
+    def daily_demand(self, day):
+        """Units demanded per cell on a day of the history."""
+        demand = np.zeros(self.num_cells)
+        start, end = self.day_pointer[day], self.day_pointer[day + 1]
+        demand[self.sale_cells[start:end]] = self.sale_quantities[start:end]
+        return demand
+
+    def run(
+        self,
+        name="backtest",
+        review_days=None,
+        lead_time=BACKTEST_LEAD_TIME_DAYS,
+        sales_window=BACKTEST_SALES_WINDOW_DAYS,
+        min_days=MIN_INVENTORY_DAYS,
+        max_days=MAX_INVENTORY_DAYS,
+    ):
+        """
+        Replay the sales history.
+
+        Args:
+            name: Configuration name used in the results
+            review_days: Run the optimizer every this many days (None = no transfers)
+            lead_time: Days between dispatch and arrival of a transfer
+            sales_window: Trailing days used for the average daily sales
+            min_days: Days of inventory below which an item is needed
+            max_days: Days of inventory above which an item is in excess
+
+        Returns:
+            Tuple of (summary dict, daily DataFrame)
+        """
+        start_time = perf_counter()
+        engine = None
+        if review_days:
+            engine = create_engine(self.engine_name, **self.engine_params)
+            for key, value in self.engine_state.items():
+                setattr(engine, key, value)
+
+        stock = self.initial_stock.copy()
+        in_transit = np.zeros(self.num_cells)
+        arrivals = {}
+        window_sales = np.zeros(self.num_cells)
+
+        totals = {"transfers": 0, "units_transferred": 0, "transport_cost": 0.0, "reviews": 0}
+        daily = {"stockout_cells": [], "lost_units": [], "lost_revenue": []}
+
+        for day in range(self.num_days):
+            if day in self.receipts:
+                cells, units = self.receipts[day]
+                np.add.at(stock, cells, units)
+            if day in arrivals:
+                cells, units = arrivals.pop(day)
+                np.add.at(stock, cells, units)
+                np.subtract.at(in_transit, cells, units)
+
+            if engine is not None and day > 0 and day % review_days == 0:
+                history = min(day, sales_window)
+                average = np.maximum(window_sales / history, 0.01)
+                plan = self._review(engine, stock, in_transit, average, min_days, max_days)
+                if not plan.empty:
+                    from_cells = self._cells(plan["from_store_id"], plan["product_id"])
+                    to_cells = self._cells(plan["to_store_id"], plan["product_id"])
+                    units = plan["units"].to_numpy(dtype=np.float64)
+                    np.subtract.at(stock, from_cells, units)
+                    np.add.at(in_transit, to_cells, units)
+                    if lead_time > 0:
+                        arrivals[day + lead_time] = (to_cells, units)
+                    else:
+                        np.add.at(stock, to_cells, units)
+                        np.subtract.at(in_transit, to_cells, units)
+
+                    totals["transfers"] += len(plan)
+                    totals["units_transferred"] += int(units.sum())
+                    totals["transport_cost"] += float(plan["transport_cost"].sum())
+                totals["reviews"] += 1
+
+            demand = self.daily_demand(day)
+            sold = np.minimum(stock, demand)
+            lost = demand - sold
+            stock -= sold
+
+            window_sales += demand
+            if day >= sales_window:
+                window_sales -= self.daily_demand(day - sales_window)
+
+            daily["stockout_cells"].append(int(np.count_nonzero(lost > 0)))
+            daily["lost_units"].append(float(lost.sum()))
+            daily["lost_revenue"].append(float((lost * self.unit_prices).sum()))
+
+        daily = pd.DataFrame(daily)
+        daily.insert(0, "date", pd.date_range(self.start_date, periods=self.num_days))
+        daily.insert(0, "config", name)
+
+        summary = {
+            "config": name,
+            "review_days": review_days,
+            "lead_time": lead_time if review_days else None,
+            "days": self.num_days,
+            "cells": self.num_cells,
+            "stockout_days": int(daily["stockout_cells"].sum()),
+            "lost_units": float(daily["lost_units"].sum()),
+            "lost_revenue": float(daily["lost_revenue"].sum()),
+            **totals,
+            "units_in_transit_at_end": float(in_transit.sum()),
+            "runtime_s": perf_counter() - start_time,
+        }
+        return summary, daily
+
+    def _cells(self, store_ids, product_ids):
+        """Cell positions of (store_id, product_id) pairs."""
+        return self.cell_index.get_indexer(
+            pd.MultiIndex.from_arrays([store_ids.astype(int), product_ids.astype(int)])
+        )
+
+    def _review(self, engine, stock, in_transit, average, min_days, max_days):
+        """
+        Run the optimizer on the current state. Donors offer on-hand stock;
+        receivers count stock already in transit to them.
+        """
+        def analysis_rows(level):
+            return pd.DataFrame(
+                {
+                    "store_id": self.store_ids,
+                    "product_id": self.product_ids,
+                    "current_stock": level,
+                    "avg_daily_sales": average,
+                    "days_of_inventory": level / average,
+                }
+            )
+
+        excess, _ = InventoryAnalyzer.split_imbalances(analysis_rows(stock), min_days, max_days)
+        _, needed = InventoryAnalyzer.split_imbalances(analysis_rows(stock + in_transit), min_days, max_days)
+        if excess.empty or needed.empty:
+            return pd.DataFrame()
+
+        return engine.optimize(excess.reset_index(drop=True), needed.reset_index(drop=True))
+
+
+_worker_backtester = None
+
+
+def _init_worker(backtester):
+    """Keep one copy of the backtester per worker process."""
+    global _worker_backtester
+    _worker_backtester = backtester
+
+
+def _run_config(config):
+    return _worker_backtester.run(**config)
+
+
+def run_backtests(backtester, configs, max_workers=None):
+    """
+    Run several backtest configurations, in parallel when possible.
+
+    Args:
+        backtester: Backtester with the loaded history
+        configs: List of keyword dictionaries for Backtester.run
+        max_workers: Worker processes (default: CPU count)
+
+    Returns:
+        Tuple of (summary DataFrame, daily DataFrame)
+    """
+    start_time = perf_counter()
+    backtester.logger_system.log_execution_start(
+        "backtest",
+        {
+            "configs": len(configs),
+            "days": backtester.num_days,
+            "cells": backtester.num_cells,
+            "engine": backtester.engine_name,
+        },
+    )
+
+    workers = min(max_workers or os.cpu_count() or 1, len(configs))
+    if workers > 1:
+        print(f"Running {len(configs)} backtests on {workers} processes...")
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(backtester,)
+        ) as executor:
+            results = list(executor.map(_run_config, configs))
+    else:
+        print(f"Running {len(configs)} backtests sequentially...")
+        results = [backtester.run(**config) for config in configs]
+
+    summary = pd.DataFrame([result[0] for result in results])
+    daily = pd.concat([result[1] for result in results], ignore_index=True)
+
+    for row in summary.itertuples():
+        backtester.logger_system.log_progress(
+            "backtest",
+            f"{row.config}: {row.stockout_days} stockout-days, {row.lost_revenue:,.0f} VND lost revenue, "
+            f"{row.transfers} transfers costing {row.transport_cost:,.0f} VND",
+        )
+    backtester.logger_system.log_execution_end(
+        "backtest", perf_counter() - start_time, {"configs": len(configs)}
+    )
+    return summary, daily
@@ -0,0 +1,428 @@
+"""
+Budget-constrained optimizer (Lagrangian relaxation).
+
+Maximizes the needed units covered by a plan whose total transport cost stays
+within a budget (VND). Without the budget the problem splits into one
+transportation problem per product; the budget couples them. Relaxing it with
+a multiplier lambda (units of coverage per VND) gives
+
+    L(lambda) = lambda * budget + sum over products of
+                max sum (1 - lambda * unit_cost) * units
+
+whose per-product subproblems are independent LPs over a candidate graph (the
+K cheapest donors of each receiver, per product) and are solved in parallel
+worker processes. Every L(lambda) is an upper bound on the coverage within
+budget; lambda is updated by subgradient steps (Polyak step size on the budget
+violation). Each subproblem solution is made feasible by dropping its most
+expensive units until the plan fits the budget, which gives a lower bound.
+The best feasible plan and the duality gap between the bounds are returned.
+Bounds refer to the candidate graph.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, vstack
+
+from config import (
+    BUDGET_CANDIDATES,
+    BUDGET_GAP_TOLERANCE,
+    BUDGET_MAX_ITERATIONS,
+    TRANSPORT_BUDGET,
+)
+from engine.rule_based import RuleBasedOptimizer
+
+
+# Lanes priced per block of the candidate search (donor stores x receivers)
+CANDIDATE_BLOCK_LANES = 2**22
+
+
+def solve_subproblem(subproblem, multiplier):
+    """
+    Lagrangian subproblem of one product: the most valuable flow when every unit
+    is worth 1 - multiplier * unit cost.
+
+    Args:
+        subproblem: Dictionary with donor, receiver, cost (per candidate lane),
+            supply (per donor) and demand (per receiver)
+        multiplier: Lagrange multiplier of the budget
+
+    Returns:
+        Units shipped on each candidate lane
+    """
+    cost = subproblem["cost"]
+    units = np.zeros(len(cost), dtype=np.int64)
+    if multiplier > 0:
+        value = 1.0 - multiplier * cost
+    else:
+        # Cheapest among the plans of maximum coverage: all units together
+        # weigh less than one unit of coverage
+        value = 1.0 - cost / (max(float(cost.max(initial=0.0)), 1.0) * (subproblem["demand"].sum() + 1))
+    useful = np.flatnonzero(value > 0)
+    if len(useful) == 0:
+        return units
+
+    donor, receiver = subproblem["donor"][useful], subproblem["receiver"][useful]
+    columns = np.arange(len(useful))
+    ones = np.ones(len(useful))
+    constraints = vstack(
+        [
+            csr_matrix((ones, (donor, columns)), shape=(len(subproblem["supply"]), len(useful))),
+            csr_matrix((ones, (receiver, columns)), shape=(len(subproblem["demand"]), len(useful))),
+        ]
+    ).tocsr()
+    result = linprog(
+        -value[useful],
+        A_ub=constraints,
+        b_ub=np.concatenate([subproblem["supply"], subproblem["demand"]]),
+        bounds=(0, None),
+        method="highs",
+    )
+    if result.status == 0:
+        # Transportation constraints are totally unimodular: vertex solutions are integral
+        units[useful] = np.rint(result.x).astype(np.int64)
+    return units
+
+
+def build_product_subproblems(optimizer, excess_inventory, needed_inventory, candidates=BUDGET_CANDIDATES):
+    """
+    Candidate graph of every product: the K cheapest donors of each receiver.
+
+    Args:
+        optimizer: Engine whose lane_block() prices lanes between stores
+        excess_inventory: DataFrame containing excess inventory
+        needed_inventory: DataFrame containing needed inventory
+        candidates: Cheapest donors kept per receiver (K)
+
+    Returns:
+        List of subproblem dictionaries (product_id, donor, receiver, cost,
+        distance, supply, demand, donor_ids, receiver_ids)
+    """
+    if excess_inventory.empty or needed_inventory.empty:
+        return []
+
+    excess = excess_inventory.groupby(
+        [excess_inventory["product_id"].astype(int), excess_inventory["store_id"].astype(int)]
+    )["excess_units"].sum()
+    needed = needed_inventory.groupby(
+        [needed_inventory["product_id"].astype(int), needed_inventory["store_id"].astype(int)]
+    )["needed_units"].sum()
+    excess, needed = excess[excess > 0], needed[needed > 0]
+
+    product_ids = np.intersect1d(excess.index.get_level_values(0), needed.index.get_level_values(0))
+    subproblems = []
+    for product_id in product_ids.tolist():
+        supply, demand = excess.loc[product_id], needed.loc[product_id]
+        donor_ids = supply.index.to_numpy(dtype=np.int64)
+        receiver_ids = demand.index.to_numpy(dtype=np.int64)
+        k = min(candidates, len(donor_ids))
+
+        lanes = []
+        block = max(1, CANDIDATE_BLOCK_LANES // len(donor_ids))
+        for start in range(0, len(receiver_ids), block):
+            end = min(start + block, len(receiver_ids))
+            distances, costs = optimizer.lane_block(donor_ids, receiver_ids[start:end])
+            costs = np.where(donor_ids[:, None] == receiver_ids[None, start:end], np.inf, costs)
+            nearest = np.argpartition(costs, k - 1, axis=0)[:k]
+            columns = np.broadcast_to(np.arange(end - start), nearest.shape)
+            lane_costs = costs[nearest, columns]
+            usable = np.isfinite(lane_costs)
+            lanes.append(
+                (
+                    nearest[usable],
+                    columns[usable] + start,
+                    lane_costs[usable],
+                    distances[nearest, columns][usable],
+                )
+            )
+
+        donor, receiver, cost, distance = (np.concatenate(part) for part in zip(*lanes))
+        if len(cost) == 0:
+            continue
+        subproblems.append(
+            {
+                "product_id": product_id,
+                "donor": donor,
+                "receiver": receiver,
+                "cost": cost.astype(np.float64),
+                "distance": distance.astype(np.float64),
+                "supply": supply.to_numpy(dtype=np.float64),
+                "demand": demand.to_numpy(dtype=np.float64),
+                "donor_ids": donor_ids,
+                "receiver_ids": receiver_ids,
+            }
+        )
+    return subproblems
+
+
+_worker_subproblems = None
+
+
+def _init_worker(subproblems):
+    """Keep one copy of the subproblems per worker process."""
+    global _worker_subproblems
+    _worker_subproblems = subproblems
+
+
+def _solve_worker_subproblem(index, multiplier):
+    return solve_subproblem(_worker_subproblems[index], multiplier)
+
+
+class BudgetOptimizer(RuleBasedOptimizer):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        stores=None,
+        stores_path=None,
+        budget=TRANSPORT_BUDGET,
+        candidates=BUDGET_CANDIDATES,
+        max_iterations=BUDGET_MAX_ITERATIONS,
+        gap_tolerance=BUDGET_GAP_TOLERANCE,
+        max_workers=None,
+    ):
+        """
+        Args:
+            distance_matrix: Matrix of distances between stores
+            transport_cost_matrix: Matrix of transport costs between stores
+            stores: DataFrame with store_id, city, latitude and longitude
+            stores_path: Path of stores.csv (used when no dense matrices are loaded)
+            budget: Total transport cost (VND) the plan may spend
+            candidates: Cheapest donors considered per receiver and product (K)
+            max_iterations: Subgradient iterations
+            gap_tolerance: Relative duality gap at which to stop
+            max_workers: Worker processes for the subproblems (default: CPU count)
+        """
+        super().__init__(distance_matrix, transport_cost_matrix, stores=stores, stores_path=stores_path)
+        self.budget = budget
+        self.candidates = candidates
+        self.max_iterations = max_iterations
+        self.gap_tolerance = gap_tolerance
+        self.max_workers = max_workers
+        self.bounds = None
+        self.iterations = None
+
+    def load_matrices(self, distance_path, cost_path):
+        if os.path.exists(distance_path) and os.path.exists(cost_path):
+            super().load_matrices(distance_path, cost_path)
+        else:
+            self.load_stores(self.stores_path or os.path.join(os.path.dirname(distance_path), "stores.csv"))
+
+    def optimize(self, excess_inventory, needed_inventory):
+        """
+        Generate the transfer plan covering the most needed units within budget.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            DataFrame containing transfer recommendations
+        """
+        start_time = time()
+        self.logger_system.log_execution_start(
+            "budget_optimization",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "budget": self.budget,
+                "algorithm": "Lagrangian relaxation with subgradient updates",
+            },
+        )
+        self.bounds = None
+        self.iterations = None
+
+        subproblems = build_product_subproblems(self, excess_inventory, needed_inventory, self.candidates)
+        if not subproblems:
+            print("No excess or needed inventory found. No transfers needed.")
+            self.transfer_plan = pd.DataFrame()
+            self.logger_system.log_execution_end(
+                "budget_optimization", time() - start_time, {"transfers_generated": 0}
+            )
+            return self.transfer_plan
+
+        print(
+            f"Generating budget-constrained transfer plan ({self.budget:,.0f} VND budget, "
+            f"{len(subproblems)} product subproblems)..."
+        )
+
+        workers = min(self.max_workers or os.cpu_count() or 1, len(subproblems))
+        if workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(subproblems,)
+            ) as executor:
+                chunksize = max(1, len(subproblems) // (4 * workers))
+
+                def solve(multiplier):
+                    return list(
+                        executor.map(
+                            _solve_worker_subproblem,
+                            range(len(subproblems)),
+                            [multiplier] * len(subproblems),
+                            chunksize=chunksize,
+                        )
+                    )
+
+                best = self._subgradient(subproblems, solve)
+        else:
+            best = self._subgradient(
+                subproblems, lambda multiplier: [solve_subproblem(s, multiplier) for s in subproblems]
+            )
+
+        self.transfer_plan = self._build_plan(subproblems, best)
+        self._report(start_time)
+        return self.transfer_plan
+
+    def _subgradient(self, subproblems, solve):
+        """
+        Subgradient ascent on the budget multiplier.
+
+        Args:
+            subproblems: Product subproblems
+            solve: Function solving every subproblem at a multiplier
+
+        Returns:
+            Units per candidate lane of every subproblem, in the best feasible plan
+        """
+        costs = np.concatenate([s["cost"] for s in subproblems])
+        splits = np.cumsum([len(s["cost"]) for s in subproblems])[:-1]
+
+        multiplier, step_scale = 0.0, 1.0
+        upper, lower, best = np.inf, 0.0, np.zeros(len(costs), dtype=np.int64)
+        stalled = 0
+        history = []
+
+        for iteration in range(1, self.max_iterations + 1):
+            units = np.concatenate(solve(multiplier))
+            spent = float(units @ costs)
+            covered = int(units.sum())
+
+            # L(multiplier) is an upper bound on coverage within budget
+            dual = multiplier * self.budget + covered - multiplier * spent
+            if dual < upper - 1e-9:
+                upper, stalled = dual, 0
+            else:
+                stalled += 1
+
+            feasible = self._fit_budget(units, costs)
+            if feasible.sum() > lower or iteration == 1:
+                lower, best = float(feasible.sum()), feasible
+
+            history.append(
+                {
+                    "iteration": iteration,
+                    "multiplier": multiplier,
+                    "covered_units": covered,
+                    "transport_cost": spent,
+                    "upper_bound": upper,
+                    "lower_bound": lower,
+                }
+            )
+            self.logger_system.log_progress(
+                "budget_optimization",
+                f"Iteration {iteration}: lambda={multiplier:.3e}, {covered} units for {spent:,.0f} VND, "
+                f"bounds [{lower:,.0f}, {upper:,.0f}]",
+            )
+
+            # The unconstrained optimum fits the budget, or the bounds have met
+            if (multiplier == 0 and spent <= self.budget) or upper - lower <= self.gap_tolerance * upper:
+                break
+
+            # Polyak step towards the dual optimum; halve the scale when L stalls
+            if stalled >= 3:
+                step_scale, stalled = step_scale / 2, 0
+            violation = self.budget - spent
+            if violation == 0:
+                break
+            if multiplier == 0:
+                # First step: the price at which the plan's average unit just breaks even
+                multiplier = covered / spent if spent > 0 else 0.0
+            else:
+                step = step_scale * (dual - lower) / violation**2
+                multiplier = max(0.0, multiplier - step * violation)
+
+        self.iterations = pd.DataFrame(history)
+        self.bounds = {
+            "budget": self.budget,
+            "lower_bound": lower,
+            "upper_bound": upper,
+            "gap": upper - lower,
+            "relative_gap": (upper - lower) / upper if upper > 0 else 0.0,
+            "multiplier": multiplier,
+            "iterations": len(history),
+        }
+        return np.split(best, splits)
+
+    def _fit_budget(self, units, costs):
+        """Drop the most expensive units of a plan until it fits the budget."""
+        spent = float(units @ costs)
+        if spent <= self.budget:
+            return units
+
+        feasible = units.copy()
+        shipped = np.flatnonzero(units)
+        order = shipped[np.argsort(-costs[shipped], kind="stable")]
+        # Empty the costliest lanes while that still leaves cost to cut, then trim the next
+        lane_costs = units[order] * costs[order]
+        over = spent - self.budget - np.concatenate([[0.0], np.cumsum(lane_costs)])
+        emptied = int(np.argmax(over[1:] <= 0))
+        feasible[order[:emptied]] = 0
+        lane = order[emptied]
+        cut = int(np.ceil(over[emptied] / costs[lane] - 1e-9))
+        feasible[lane] -= min(cut, feasible[lane])
+        return feasible
+
+    def _build_plan(self, subproblems, units):
+        """Transfer lines of the lanes with units in the best feasible plan."""
+        lines = []
+        for subproblem, lane_units in zip(subproblems, units):
+            shipped = np.flatnonzero(lane_units)
+            if len(shipped) == 0:
+                continue
+            lines.append(
+                pd.DataFrame(
+                    {
+                        "from_store_id": subproblem["donor_ids"][subproblem["donor"][shipped]],
+                        "to_store_id": subproblem["receiver_ids"][subproblem["receiver"][shipped]],
+                        "product_id": subproblem["product_id"],
+                        "units": lane_units[shipped],
+                        "distance_km": subproblem["distance"][shipped],
+                        "transport_cost": lane_units[shipped] * subproblem["cost"][shipped],
+                    }
+                )
+            )
+        if not lines:
+            return pd.DataFrame()
+        return pd.concat(lines, ignore_index=True).sort_values(
+            ["from_store_id", "to_store_id", "product_id"], ignore_index=True
+        )
+
+    def _report(self, start_time):
+        total_units = int(self.transfer_plan["units"].sum()) if not self.transfer_plan.empty else 0
+        total_cost = float(self.transfer_plan["transport_cost"].sum()) if not self.transfer_plan.empty else 0.0
+
+        print("Budget-Constrained Transfer Plan Summary:")
+        print(f"- Total transfers: {len(self.transfer_plan)}")
+        print(f"- Total units to transfer: {total_units}")
+        print(f"- Total transport cost: {total_cost:,.0f} VND of {self.budget:,.0f} VND budget")
+        print(
+            f"- Coverage bound: {self.bounds['upper_bound']:,.0f} units "
+            f"(duality gap {self.bounds['gap']:,.0f} units, {self.bounds['relative_gap']:.2%})"
+        )
+        print(f"- Subgradient iterations: {self.bounds['iterations']}")
+
+        self.logger_system.log_execution_end(
+            "budget_optimization",
+            time() - start_time,
+            {
+                "transfers_generated": len(self.transfer_plan),
+                "total_units": total_units,
+                "total_costs": total_cost,
+                "upper_bound": self.bounds["upper_bound"],
+                "relative_gap": self.bounds["relative_gap"],
+            },
+        )
@@ -0,0 +1,430 @@
+"""
+Shipment consolidation optimizer.
+
+The other engines price every transfer line on its own at a per-unit lane
+cost, so ten products sent from one store to another cost the same as ten
+separate shipments. Here a lane (origin store -> destination store) costs a
+fixed charge per truck trip plus the per-unit lane cost of every unit on it,
+which rewards putting many products on the same lane:
+
+1. Lane-level greedy: receivers are served in order of total need. For each
+   receiver, the K nearest donor stores are candidate lanes; the lane with the
+   lowest cost per unit covered (extra trips plus unit costs, over the units of
+   all its products that it can cover at once) is opened or topped up until the
+   receiver's needs are met. Only donors holding a product the receiver needs
+   are candidates; receivers left short once their candidates run dry get
+   another search, with twice as many candidates, among the donors still
+   holding stock.
+2. Local merges over a lane index (receiver -> open lanes): the smallest lanes
+   of each receiver are closed when every line on them fits on the receiver's
+   other open lanes (within their donors' remaining excess) for less than the
+   trips they save.
+
+Each plan line carries its unit cost plus a pro-rata share of its lane's trip
+cost; the lane-grouped manifest is kept on the optimizer.
+"""
+
+import os
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    CONSOLIDATION_CANDIDATES,
+    CONSOLIDATION_TRIP_COST,
+    CONSOLIDATION_TRUCK_CAPACITY,
+)
+from engine.rule_based import RuleBasedOptimizer
+
+
+# Lanes priced per block of the candidate search (donor stores x receivers)
+CANDIDATE_BLOCK_LANES = 2**22
+
+
+def trips_needed(units, capacity):
+    """Truck trips carrying units (0 for an empty lane)."""
+    return np.ceil(np.asarray(units, dtype=np.float64) / capacity)
+
+
+class ConsolidationOptimizer(RuleBasedOptimizer):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        stores=None,
+        stores_path=None,
+        trip_cost=CONSOLIDATION_TRIP_COST,
+        truck_capacity=CONSOLIDATION_TRUCK_CAPACITY,
+        candidates=CONSOLIDATION_CANDIDATES,
+    ):
+        """
+        Args:
+            distance_matrix: Matrix of distances between stores
+            transport_cost_matrix: Matrix of transport costs between stores
+            stores: DataFrame with store_id, city, latitude and longitude
+            stores_path: Path of stores.csv (used when no dense matrices are loaded)
+            trip_cost: Fixed cost (VND) of one truck trip on a lane
+            truck_capacity: Units carried per trip
+            candidates: Nearest donor stores considered per receiver (K)
+        """
+        super().__init__(distance_matrix, transport_cost_matrix, stores=stores, stores_path=stores_path)
+        self.trip_cost = trip_cost
+        self.truck_capacity = truck_capacity
+        self.candidates = candidates
+        self.manifest = None
+
+    def load_matrices(self, distance_path, cost_path):
+        if os.path.exists(distance_path) and os.path.exists(cost_path):
+            super().load_matrices(distance_path, cost_path)
+        else:
+            self.load_stores(self.stores_path or os.path.join(os.path.dirname(distance_path), "stores.csv"))
+
+    def optimize(self, excess_inventory, needed_inventory):
+        """
+        Generate a lane-consolidated transfer plan.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            DataFrame containing transfer recommendations
+        """
+        start_time = time()
+        self.logger_system.log_execution_start(
+            "consolidation_optimization",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "trip_cost": self.trip_cost,
+                "truck_capacity": self.truck_capacity,
+                "algorithm": "Lane-level greedy with local merges",
+            },
+        )
+
+        if excess_inventory.empty or needed_inventory.empty:
+            print("No excess or needed inventory found. No transfers needed.")
+            self.transfer_plan = pd.DataFrame()
+            self.manifest = None
+            self.logger_system.log_execution_end(
+                "consolidation_optimization", time() - start_time, {"transfers_generated": 0}
+            )
+            return self.transfer_plan
+
+        print(
+            f"Generating consolidated transfer plan ({self.trip_cost:,.0f} VND per trip, "
+            f"{self.truck_capacity} units per truck)..."
+        )
+
+        excess = excess_inventory.groupby(
+            [excess_inventory["store_id"].astype(int), excess_inventory["product_id"].astype(int)]
+        )["excess_units"].sum()
+        needed = needed_inventory.groupby(
+            [needed_inventory["store_id"].astype(int), needed_inventory["product_id"].astype(int)]
+        )["needed_units"].sum()
+
+        # Dense (stores x products) grids over the products both sides share
+        product_ids = np.intersect1d(
+            excess.index.get_level_values(1).unique(), needed.index.get_level_values(1).unique()
+        )
+        excess = excess[excess.index.get_level_values(1).isin(product_ids) & (excess > 0)]
+        needed = needed[needed.index.get_level_values(1).isin(product_ids) & (needed > 0)]
+        if excess.empty or needed.empty:
+            print("No product has both excess and needed inventory. No transfers needed.")
+            self.transfer_plan = pd.DataFrame()
+            self.manifest = None
+            self.logger_system.log_execution_end(
+                "consolidation_optimization", time() - start_time, {"transfers_generated": 0}
+            )
+            return self.transfer_plan
+
+        self.donor_ids = excess.index.get_level_values(0).unique().to_numpy()
+        self.receiver_ids = needed.index.get_level_values(0).unique().to_numpy()
+        self.product_ids = product_ids
+        self.available = self._grid(excess, self.donor_ids)
+        need = self._grid(needed, self.receiver_ids)
+
+        self.lanes = {}
+        self.receiver_lanes = {}
+        self.lane_prices = {}
+
+        self.logger_system.log_progress(
+            "consolidation_optimization",
+            f"Lane greedy over {len(self.receiver_ids)} receivers and {len(self.donor_ids)} donor stores",
+        )
+        # Receivers left short when their candidates run dry get a wider
+        # candidate search among the donors still holding stock
+        pending = np.argsort(-need.sum(axis=1), kind="stable")
+        k = self.candidates
+        while len(pending):
+            donors = np.flatnonzero(self.available.any(axis=1))
+            shipped = self.available.sum()
+            candidates = self._find_candidates(pending, donors, need, k)
+            for r, (candidate_donors, distances, costs) in zip(pending.tolist(), zip(*candidates)):
+                self._serve_receiver(r, need[r], candidate_donors, distances, costs)
+
+            if self.available.sum() == shipped:
+                break
+            servable = (need > 0) & self.available.any(axis=0)[None, :]
+            pending = pending[servable[pending].any(axis=1)]
+            k *= 2
+
+        opened = len(self.lanes)
+        merged = self._merge_lanes()
+        self.logger_system.log_progress(
+            "consolidation_optimization", f"Opened {opened} lanes, closed {merged} by local merges"
+        )
+
+        self.transfer_plan, self.manifest = self._build_plan()
+        self._report(start_time, merged)
+        return self.transfer_plan
+
+    def _grid(self, units, store_ids):
+        """Units per (store, product) as a dense array aligned with store_ids and product_ids."""
+        grid = np.zeros((len(store_ids), len(self.product_ids)), dtype=np.int64)
+        grid[
+            np.searchsorted(store_ids, units.index.get_level_values(0)),
+            np.searchsorted(self.product_ids, units.index.get_level_values(1)),
+        ] = units.to_numpy(dtype=np.int64)
+        return grid
+
+    def _find_candidates(self, receivers, donors, need, k):
+        """
+        K cheapest donor stores per receiver among those holding any product it
+        needs, from lane blocks of bounded size.
+
+        Args:
+            receivers: Receiver positions in receiver_ids
+            donors: Donor positions in donor_ids to search
+            need: Units needed per (receiver, product)
+            k: Candidates per receiver
+
+        Returns:
+            Tuple of (donor positions, distances, unit costs), each (receivers x K);
+            unit cost is inf where fewer than K donors can help
+        """
+        k = min(k, len(donors))
+        candidate_donors = np.empty((len(receivers), k), dtype=np.int64)
+        candidate_distances = np.empty((len(receivers), k))
+        candidate_costs = np.empty((len(receivers), k))
+        holds = (self.available[donors] > 0).astype(np.float32)
+
+        block = max(1, CANDIDATE_BLOCK_LANES // max(len(donors), 1))
+        for start in range(0, len(receivers), block):
+            end = min(start + block, len(receivers))
+            distances, costs = self.lane_block(self.donor_ids[donors], self.receiver_ids[receivers[start:end]])
+            helps = holds @ (need[receivers[start:end]] > 0).T.astype(np.float32) > 0
+            costs[~helps] = np.inf
+            nearest = np.argpartition(costs, k - 1, axis=0)[:k].T
+            columns = np.arange(end - start)[:, None]
+            candidate_donors[start:end] = donors[nearest]
+            candidate_distances[start:end] = distances[nearest, columns]
+            candidate_costs[start:end] = costs[nearest, columns]
+
+        return candidate_donors, candidate_distances, candidate_costs
+
+    def _serve_receiver(self, r, need, donors, distances, costs):
+        """
+        Open or top up lanes to one receiver, cheapest per unit covered first.
+
+        Args:
+            r: Receiver position in receiver_ids
+            need: Units needed per product (updated in place)
+            donors: Candidate donor positions in donor_ids
+            distances: Lane distance of each candidate
+            costs: Unit cost of each candidate lane (inf = unusable)
+        """
+        products = np.flatnonzero(need)
+        usable = np.isfinite(costs)
+        donors, distances, costs = donors[usable], distances[usable], costs[usable]
+        lanes = self.receiver_lanes.get(r, ())
+        loaded = np.array([self.lanes[(d, r)]["units"] if d in lanes else 0 for d in donors.tolist()])
+
+        while len(donors) and need[products].any():
+            covered = np.minimum(self.available[np.ix_(donors, products)], need[products][None, :])
+            units = covered.sum(axis=1)
+            if not units.any():
+                break
+
+            extra_trips = trips_needed(loaded + units, self.truck_capacity) - trips_needed(
+                loaded, self.truck_capacity
+            )
+            with np.errstate(divide="ignore", invalid="ignore"):
+                per_unit = np.where(
+                    units > 0, (extra_trips * self.trip_cost + units * costs) / units, np.inf
+                )
+
+            best = int(np.argmin(per_unit))
+            d = int(donors[best])
+            lines = covered[best]
+            self.available[d, products] -= lines
+            need[products] -= lines
+            loaded[best] += units[best]
+
+            lane = self._open_lane(d, r, distances[best], costs[best])
+            for p, shipped in zip(products[lines > 0].tolist(), lines[lines > 0].tolist()):
+                lane["lines"][p] = lane["lines"].get(p, 0) + shipped
+            lane["units"] += int(units[best])
+
+    def _open_lane(self, d, r, distance, unit_cost):
+        """Lane (donor d -> receiver r) of the lane index, created empty when new."""
+        if (d, r) not in self.lanes:
+            self.lanes[(d, r)] = {"lines": {}, "units": 0}
+            self.receiver_lanes.setdefault(r, set()).add(d)
+            self.lane_prices[(d, r)] = (float(distance), float(unit_cost))
+        return self.lanes[(d, r)]
+
+    def _merge_lanes(self):
+        """
+        Close lanes whose lines fit more cheaply on the receiver's other open lanes.
+
+        Returns:
+            Number of lanes closed
+        """
+        closed = 0
+        for (d, r) in sorted(self.lanes, key=lambda key: self.lanes[key]["units"]):
+            others = self.receiver_lanes[r] - {d}
+            if (d, r) not in self.lanes or not others:
+                continue
+            lane = self.lanes[(d, r)]
+            # Other lanes of the receiver, cheapest per unit first
+            others = sorted(others, key=lambda o: self.lane_prices[(o, r)][1])
+
+            saved = trips_needed(lane["units"], self.truck_capacity) * self.trip_cost + (
+                lane["units"] * self.lane_prices[(d, r)][1]
+            )
+            added = 0.0
+            extra = {o: 0 for o in others}
+            moves = []
+            fits = True
+            for p, units in lane["lines"].items():
+                for o in others:
+                    moved = min(units, int(self.available[o, p]))
+                    if moved <= 0:
+                        continue
+                    moves.append((o, p, moved))
+                    extra[o] += moved
+                    added += moved * self.lane_prices[(o, r)][1]
+                    units -= moved
+                    if units == 0:
+                        break
+                if units > 0:
+                    fits = False
+                    break
+            if not fits:
+                continue
+
+            for o, units in extra.items():
+                loaded = self.lanes[(o, r)]["units"]
+                added += (
+                    trips_needed(loaded + units, self.truck_capacity) - trips_needed(loaded, self.truck_capacity)
+                ) * self.trip_cost
+            if added >= saved:
+                continue
+
+            for p, units in lane["lines"].items():
+                self.available[d, p] += units
+            for o, p, moved in moves:
+                self.available[o, p] -= moved
+                target = self.lanes[(o, r)]
+                target["lines"][p] = target["lines"].get(p, 0) + moved
+                target["units"] += moved
+            del self.lanes[(d, r)]
+            self.receiver_lanes[r].discard(d)
+            closed += 1
+
+        return closed
+
+    def _build_plan(self):
+        """
+        Transfer lines and lane manifest of the lane index.
+
+        Returns:
+            Tuple of (transfer plan DataFrame, manifest DataFrame)
+        """
+        lines = []
+        manifest = []
+        for (d, r), lane in self.lanes.items():
+            distance, unit_cost = self.lane_prices[(d, r)]
+            trips = int(trips_needed(lane["units"], self.truck_capacity))
+            lane_trip_cost = trips * self.trip_cost
+            from_store_id, to_store_id = int(self.donor_ids[d]), int(self.receiver_ids[r])
+
+            for p, units in lane["lines"].items():
+                lines.append(
+                    {
+                        "from_store_id": from_store_id,
+                        "to_store_id": to_store_id,
+                        "product_id": int(self.product_ids[p]),
+                        "units": int(units),
+                        "distance_km": distance,
+                        "transport_cost": units * unit_cost + lane_trip_cost * units / lane["units"],
+                    }
+                )
+            manifest.append(
+                {
+                    "from_store_id": from_store_id,
+                    "to_store_id": to_store_id,
+                    "distance_km": distance,
+                    "products": len(lane["lines"]),
+                    "units": lane["units"],
+                    "trips": trips,
+                    "trip_cost": lane_trip_cost,
+                    "unit_cost": lane["units"] * unit_cost,
+                    "total_cost": lane_trip_cost + lane["units"] * unit_cost,
+                }
+            )
+
+        manifest = pd.DataFrame(manifest).sort_values(["from_store_id", "to_store_id"], ignore_index=True)
+        plan = pd.DataFrame(lines).sort_values(["from_store_id", "to_store_id", "product_id"], ignore_index=True)
+        return plan, manifest
+
+    def build_manifest(self, transfer_plan):
+        """
+        Lane manifest of a plan whose lines carry their lane's trip cost, e.g.
+        after post-processing changed the plan's distances.
+
+        Args:
+            transfer_plan: DataFrame with from_store_id, to_store_id, product_id,
+                units, distance_km and transport_cost
+
+        Returns:
+            Manifest DataFrame (one row per lane)
+        """
+        lanes = transfer_plan.groupby(["from_store_id", "to_store_id"], as_index=False).agg(
+            distance_km=("distance_km", "first"),
+            products=("product_id", "nunique"),
+            units=("units", "sum"),
+            total_cost=("transport_cost", "sum"),
+        )
+        lanes["trips"] = trips_needed(lanes["units"], self.truck_capacity).astype(int)
+        lanes["trip_cost"] = lanes["trips"] * self.trip_cost
+        lanes["unit_cost"] = lanes["total_cost"] - lanes["trip_cost"]
+        return lanes[
+            ["from_store_id", "to_store_id", "distance_km", "products", "units", "trips", "trip_cost", "unit_cost", "total_cost"]
+        ]
+
+    def _report(self, start_time, merged):
+        total_units = int(self.transfer_plan["units"].sum())
+        total_cost = float(self.manifest["total_cost"].sum())
+        trip_cost = float(self.manifest["trip_cost"].sum())
+
+        print("Consolidated Transfer Plan Summary:")
+        print(f"- Total transfers: {len(self.transfer_plan)} on {len(self.manifest)} lanes")
+        print(f"- Total units to transfer: {total_units}")
+        print(f"- Truck trips: {int(self.manifest['trips'].sum())} ({merged} lanes merged away)")
+        print(f"- Total transport cost: {total_cost:,.0f} VND (trips {trip_cost:,.0f} VND)")
+        print(f"- Average products per lane: {self.manifest['products'].mean():.1f}")
+
+        self.logger_system.log_execution_end(
+            "consolidation_optimization",
+            time() - start_time,
+            {
+                "transfers_generated": len(self.transfer_plan),
+                "lanes": len(self.manifest),
+                "trips": int(self.manifest["trips"].sum()),
+                "total_units": total_units,
+                "total_costs": total_cost,
+            },
+        )
@@ -0,0 +1,225 @@
+"""
+Batched demand forecasting.
+
+Every (store, product) series is a column of a dense day x series matrix of
+daily quantities (zero on days without sales), and all models are fitted with
+array operations over whole batches of columns:
+
+- mean: flat average daily demand over the history
+- ses: simple exponential smoothing, alpha picked per series from a grid by
+  one-step-ahead squared error
+- seasonal_ses: exponential smoothing of the deseasonalized series, with
+  multiplicative month-of-year indices pooled per (city, category)
+
+The model of each series is chosen by its error on a holdout of the last
+days, then refitted on the full history. Forecasts are per calendar day and
+then put on the basis of the flat average of InventoryAnalyzer (quantity per
+day with sales) by dividing by the series' share of days with sales, so the
+mean model reproduces the flat average and --forecast changes only the
+forecast, not the demand basis. The only Python loop runs over days
+(inside exponential smoothing); series are processed in batches so memory
+stays bounded for millions of series.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    FORECAST_ALPHAS,
+    FORECAST_BATCH_SERIES,
+    FORECAST_HOLDOUT_DAYS,
+    FORECAST_HORIZON_DAYS,
+)
+
+
+MODELS = ("mean", "ses", "seasonal_ses")
+
+
+def exponential_smoothing(series, alphas):
+    """
+    Simple exponential smoothing of many series for several alphas at once.
+
+    Args:
+        series: (days x series) array
+        alphas: Smoothing factors to try
+
+    Returns:
+        Tuple of (final level per series, index of the chosen alpha per series)
+    """
+    alphas = np.asarray(alphas, dtype=np.float64)[:, None]
+    warmup = min(7, len(series))
+    level = np.repeat(series[:warmup].mean(axis=0)[None, :], len(alphas), axis=0)
+    squared_error = np.zeros_like(level)
+
+    for t in range(len(series)):
+        error = series[t] - level
+        squared_error += error * error
+        level += alphas * error
+
+    best = np.argmin(squared_error, axis=0)
+    return level[best, np.arange(series.shape[1])], best
+
+
+class DemandForecaster:
+    def __init__(
+        self,
+        alphas=FORECAST_ALPHAS,
+        holdout_days=FORECAST_HOLDOUT_DAYS,
+        horizon_days=FORECAST_HORIZON_DAYS,
+        batch_series=FORECAST_BATCH_SERIES,
+    ):
+        """
+        Args:
+            alphas: Exponential smoothing factors tried per series
+            holdout_days: Trailing days used to choose the model of each series
+            horizon_days: Days the forecast daily demand is averaged over
+            batch_series: Series fitted per batch
+        """
+        self.alphas = alphas
+        self.holdout_days = holdout_days
+        self.horizon_days = horizon_days
+        self.batch_series = batch_series
+
+    def seasonal_indices(self, sales_df, dates):
+        """
+        Month-of-year demand indices per (city, category).
+
+        Args:
+            sales_df: Sales with date, quantity and optionally city/category
+            dates: Calendar days of the history
+
+        Returns:
+            DataFrame indexed by (city, category) with one column per month 1..12
+            (1.0 for months without history)
+        """
+        groups = [column for column in ("city", "category") if column in sales_df.columns]
+        sales = sales_df.assign(month=sales_df["date"].dt.month, _all="all")
+        groups = groups or ["_all"]
+
+        days_per_month = pd.Series(dates.month).value_counts()
+        monthly = sales.groupby(groups + ["month"])["quantity"].sum().unstack("month")
+        daily_rate = monthly.div(days_per_month.reindex(monthly.columns), axis=1)
+        indices = daily_rate.div(
+            sales.groupby(groups)["quantity"].sum() / len(dates), axis=0
+        )
+        # Bounded so a month without sales cannot zero out (or explode) a forecast
+        return indices.reindex(columns=range(1, 13)).fillna(1.0).clip(0.1, 10.0)
+
+    def forecast(self, sales_df, series_keys, stores=None, products=None):
+        """
+        Forecast the daily demand of every series.
+
+        Args:
+            sales_df: Sales history (date, store_id, product_id, quantity)
+            series_keys: DataFrame with the store_id and product_id of each series
+            stores: Optional stores DataFrame (city) for seasonal pooling
+            products: Optional products DataFrame (category) for seasonal pooling
+
+        Returns:
+            DataFrame aligned with series_keys: forecast_daily_sales, forecast_model
+        """
+        sales = sales_df[["date", "store_id", "product_id", "quantity"]].copy()
+        sales["date"] = pd.to_datetime(sales["date"])
+        keys = series_keys[["store_id", "product_id"]].astype(int).reset_index(drop=True)
+
+        if isinstance(stores, pd.DataFrame):
+            keys["city"] = keys["store_id"].map(stores.set_index("store_id")["city"])
+            sales["city"] = sales["store_id"].map(stores.set_index("store_id")["city"])
+        if isinstance(products, pd.DataFrame):
+            keys["category"] = keys["product_id"].map(products.set_index("product_id")["category"])
+            sales["category"] = sales["product_id"].map(products.set_index("product_id")["category"])
+
+        start = sales["date"].min()
+        dates = pd.date_range(start, sales["date"].max())
+        num_days = len(dates)
+
+        # Seasonal index of every (group, day), and of the forecast horizon
+        indices = self.seasonal_indices(sales, dates)
+        groups = [column for column in ("city", "category") if column in keys.columns]
+        if groups:
+            group_keys = pd.MultiIndex.from_frame(keys[groups]) if len(groups) > 1 else keys[groups[0]]
+            group_of_series = indices.index.get_indexer(group_keys)
+        else:
+            group_of_series = np.zeros(len(keys), dtype=np.int64)
+        season = np.vstack([indices.to_numpy(dtype=np.float64), np.ones((1, 12))])
+        group_of_series[group_of_series < 0] = len(season) - 1
+        day_months = dates.month.to_numpy() - 1
+        horizon_months = pd.date_range(dates[-1] + pd.Timedelta(days=1), periods=self.horizon_days).month.to_numpy() - 1
+        holdout = self.holdout_days if num_days >= 2 * self.holdout_days else 0
+
+        # Sales rows sorted by series so each batch is a contiguous slice
+        series_of_sale = pd.MultiIndex.from_frame(keys[["store_id", "product_id"]]).get_indexer(
+            pd.MultiIndex.from_frame(sales[["store_id", "product_id"]].astype(int))
+        )
+        known = series_of_sale >= 0
+        order = np.argsort(series_of_sale[known])
+        sale_series = series_of_sale[known][order]
+        sale_days = (sales["date"] - start).dt.days.to_numpy()[known][order]
+        sale_quantities = sales["quantity"].to_numpy(dtype=np.float64)[known][order]
+
+        forecasts = np.empty(len(keys))
+        models = np.empty(len(keys), dtype=object)
+        # Days in the history per sales row of each series (0 for series without sales)
+        sale_rows = np.bincount(sale_series, minlength=len(keys))
+        sale_day_scale = np.divide(
+            num_days, sale_rows, out=np.zeros(len(keys)), where=sale_rows > 0
+        )
+
+        for batch_start in range(0, len(keys), self.batch_series):
+            batch_end = min(batch_start + self.batch_series, len(keys))
+            lo, hi = np.searchsorted(sale_series, [batch_start, batch_end])
+
+            width = batch_end - batch_start
+            demand = np.bincount(
+                sale_days[lo:hi] * width + (sale_series[lo:hi] - batch_start),
+                weights=sale_quantities[lo:hi],
+                minlength=num_days * width,
+            ).reshape(num_days, width)
+
+            batch_season = season[group_of_series[batch_start:batch_end]]
+            forecasts[batch_start:batch_end], chosen = self._fit_batch(
+                demand, batch_season[:, day_months].T, batch_season[:, horizon_months].mean(axis=1), holdout
+            )
+            models[batch_start:batch_end] = np.asarray(MODELS, dtype=object)[chosen]
+
+        forecasts *= sale_day_scale
+
+        return pd.DataFrame(
+            {"forecast_daily_sales": forecasts, "forecast_model": models},
+            index=series_keys.index,
+        )
+
+    def _fit_batch(self, demand, day_season, horizon_season, holdout):
+        """
+        Choose and fit the model of every series of a batch.
+
+        Args:
+            demand: (days x series) daily quantities
+            day_season: (days x series) seasonal index of each day
+            horizon_season: Mean seasonal index of the forecast horizon per series
+            holdout: Trailing days used for model selection (0 = no selection)
+
+        Returns:
+            Tuple of (forecast demand per calendar day, chosen model index) per series
+        """
+        if holdout:
+            train, test = demand[:-holdout], demand[-holdout:]
+            test_season = day_season[-holdout:]
+            candidates = self._predict(train, day_season[:-holdout], test_season.mean(axis=0))
+            errors = np.stack(
+                [np.abs(test - prediction[None, :] * scale).mean(axis=0)
+                 for prediction, scale in zip(candidates, (1.0, 1.0, test_season / test_season.mean(axis=0)))]
+            )
+            chosen = np.argmin(errors, axis=0)
+        else:
+            chosen = np.full(demand.shape[1], MODELS.index("ses"))
+
+        predictions = np.stack(self._predict(demand, day_season, horizon_season))
+        return predictions[chosen, np.arange(demand.shape[1])], chosen
+
+    def _predict(self, demand, day_season, future_season):
+        """Forecast daily demand of every model (same order as MODELS)."""
+        mean = demand.mean(axis=0)
+        ses, _ = exponential_smoothing(demand, self.alphas)
+        deseasonalized, _ = exponential_smoothing(demand / day_season, self.alphas)
+        return mean, ses, deseasonalized * future_season
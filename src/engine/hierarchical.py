@@ -0,0 +1,440 @@
+"""
+Hierarchical (city-cluster) optimizer for very large store networks.
+
+Intercity lanes are far more expensive than lanes inside a city, so most
+transfers should stay local. The problem is decomposed by city:
+
+1. Every city is balanced independently, in parallel worker processes, with a
+   nearest-donor allocation improved by local search on the city's cost block.
+2. The residual excess and need of each city are aggregated per product and
+   allocated between cities using the distances between city centroids.
+3. Each intercity allocation is disaggregated to concrete stores: the donors
+   closest to the destination city ship to its receivers with the largest
+   residual need.
+
+Lane costs are computed from store coordinates (utils.geo), so no
+network-wide distance matrix is built; memory is bounded by the largest city.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from engine.local_search import LocalSearchImprover
+from engine.rule_based import RuleBasedOptimizer
+from utils.geo import haversine_km, transport_cost_per_unit
+
+
+def allocate_nearest(supply, demand, unit_costs):
+    """
+    Greedy nearest-supplier allocation of one product: consumers with the
+    largest demand are served first, each from its cheapest suppliers.
+
+    Args:
+        supply: Array of units available per supplier
+        demand: Array of units needed per consumer
+        unit_costs: (suppliers x consumers) array of unit costs (inf = unusable)
+
+    Returns:
+        List of (supplier index, consumer index, units)
+    """
+    supply = np.asarray(supply, dtype=np.float64).copy()
+    allocations = []
+
+    for j in np.argsort(-np.asarray(demand), kind="stable"):
+        need = demand[j]
+        for i in np.argsort(unit_costs[:, j], kind="stable"):
+            if need <= 0 or not np.isfinite(unit_costs[i, j]):
+                break
+            if supply[i] <= 0:
+                continue
+            units = min(need, supply[i])
+            allocations.append((int(i), int(j), units))
+            supply[i] -= units
+            need -= units
+
+    return allocations
+
+
+def city_cost_block(city_stores):
+    """
+    Distance and unit cost matrices between the stores of one city.
+
+    Args:
+        city_stores: DataFrame indexed by store_id with latitude and longitude
+
+    Returns:
+        Tuple of (distance DataFrame, transport cost DataFrame)
+    """
+    lat = city_stores["latitude"].to_numpy()
+    lon = city_stores["longitude"].to_numpy()
+    distances = haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    costs = transport_cost_per_unit(distances, True)
+    np.fill_diagonal(costs, np.nan)
+
+    store_ids = city_stores.index
+    return (
+        pd.DataFrame(distances, index=store_ids, columns=store_ids),
+        pd.DataFrame(costs, index=store_ids, columns=store_ids),
+    )
+
+
+def balance_city(city, city_stores, excess_inventory, needed_inventory):
+    """
+    Balance excess and need inside one city (executed in a worker process).
+
+    Args:
+        city: City name
+        city_stores: DataFrame indexed by store_id with latitude and longitude
+        excess_inventory: Excess rows (store_id, product_id, excess_units) of the city
+        needed_inventory: Needed rows (store_id, product_id, needed_units) of the city
+
+    Returns:
+        Tuple of (transfer plan, residual excess, residual need) DataFrames
+    """
+    distance_df, cost_df = city_cost_block(city_stores)
+    positions = {store_id: i for i, store_id in enumerate(city_stores.index)}
+    unit_costs = np.nan_to_num(cost_df.to_numpy(), nan=np.inf)
+
+    excess_by_product = dict(tuple(excess_inventory.groupby("product_id")))
+
+    transfers = []
+    for product_id, product_needed in needed_inventory.groupby("product_id"):
+        product_excess = excess_by_product.get(product_id)
+        if product_excess is None:
+            continue
+
+        donors = product_excess["store_id"].to_numpy()
+        receivers = product_needed["store_id"].to_numpy()
+        block = unit_costs[
+            np.ix_([positions[s] for s in donors], [positions[s] for s in receivers])
+        ]
+
+        for i, j, units in allocate_nearest(
+            product_excess["excess_units"].to_numpy(),
+            product_needed["needed_units"].to_numpy(),
+            block,
+        ):
+            transfers.append(
+                {
+                    "from_store_id": int(donors[i]),
+                    "to_store_id": int(receivers[j]),
+                    "product_id": int(product_id),
+                    "units": int(units),
+                }
+            )
+
+    transfer_plan = pd.DataFrame(
+        transfers, columns=["from_store_id", "to_store_id", "product_id", "units"]
+    )
+
+    if not transfer_plan.empty:
+        improver = LocalSearchImprover(distance_df, cost_df)
+        improver.load_plan(transfer_plan, excess_inventory)
+        improver.improve()
+        transfer_plan = improver.to_dataframe()
+
+    shipped = transfer_plan.groupby(["from_store_id", "product_id"])["units"].sum()
+    received = transfer_plan.groupby(["to_store_id", "product_id"])["units"].sum()
+
+    residual_excess = excess_inventory[["store_id", "product_id", "excess_units"]].copy()
+    residual_excess["excess_units"] -= (
+        shipped.reindex(pd.MultiIndex.from_frame(residual_excess[["store_id", "product_id"]]))
+        .fillna(0)
+        .to_numpy()
+    )
+    residual_needed = needed_inventory[["store_id", "product_id", "needed_units"]].copy()
+    residual_needed["needed_units"] -= (
+        received.reindex(pd.MultiIndex.from_frame(residual_needed[["store_id", "product_id"]]))
+        .fillna(0)
+        .to_numpy()
+    )
+
+    return (
+        transfer_plan,
+        residual_excess[residual_excess["excess_units"] > 0],
+        residual_needed[residual_needed["needed_units"] > 0],
+    )
+
+
+class HierarchicalOptimizer(RuleBasedOptimizer):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        stores=None,
+        stores_path=None,
+        max_workers=None,
+    ):
+        """
+        Args:
+            distance_matrix: Unused; lanes are priced from store coordinates
+            transport_cost_matrix: Unused; lanes are priced from store coordinates
+            stores: DataFrame with store_id, city, latitude and longitude
+            stores_path: Path of stores.csv (loaded on first use if stores is None)
+            max_workers: Worker processes for the per-city phase (default: CPU count)
+        """
+        super().__init__(
+            distance_matrix, transport_cost_matrix, stores=stores, stores_path=stores_path
+        )
+        self.max_workers = max_workers
+
+    def load_matrices(self, distance_path, cost_path):
+        """
+        Load store coordinates from the stores.csv next to the matrices.
+        The dense matrices themselves are not needed and not loaded.
+        """
+        self.load_stores(self.stores_path or os.path.join(os.path.dirname(distance_path), "stores.csv"))
+
+    def optimize(self, excess_inventory, needed_inventory):
+        """
+        Generate a transfer plan city by city, then between cities.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            DataFrame containing transfer recommendations
+        """
+        start_time = time()
+
+        self.load_stores()
+
+        stores = self.stores.set_index("store_id")
+        city_of = stores["city"]
+
+        self.logger_system.log_execution_start(
+            "hierarchical_optimization",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "stores": len(stores),
+                "cities": city_of.nunique(),
+                "algorithm": "City-cluster hierarchical decomposition",
+            },
+        )
+
+        if excess_inventory.empty or needed_inventory.empty:
+            print("No excess or needed inventory found. No transfers needed.")
+            self.transfer_plan = pd.DataFrame()
+            self.logger_system.log_execution_end(
+                "hierarchical_optimization", time() - start_time, {"transfers_generated": 0}
+            )
+            return self.transfer_plan
+
+        excess = excess_inventory[["store_id", "product_id", "excess_units"]].astype(
+            {"store_id": int, "product_id": int}
+        )
+        needed = needed_inventory[["store_id", "product_id", "needed_units"]].astype(
+            {"store_id": int, "product_id": int}
+        )
+        excess["city"] = excess["store_id"].map(city_of)
+        needed["city"] = needed["store_id"].map(city_of)
+
+        # Phase 1: balance every city independently
+        intra_plans, residual_excess, residual_needed = self._balance_cities(
+            stores, excess, needed
+        )
+        intra_plan = pd.concat(intra_plans, ignore_index=True) if intra_plans else pd.DataFrame()
+
+        message = (
+            f"Intra-city phase: {len(intra_plan)} transfers in {city_of.nunique()} cities, "
+            f"{residual_needed['needed_units'].sum():,.0f} units of need left"
+        )
+        print(message)
+        self.logger_system.log_progress("hierarchical_optimization", message)
+
+        # Phase 2 + 3: allocate residuals between cities, then disaggregate to stores
+        inter_plan = self._balance_between_cities(stores, residual_excess, residual_needed)
+
+        message = f"Intercity phase: {len(inter_plan)} transfers"
+        print(message)
+        self.logger_system.log_progress("hierarchical_optimization", message)
+
+        plans = [plan for plan in (intra_plan, inter_plan) if not plan.empty]
+        self.transfer_plan = pd.concat(plans, ignore_index=True) if plans else pd.DataFrame()
+
+        results = {"transfers_generated": len(self.transfer_plan)}
+        if not self.transfer_plan.empty:
+            self.transfer_plan = self.transfer_plan[
+                ["from_store_id", "to_store_id", "product_id", "units", "distance_km", "transport_cost"]
+            ]
+            total_units = self.transfer_plan["units"].sum()
+            total_cost = self.transfer_plan["transport_cost"].sum()
+
+            print("Hierarchical Transfer Plan Summary:")
+            print(f"- Total transfers: {len(self.transfer_plan)} ({len(inter_plan)} intercity)")
+            print(f"- Total units to transfer: {total_units}")
+            print(f"- Total transport cost: {total_cost:,.0f} VND")
+
+            results.update(
+                {
+                    "intra_city_transfers": len(intra_plan),
+                    "intercity_transfers": len(inter_plan),
+                    "total_units": total_units,
+                    "total_costs": total_cost,
+                }
+            )
+        else:
+            print("No transfers recommended.")
+
+        self.logger_system.log_execution_end(
+            "hierarchical_optimization", time() - start_time, results
+        )
+        return self.transfer_plan
+
+    def _balance_cities(self, stores, excess, needed):
+        """Run balance_city for every city with both excess and need."""
+        tasks = []
+        residual_excess = [excess[~excess["city"].isin(needed["city"])]]
+        residual_needed = [needed[~needed["city"].isin(excess["city"])]]
+
+        stores_by_city = dict(tuple(stores.groupby("city")[["latitude", "longitude"]]))
+        excess_by_city = dict(tuple(excess.groupby("city")))
+        needed_by_city = dict(tuple(needed.groupby("city")))
+
+        for city in sorted(set(excess_by_city) & set(needed_by_city)):
+            tasks.append(
+                (
+                    city,
+                    stores_by_city[city],
+                    excess_by_city[city].drop(columns="city"),
+                    needed_by_city[city].drop(columns="city"),
+                )
+            )
+
+        workers = min(self.max_workers or os.cpu_count() or 1, len(tasks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(balance_city, *zip(*tasks)))
+        else:
+            results = [balance_city(*task) for task in tasks]
+
+        plans = []
+        for (city, _, _, _), (plan, city_excess, city_needed) in zip(tasks, results):
+            if not plan.empty:
+                plans.append(plan)
+            residual_excess.append(city_excess.assign(city=city))
+            residual_needed.append(city_needed.assign(city=city))
+
+        return (
+            plans,
+            pd.concat(residual_excess, ignore_index=True),
+            pd.concat(residual_needed, ignore_index=True),
+        )
+
+    def _balance_between_cities(self, stores, residual_excess, residual_needed):
+        """Allocate residual excess between cities and disaggregate to stores."""
+        if residual_excess.empty or residual_needed.empty:
+            return pd.DataFrame()
+
+        centroids = stores.groupby("city")[["latitude", "longitude"]].mean()
+        cities = list(centroids.index)
+        city_pos = {city: i for i, city in enumerate(cities)}
+        lat, lon = centroids["latitude"].to_numpy(), centroids["longitude"].to_numpy()
+        city_costs = transport_cost_per_unit(
+            haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :]), False
+        )
+        np.fill_diagonal(city_costs, np.inf)
+
+        # (store_id, product_id) -> units left
+        excess_left = {
+            (s, p): u
+            for s, p, u in zip(
+                residual_excess["store_id"], residual_excess["product_id"], residual_excess["excess_units"]
+            )
+        }
+        needed_left = {
+            (s, p): u
+            for s, p, u in zip(
+                residual_needed["store_id"], residual_needed["product_id"], residual_needed["needed_units"]
+            )
+        }
+
+        # (product_id, city) -> store ids with residual excess / need
+        donors_by_city = residual_excess.groupby(["product_id", "city"])["store_id"].apply(list)
+        receivers_by_city = residual_needed.groupby(["product_id", "city"])["store_id"].apply(list)
+        coordinates = {
+            store_id: (lat, lon)
+            for store_id, lat, lon in zip(stores.index, stores["latitude"], stores["longitude"])
+        }
+        excess_by_product = dict(tuple(residual_excess.groupby("product_id")))
+
+        transfers = []
+        for product_id, product_needed in residual_needed.groupby("product_id"):
+            product_excess = excess_by_product.get(product_id)
+            if product_excess is None:
+                continue
+
+            supply = product_excess.groupby("city")["excess_units"].sum()
+            demand = product_needed.groupby("city")["needed_units"].sum()
+            block = city_costs[
+                np.ix_([city_pos[c] for c in supply.index], [city_pos[c] for c in demand.index])
+            ]
+
+            for i, j, units in allocate_nearest(supply.to_numpy(), demand.to_numpy(), block):
+                from_city, to_city = supply.index[i], demand.index[j]
+                transfers.extend(
+                    self._disaggregate(
+                        coordinates,
+                        product_id,
+                        donors_by_city[(product_id, from_city)],
+                        receivers_by_city[(product_id, to_city)],
+                        (lat[city_pos[to_city]], lon[city_pos[to_city]]),
+                        units,
+                        excess_left,
+                        needed_left,
+                    )
+                )
+
+        return pd.DataFrame(transfers)
+
+    @staticmethod
+    def _disaggregate(
+        coordinates, product_id, donor_ids, receiver_ids, to_centroid, units, excess_left, needed_left
+    ):
+        """Split an intercity allocation into concrete store-to-store transfers."""
+        donor_coordinates = np.array([coordinates[d] for d in donor_ids])
+        donor_distance = haversine_km(
+            donor_coordinates[:, 0], donor_coordinates[:, 1], to_centroid[0], to_centroid[1]
+        )
+        donors = [int(donor_ids[i]) for i in np.argsort(donor_distance, kind="stable")]
+        receivers = sorted(
+            (int(r) for r in receiver_ids), key=lambda r: -needed_left[(r, product_id)]
+        )
+
+        transfers = []
+        donor_iter, receiver_iter = iter(donors), iter(receivers)
+        donor, receiver = next(donor_iter, None), next(receiver_iter, None)
+
+        while units > 0 and donor is not None and receiver is not None:
+            available = excess_left[(donor, product_id)]
+            needed = needed_left[(receiver, product_id)]
+            if available <= 0:
+                donor = next(donor_iter, None)
+                continue
+            if needed <= 0:
+                receiver = next(receiver_iter, None)
+                continue
+
+            moved = min(units, available, needed)
+            distance = float(haversine_km(*coordinates[donor], *coordinates[receiver]))
+            transfers.append(
+                {
+                    "from_store_id": donor,
+                    "to_store_id": receiver,
+                    "product_id": int(product_id),
+                    "units": int(moved),
+                    "distance_km": distance,
+                    "transport_cost": transport_cost_per_unit(distance, False) * moved,
+                }
+            )
+            excess_left[(donor, product_id)] -= moved
+            needed_left[(receiver, product_id)] -= moved
+            units -= moved
+
+        return transfers
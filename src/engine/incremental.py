@@ -0,0 +1,295 @@
+"""
+Incremental re-optimization on inventory deltas.
+
+Products are independent in the rule-based allocation (a need is only served by
+excess of the same product), so a stock correction only invalidates the
+transfers of the products whose excess or need sets changed. Everything else
+keeps its previous transfers.
+"""
+
+import pickle
+from time import time
+
+import pandas as pd
+
+from config import MAX_INVENTORY_DAYS, MIN_INVENTORY_DAYS
+from utils.logger import get_optimization_logger
+
+
+class IncrementalOptimizer:
+    def __init__(self, analyzer, optimizer, min_days=None, max_days=None):
+        """
+        Args:
+            analyzer: InventoryAnalyzer with analysis data
+            optimizer: Engine with loaded matrices (e.g. RuleBasedOptimizer)
+            min_days: Shortage threshold (days of inventory)
+            max_days: Excess threshold (days of inventory)
+        """
+        self.analyzer = analyzer
+        self.optimizer = optimizer
+        self.min_days = min_days or MIN_INVENTORY_DAYS
+        self.max_days = max_days or MAX_INVENTORY_DAYS
+
+        # product_id -> {store_id: excess / needed row}
+        self.excess_rows = {}
+        self.needed_rows = {}
+        # product_id -> transfer plan rows of that product
+        self.plans = {}
+        # product_id -> {store_id: units left after the current plan}
+        self.remaining_excess = {}
+        self.remaining_needed = {}
+
+        self._transfer_plan = None
+        self.logger_system = get_optimization_logger()
+
+    def initialize(self, excess_inventory, needed_inventory, transfer_plan=None):
+        """
+        Build the incremental state from a full solve.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+            transfer_plan: Previous transfer plan (solved from scratch if None)
+
+        Returns:
+            DataFrame containing the transfer plan
+        """
+        self.excess_rows = self._group_by_product(excess_inventory)
+        self.needed_rows = self._group_by_product(needed_inventory)
+        self.plans = {}
+
+        if transfer_plan is None:
+            transfer_plan = self.optimizer.optimize(excess_inventory, needed_inventory)
+
+        self._store_plans(transfer_plan, set(self.excess_rows) | set(self.needed_rows))
+
+        return self.transfer_plan
+
+    def apply_delta(self, inventory_delta):
+        """
+        Apply stock corrections and re-solve only the affected products.
+
+        Args:
+            inventory_delta: DataFrame with store_id, product_id and the new current_stock
+
+        Returns:
+            DataFrame containing the updated transfer plan
+        """
+        start_time = time()
+
+        updated_rows = self.analyzer.update_inventory(inventory_delta, self.min_days, self.max_days)
+        excess_df, needed_df = self.analyzer.split_imbalances(
+            updated_rows, self.min_days, self.max_days
+        )
+
+        new_excess = self._group_by_product(excess_df)
+        new_needed = self._group_by_product(needed_df)
+
+        changed_products = set()
+        for store_id, product_id in zip(updated_rows["store_id"], updated_rows["product_id"]):
+            store_id, product_id = int(store_id), int(product_id)
+            for rows, new_rows, column in (
+                (self.excess_rows, new_excess, "excess_units"),
+                (self.needed_rows, new_needed, "needed_units"),
+            ):
+                new_row = new_rows.get(product_id, {}).get(store_id)
+                if self._update_row(rows, product_id, store_id, new_row, column):
+                    changed_products.add(product_id)
+
+        message = (
+            f"Inventory delta of {len(updated_rows)} rows changed "
+            f"{len(changed_products)} products"
+        )
+        print(message)
+        self.logger_system.log_progress("incremental_optimization", message)
+
+        if changed_products:
+            excess_subset = self._rows_for_products(self.excess_rows, changed_products)
+            needed_subset = self._rows_for_products(self.needed_rows, changed_products)
+
+            if excess_subset.empty or needed_subset.empty:
+                plan = pd.DataFrame()
+            else:
+                plan = self.optimizer.optimize(excess_subset, needed_subset)
+
+            self._store_plans(plan, changed_products)
+
+        self.logger_system.log_execution_end(
+            "incremental_optimization",
+            time() - start_time,
+            {
+                "delta_rows": len(updated_rows),
+                "changed_products": len(changed_products),
+                "total_transfers": len(self.transfer_plan),
+            },
+        )
+
+        return self.transfer_plan
+
+    def verify(self):
+        """
+        Compare the incremental plan with a plan solved from scratch on the
+        current analysis rows.
+
+        Returns:
+            Tuple of (whether the plans are identical, number of differing lines,
+            incremental cost, from-scratch cost)
+        """
+        excess_df, needed_df = self.analyzer.split_imbalances(
+            self.analyzer.analysis_df, self.min_days, self.max_days
+        )
+        full_plan = self.optimizer.optimize(excess_df, needed_df)
+
+        keys = ["from_store_id", "to_store_id", "product_id"]
+        plans = []
+        for plan in (self.transfer_plan, full_plan):
+            if plan is None or plan.empty:
+                plan = pd.DataFrame(columns=keys + ["units", "transport_cost"])
+            plans.append(plan[keys + ["units"]].astype({key: int for key in keys}))
+        merged = plans[0].merge(plans[1], on=keys, how="outer", suffixes=("_incremental", "_full"))
+        differing = int((merged["units_incremental"] != merged["units_full"]).sum())
+
+        incremental_cost = float(self.transfer_plan["transport_cost"].sum()) if not self.transfer_plan.empty else 0.0
+        full_cost = float(full_plan["transport_cost"].sum()) if not full_plan.empty else 0.0
+        return differing == 0, differing, incremental_cost, full_cost
+
+    @staticmethod
+    def _group_by_product(inventory):
+        grouped = {}
+        for row in inventory.to_dict("records"):
+            grouped.setdefault(int(row["product_id"]), {})[int(row["store_id"])] = row
+        return grouped
+
+    @staticmethod
+    def _update_row(rows, product_id, store_id, new_row, units_column):
+        """Replace the row of a store-product, returning whether its units changed."""
+        product_rows = rows.setdefault(product_id, {})
+        old_row = product_rows.get(store_id)
+        old_units = old_row[units_column] if old_row is not None else 0
+        new_units = new_row[units_column] if new_row is not None else 0
+
+        if new_row is None:
+            product_rows.pop(store_id, None)
+        else:
+            product_rows[store_id] = new_row
+
+        if not product_rows:
+            del rows[product_id]
+
+        return old_units != new_units
+
+    @staticmethod
+    def _rows_for_products(rows, products):
+        records = [
+            row for product_id in products for row in rows.get(product_id, {}).values()
+        ]
+        return pd.DataFrame(records)
+
+    def _store_plans(self, transfer_plan, products):
+        """Replace the plans and remaining quantities of the given products."""
+        for product_id in products:
+            self.plans.pop(product_id, None)
+
+        if transfer_plan is not None and not transfer_plan.empty:
+            for product_id, product_plan in transfer_plan.groupby("product_id"):
+                if product_id in products:
+                    self.plans[product_id] = product_plan.reset_index(drop=True)
+
+        for rows, remaining, column, plan_column in (
+            (self.excess_rows, self.remaining_excess, "excess_units", "from_store_id"),
+            (self.needed_rows, self.remaining_needed, "needed_units", "to_store_id"),
+        ):
+            for product_id in products:
+                product_remaining = {
+                    store_id: row[column]
+                    for store_id, row in rows.get(product_id, {}).items()
+                }
+
+                product_plan = self.plans.get(product_id)
+                if product_plan is not None:
+                    shipped = product_plan.groupby(plan_column)["units"].sum()
+                    for store_id, units in shipped.items():
+                        if int(store_id) in product_remaining:
+                            product_remaining[int(store_id)] -= units
+
+                if product_remaining:
+                    remaining[product_id] = product_remaining
+                else:
+                    remaining.pop(product_id, None)
+
+        self._transfer_plan = None
+
+    @property
+    def transfer_plan(self):
+        """Combined transfer plan of all products."""
+        if self._transfer_plan is None:
+            if self.plans:
+                self._transfer_plan = pd.concat(
+                    [self.plans[p] for p in sorted(self.plans)], ignore_index=True
+                )
+            else:
+                self._transfer_plan = pd.DataFrame()
+        return self._transfer_plan
+
+    def save_state(self, path, fingerprint=None):
+        """
+        Persist the incremental state (analysis rows, excess/needed sets and plans)
+        with the analyzer configuration it was computed with.
+
+        Args:
+            path: Output pickle path
+            fingerprint: Identifier of the inputs and settings of the run
+        """
+        state = {
+            "fingerprint": fingerprint,
+            "analyzer_config": {
+                "use_forecast": self.analyzer.use_forecast,
+                "service_level": self.analyzer.service_level,
+                "lead_time_days": self.analyzer.lead_time_days,
+            },
+            "min_days": self.min_days,
+            "max_days": self.max_days,
+            "analysis_df": self.analyzer.analysis_df,
+            "excess_rows": self.excess_rows,
+            "needed_rows": self.needed_rows,
+            "plans": self.plans,
+            "remaining_excess": self.remaining_excess,
+            "remaining_needed": self.remaining_needed,
+        }
+        with open(path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Saved incremental state to {path}")
+
+    def load_state(self, path, fingerprint=None):
+        """
+        Restore a state saved with save_state.
+
+        Args:
+            path: Pickle path
+            fingerprint: Identifier of the current inputs and settings; a state
+                saved with another one is stale and not loaded
+
+        Returns:
+            True if the state was loaded, False if it is stale
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+
+        if fingerprint is not None and state.get("fingerprint") != fingerprint:
+            print(f"Incremental state {path} was built from other inputs or settings, ignoring it")
+            return False
+
+        for attribute, value in state["analyzer_config"].items():
+            setattr(self.analyzer, attribute, value)
+        self.min_days = state["min_days"]
+        self.max_days = state["max_days"]
+        self.analyzer.analysis_df = state["analysis_df"]
+        self.analyzer._row_positions = None
+        self.excess_rows = state["excess_rows"]
+        self.needed_rows = state["needed_rows"]
+        self.plans = state["plans"]
+        self.remaining_excess = state["remaining_excess"]
+        self.remaining_needed = state["remaining_needed"]
+        self._transfer_plan = None
+        print(f"Loaded incremental state from {path}")
+        return True
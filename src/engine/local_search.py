@@ -0,0 +1,443 @@
+"""
+Local search over transfer plans.
+
+A plan is held as per-product flows {(donor, receiver): units} together with
+the excess each donor has left. Moves shift units between (donor, receiver)
+pairs of the same product:
+
+    reassign  move a lane's units to a cheaper donor with excess left
+    swap      exchange the donors of two lanes (d1 -> r1, d2 -> r2 becomes
+              d1 -> r2, d2 -> r1)
+    merge     fold a lane into another lane of the same receiver whose donor
+              can cover it at no extra cost (fewer, fuller shipments)
+
+A move only changes the lanes involved, so its cost change is computed from
+their unit transport costs in O(1) and applied without rebuilding the plan.
+Stores are addressed internally by their position in the cost matrix.
+"""
+
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from config import LOCAL_SEARCH_MAX_CANDIDATES
+from utils.logger import get_optimization_logger
+
+
+class LocalSearchImprover:
+    def __init__(
+        self,
+        distance_matrix,
+        transport_cost_matrix,
+        max_candidates=LOCAL_SEARCH_MAX_CANDIDATES,
+    ):
+        """
+        Args:
+            distance_matrix: Matrix of distances between stores
+            transport_cost_matrix: Matrix of transport costs (per unit) between stores
+            max_candidates: Nearest cheaper donors examined per lane for swap moves
+        """
+        self.max_candidates = max_candidates
+        self.logger_system = get_optimization_logger()
+
+        store_ids = list(transport_cost_matrix.index)
+        self._store_ids = np.array(store_ids + [-1])
+        self._positions = {store_id: i for i, store_id in enumerate(store_ids)}
+        self._unknown = len(store_ids)
+
+        # Unknown stores map to an extra row/column of unusable (inf) lanes;
+        # shipping to the donor itself is unusable as well
+        unit_costs = np.full((len(store_ids) + 1, len(store_ids) + 1), np.inf)
+        unit_costs[:-1, :-1] = transport_cost_matrix.reindex(columns=store_ids).to_numpy(
+            dtype=np.float64
+        )
+        unit_costs[np.isnan(unit_costs) | (unit_costs <= 0)] = np.inf
+        np.fill_diagonal(unit_costs, np.inf)
+        self._unit_costs = unit_costs
+        self._cost = unit_costs.item
+
+        distances = np.zeros_like(unit_costs)
+        distances[:-1, :-1] = (
+            distance_matrix.reindex(index=store_ids, columns=store_ids)
+            .fillna(0)
+            .to_numpy(dtype=np.float64)
+        )
+        self._distances = distances
+
+        # product_id -> {(donor, receiver): units}
+        self.flows = {}
+        # product_id -> units not shipped yet, aligned with _donors[product_id]
+        self.remaining = {}
+        self._donors = {}
+        self._donor_index = {}
+        # product_id -> {donor: {receiver}} and {receiver: {donor}}
+        self._outgoing = {}
+        self._incoming = {}
+
+        self.total_cost = 0.0
+        self.initial_cost = 0.0
+        self.moves = {"reassign": 0, "swap": 0, "merge": 0}
+
+    def _position(self, store_id):
+        return self._positions.get(store_id, self._unknown)
+
+    def unit_cost(self, from_store_id, to_store_id):
+        """Transport cost of one unit between two stores (inf if the lane is not usable)."""
+        return self._cost(self._position(from_store_id), self._position(to_store_id))
+
+    def load_plan(self, transfer_plan, excess_inventory):
+        """
+        Build the search state from a transfer plan.
+
+        Args:
+            transfer_plan: DataFrame with from_store_id, to_store_id, product_id and units
+            excess_inventory: DataFrame with store_id, product_id and excess_units
+        """
+        excess = {}
+        for store_id, product_id, units in zip(
+            excess_inventory["store_id"].astype(int),
+            excess_inventory["product_id"].astype(int),
+            excess_inventory["excess_units"],
+        ):
+            product_excess = excess.setdefault(product_id, {})
+            donor = self._position(store_id)
+            product_excess[donor] = product_excess.get(donor, 0) + units
+
+        self.flows = {}
+        self._outgoing = {}
+        self._incoming = {}
+        shipped = {}
+
+        if transfer_plan is not None and not transfer_plan.empty:
+            for from_store_id, to_store_id, product_id, units in zip(
+                transfer_plan["from_store_id"].astype(int),
+                transfer_plan["to_store_id"].astype(int),
+                transfer_plan["product_id"].astype(int),
+                transfer_plan["units"],
+            ):
+                donor = self._position(from_store_id)
+                receiver = self._position(to_store_id)
+
+                product_flows = self.flows.setdefault(product_id, {})
+                lane = (donor, receiver)
+                product_flows[lane] = product_flows.get(lane, 0) + units
+
+                self._outgoing.setdefault(product_id, {}).setdefault(donor, set()).add(receiver)
+                self._incoming.setdefault(product_id, {}).setdefault(receiver, set()).add(donor)
+
+                product_shipped = shipped.setdefault(product_id, {})
+                product_shipped[donor] = product_shipped.get(donor, 0) + units
+
+        self.remaining = {}
+        self._donors = {}
+        self._donor_index = {}
+        for product_id in self.flows:
+            product_excess = excess.get(product_id, {})
+            product_shipped = shipped[product_id]
+            donors = sorted(set(product_excess) | set(product_shipped))
+
+            self._donors[product_id] = np.array(donors)
+            self._donor_index[product_id] = {donor: i for i, donor in enumerate(donors)}
+            self.remaining[product_id] = np.array(
+                [product_excess.get(d, 0) - product_shipped.get(d, 0) for d in donors],
+                dtype=np.float64,
+            )
+
+        self.total_cost = sum(
+            units * self._cost(*lane)
+            for product_flows in self.flows.values()
+            for lane, units in product_flows.items()
+        )
+        self.initial_cost = self.total_cost
+        self.moves = {"reassign": 0, "swap": 0, "merge": 0}
+
+    def _donor_costs(self, product_id, receiver):
+        """Unit cost from every donor of a product to one receiver."""
+        return self._unit_costs[self._donors[product_id], receiver]
+
+    def _cheaper_donors(self, product_id, lane):
+        """
+        Donors of a product that reach the lane's receiver cheaper than its donor.
+
+        Returns:
+            Tuple of (unit costs of all donors to the receiver, indices of cheaper donors)
+        """
+        costs = self._donor_costs(product_id, lane[1])
+        return costs, (costs < self._cost(*lane)).nonzero()[0]
+
+    def _shift(self, product_id, from_lane, to_lane, units):
+        """Move units of a product from one lane to another, updating cost and remaining."""
+        product_flows = self.flows[product_id]
+        outgoing = self._outgoing[product_id]
+        incoming = self._incoming[product_id]
+        donor_index = self._donor_index[product_id]
+        remaining = self.remaining[product_id]
+
+        product_flows[from_lane] -= units
+        if product_flows[from_lane] <= 0:
+            del product_flows[from_lane]
+            outgoing[from_lane[0]].discard(from_lane[1])
+            incoming[from_lane[1]].discard(from_lane[0])
+
+        product_flows[to_lane] = product_flows.get(to_lane, 0) + units
+        outgoing.setdefault(to_lane[0], set()).add(to_lane[1])
+        incoming.setdefault(to_lane[1], set()).add(to_lane[0])
+
+        remaining[donor_index[from_lane[0]]] += units
+        remaining[donor_index[to_lane[0]]] -= units
+
+        self.total_cost += units * (self._cost(*to_lane) - self._cost(*from_lane))
+
+    def reassign(self, product_id, lane, cheaper=None):
+        """
+        Move the units of a lane to the cheapest donor with excess left.
+
+        Args:
+            product_id: Product of the lane
+            lane: (donor, receiver) tuple of store positions
+            cheaper: Optional precomputed _cheaper_donors(product_id, lane)
+
+        Returns:
+            Cost change of the move (0 if no improving move exists)
+        """
+        units = self.flows[product_id].get(lane, 0)
+        if units <= 0:
+            return 0.0
+
+        donor, receiver = lane
+        costs, candidates = cheaper or self._cheaper_donors(product_id, lane)
+        remaining = self.remaining[product_id]
+        candidates = candidates[remaining[candidates] > 0]
+        if len(candidates) == 0:
+            return 0.0
+
+        best = int(candidates[costs[candidates].argmin()])
+        delta = costs[best] - self._cost(donor, receiver)
+        moved = min(units, remaining[best])
+        self._shift(product_id, lane, (int(self._donors[product_id][best]), receiver), moved)
+        self.moves["reassign"] += 1
+        return moved * delta
+
+    def swap(self, product_id, lane, cheaper=None):
+        """
+        Exchange donors with the lane of the product where it saves the most.
+
+        Only donors cheaper than the current one for this receiver are
+        examined (the max_candidates nearest of them): a swap that helps but
+        does not use a cheaper donor for this lane is found from the other lane.
+        Remaining excess is unchanged.
+
+        Args:
+            product_id: Product of the lane
+            lane: (donor, receiver) tuple of store positions
+            cheaper: Optional precomputed _cheaper_donors(product_id, lane)
+
+        Returns:
+            Cost change of the move (0 if no improving move exists)
+        """
+        product_flows = self.flows[product_id]
+        units = product_flows.get(lane, 0)
+        if units <= 0:
+            return 0.0
+
+        d1, r1 = lane
+        costs, candidates = cheaper or self._cheaper_donors(product_id, lane)
+        if len(candidates) == 0:
+            return 0.0
+        current_cost = self._cost(d1, r1)
+        if len(candidates) > self.max_candidates:
+            nearest = np.argpartition(costs[candidates], self.max_candidates)
+            candidates = candidates[nearest[: self.max_candidates]]
+
+        cost = self._cost
+        donors = self._donors[product_id]
+        outgoing = self._outgoing[product_id]
+        best_lane, best_delta = None, 0.0
+        for i in candidates.tolist():
+            d2 = int(donors[i])
+            gain = costs[i] - current_cost
+            for r2 in outgoing.get(d2, ()):
+                if r2 == r1:
+                    continue
+                delta = gain + cost(d1, r2) - cost(d2, r2)
+                if delta < best_delta:
+                    best_lane, best_delta = (d2, r2), delta
+
+        if best_lane is None:
+            return 0.0
+
+        d2, r2 = best_lane
+        moved = min(units, product_flows[best_lane])
+        self._shift(product_id, lane, (d2, r1), moved)
+        self._shift(product_id, best_lane, (d1, r2), moved)
+        self.moves["swap"] += 1
+        return moved * best_delta
+
+    def merge(self, product_id, lane, costs=None):
+        """
+        Fold a lane into another lane of the same receiver whose donor has
+        enough excess left and is not more expensive.
+
+        Args:
+            product_id: Product of the lane
+            lane: (donor, receiver) tuple of store positions
+            costs: Optional precomputed _donor_costs(product_id, receiver)
+
+        Returns:
+            Cost change of the move (0 if no merge is possible)
+        """
+        units = self.flows[product_id].get(lane, 0)
+        if units <= 0:
+            return 0.0
+
+        donor, receiver = lane
+        other_donors = self._incoming[product_id].get(receiver, ())
+        if len(other_donors) < 2:
+            return 0.0
+
+        if costs is None:
+            costs = self._donor_costs(product_id, receiver)
+        current_cost = self._cost(donor, receiver)
+
+        remaining = self.remaining[product_id]
+        donor_index = self._donor_index[product_id]
+        best_donor, best_delta = None, None
+        for other_donor in other_donors:
+            i = donor_index[other_donor]
+            if other_donor == donor or remaining[i] < units:
+                continue
+            delta = costs[i] - current_cost
+            if delta <= 0 and (best_delta is None or delta < best_delta):
+                best_donor, best_delta = other_donor, delta
+
+        if best_donor is None:
+            return 0.0
+
+        self._shift(product_id, lane, (best_donor, receiver), units)
+        self.moves["merge"] += 1
+        return units * best_delta
+
+    def improve(self, deadline=None, max_passes=None, on_pass=None):
+        """
+        Apply moves until a pass changes nothing, the deadline passes or
+        max_passes is reached.
+
+        Args:
+            deadline: perf_counter() value at which to stop
+            max_passes: Maximum number of passes over all lanes
+            on_pass: Optional callback(pass_number, total_cost) after each pass
+
+        Returns:
+            Total cost saved
+        """
+        # Moves never cross products, so a product without moves in a pass is
+        # a local optimum and is not revisited
+        products = sorted(self.flows)
+        passes = 0
+        while products and (max_passes is None or passes < max_passes):
+            passes += 1
+            changed_products = []
+
+            for product_id in products:
+                product_flows = self.flows[product_id]
+                moves_before = sum(self.moves.values())
+
+                for lane in list(product_flows):
+                    if deadline is not None and perf_counter() >= deadline:
+                        if on_pass:
+                            on_pass(passes, self.total_cost)
+                        return self.initial_cost - self.total_cost
+                    if lane not in product_flows:
+                        continue
+
+                    cheaper = self._cheaper_donors(product_id, lane)
+                    if len(cheaper[1]):
+                        self.reassign(product_id, lane, cheaper)
+                        self.swap(product_id, lane, cheaper)
+                    self.merge(product_id, lane, cheaper[0])
+
+                if sum(self.moves.values()) != moves_before:
+                    changed_products.append(product_id)
+
+            if on_pass:
+                on_pass(passes, self.total_cost)
+            products = changed_products
+
+        return self.initial_cost - self.total_cost
+
+    def optimize_plan(self, transfer_plan, excess_inventory, deadline=None):
+        """
+        Improve an existing transfer plan and report the cost saved.
+
+        Args:
+            transfer_plan: Transfer plan produced by any engine
+            excess_inventory: DataFrame containing excess inventory
+            deadline: Optional perf_counter() value at which to stop
+
+        Returns:
+            DataFrame containing the improved transfer plan
+        """
+        start_time = perf_counter()
+        self.logger_system.log_execution_start(
+            "local_search",
+            {"transfers": len(transfer_plan), "max_candidates": self.max_candidates},
+        )
+
+        self.load_plan(transfer_plan, excess_inventory)
+        saved = self.improve(deadline=deadline)
+        improved_plan = self.to_dataframe() if saved > 0 else transfer_plan
+
+        execution_time = perf_counter() - start_time
+        saved_percent = saved / self.initial_cost * 100 if self.initial_cost > 0 else 0
+        message = (
+            f"Local search saved {saved:,.0f} VND ({saved_percent:.2f}%) "
+            f"in {execution_time:.2f} seconds: {self.initial_cost:,.0f} -> "
+            f"{self.total_cost:,.0f} VND, {len(transfer_plan)} -> {len(improved_plan)} transfers"
+        )
+        print(message)
+        self.logger_system.log_progress("local_search", message)
+        self.logger_system.log_execution_end(
+            "local_search",
+            execution_time,
+            {
+                "initial_cost": self.initial_cost,
+                "final_cost": self.total_cost,
+                "cost_saved": saved,
+                **{f"{move}_moves": count for move, count in self.moves.items()},
+            },
+        )
+
+        return improved_plan
+
+    def to_dataframe(self):
+        """
+        Materialize the current flows as a transfer plan.
+
+        Returns:
+            DataFrame with the same columns as RuleBasedOptimizer.optimize
+        """
+        donors, receivers, product_ids, units = [], [], [], []
+        for product_id in sorted(self.flows):
+            for (donor, receiver), lane_units in self.flows[product_id].items():
+                if lane_units <= 0:
+                    continue
+                donors.append(donor)
+                receivers.append(receiver)
+                product_ids.append(product_id)
+                units.append(lane_units)
+
+        donors = np.array(donors, dtype=np.int64)
+        receivers = np.array(receivers, dtype=np.int64)
+        units = np.array(units, dtype=np.int64)
+
+        return pd.DataFrame(
+            {
+                "from_store_id": self._store_ids[donors],
+                "to_store_id": self._store_ids[receivers],
+                "product_id": product_ids,
+                "units": units,
+                "distance_km": self._distances[donors, receivers],
+                "transport_cost": self._unit_costs[donors, receivers] * units,
+            }
+        )
@@ -0,0 +1,220 @@
+"""
+Concurrent execution of optimization engines.
+
+The excess/needed frames and the distance/cost matrices are published once
+through shared memory; every engine runs in its own worker process, attaches to
+the shared inputs and gets its own time budget, counted from when its process
+starts. A comparison therefore takes as long as the slowest engine instead of
+the sum of all of them.
+
+Engine processes are not daemonic, so engines can run their own process pools
+(e.g. Hierarchical and Budgeted solve subproblems in parallel). Each engine
+leads its own process group, and an engine past its budget is stopped together
+with any pool workers it started.
+"""
+
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import signal
+from time import perf_counter
+
+import pandas as pd
+
+from engine.registry import create_engine
+from utils.shared_frames import SharedFrameStore, attach_frame
+
+
+def _run_engine_worker(engine_name, engine_params, descriptors, connection):
+    """Run one engine against the shared inputs (executed in its own process)."""
+    if hasattr(os, "setpgrp"):
+        # Own process group, so a timeout also stops the engine's pool workers
+        os.setpgrp()
+    attached = {}
+    try:
+        for key, descriptor in descriptors.items():
+            attached[key] = attach_frame(descriptor)
+
+        engine = create_engine(engine_name, **engine_params)
+        engine.distance_matrix = attached["distance_matrix"][0]
+        engine.transport_cost_matrix = attached["transport_cost_matrix"][0]
+
+        start_time = perf_counter()
+        transfer_plan = engine.optimize(
+            attached["excess_inventory"][0], attached["needed_inventory"][0]
+        )
+        runtime = perf_counter() - start_time
+
+        # Engine outputs besides the plan (lane manifest, dual iterations)
+        outputs = {
+            attribute: getattr(engine, attribute)
+            for attribute in ("manifest", "iterations")
+            if getattr(engine, attribute, None) is not None
+        }
+        # Detach the result from shared buffers before they are closed
+        connection.send(("completed", transfer_plan.copy(deep=True), (runtime, outputs)))
+    except Exception as e:
+        connection.send(("failed", None, str(e)))
+    finally:
+        for _, shm in attached.values():
+            shm.close()
+        connection.close()
+
+
+def _stop_engine(process):
+    """Kill an engine process and the workers it started, then reap it."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.terminate()
+    process.join()
+
+
+def run_engines_concurrently(
+    engine_names,
+    excess_inventory,
+    needed_inventory,
+    distance_matrix,
+    transport_cost_matrix,
+    time_budget=None,
+    engine_params=None,
+    max_workers=None,
+):
+    """
+    Run several engines concurrently on shared inputs.
+
+    At most max_workers engines run at a time. Each engine's time budget starts
+    when its process starts, so engines queued behind others keep their full
+    budget, and an engine past its budget is terminated to free its slot.
+
+    Args:
+        engine_names: Names of registered engines to run
+        excess_inventory: DataFrame containing excess inventory
+        needed_inventory: DataFrame containing needed inventory
+        distance_matrix: Store-to-store distance matrix
+        transport_cost_matrix: Store-to-store transport cost matrix
+        time_budget: Seconds each engine may run (a number or {engine_name: seconds})
+        engine_params: Optional {engine_name: constructor parameter overrides}
+        max_workers: Maximum number of worker processes (default: one per engine)
+
+    Returns:
+        Dictionary {engine_name: {"transfer_plan", "runtime", "status", "error",
+        "manifest", "iterations"}}; manifest/iterations are None unless the engine produces them
+    """
+    engine_params = engine_params or {}
+    if not isinstance(time_budget, dict):
+        time_budget = {name: time_budget for name in engine_names}
+
+    workers = max_workers or min(len(engine_names), os.cpu_count() or 1)
+    results = {}
+
+    print(
+        f"Running {len(engine_names)} engines concurrently on {workers} processes: "
+        f"{', '.join(engine_names)}"
+    )
+
+    context = mp.get_context()
+    with SharedFrameStore() as store:
+        descriptors = {
+            "excess_inventory": store.publish(excess_inventory),
+            "needed_inventory": store.publish(needed_inventory),
+            "distance_matrix": store.publish(distance_matrix),
+            "transport_cost_matrix": store.publish(transport_cost_matrix),
+        }
+
+        queued = list(engine_names)
+        running = {}  # name -> (process, connection, start time)
+        start_time = perf_counter()
+        try:
+            while queued or running:
+                while queued and len(running) < workers:
+                    name = queued.pop(0)
+                    receiver, sender = context.Pipe(duplex=False)
+                    process = context.Process(
+                        target=_run_engine_worker,
+                        args=(name, engine_params.get(name, {}), descriptors, sender),
+                    )
+                    process.start()
+                    sender.close()
+                    running[name] = (process, receiver, perf_counter())
+
+                # Sleep until a result arrives, a worker exits or the nearest deadline passes
+                deadlines = [
+                    started + time_budget[name]
+                    for name, (_, _, started) in running.items()
+                    if time_budget.get(name) is not None
+                ]
+                timeout = max(0.0, min(deadlines) - perf_counter()) if deadlines else None
+                mp.connection.wait(
+                    [connection for _, connection, _ in running.values()]
+                    + [process.sentinel for process, _, _ in running.values()],
+                    timeout=timeout,
+                )
+
+                for name, (process, connection, started) in list(running.items()):
+                    budget = time_budget.get(name)
+                    if connection.poll():
+                        try:
+                            status, transfer_plan, detail = connection.recv()
+                        except EOFError:
+                            status, transfer_plan, detail = "failed", None, "worker exited without a result"
+                        process.join()
+                    elif not process.is_alive():
+                        status, transfer_plan, detail = (
+                            "failed", None, f"worker exited with code {process.exitcode}"
+                        )
+                    elif budget is not None and perf_counter() - started >= budget:
+                        _stop_engine(process)
+                        status, transfer_plan, detail = "timeout", None, None
+                    else:
+                        continue
+
+                    connection.close()
+                    del running[name]
+                    if status == "completed":
+                        runtime, outputs = detail
+                        results[name] = {
+                            "transfer_plan": transfer_plan,
+                            "runtime": runtime,
+                            "status": "completed",
+                            "error": None,
+                            "manifest": outputs.get("manifest"),
+                            "iterations": outputs.get("iterations"),
+                        }
+                        print(f"{name} completed in {runtime:.2f} seconds.")
+                    elif status == "timeout":
+                        results[name] = {
+                            "transfer_plan": pd.DataFrame(),
+                            "runtime": budget,
+                            "status": "timeout",
+                            "error": f"Exceeded time budget of {budget:.1f} seconds",
+                            "manifest": None,
+                            "iterations": None,
+                        }
+                        print(f"{name} exceeded its time budget of {budget:.1f} seconds.")
+                    else:
+                        results[name] = {
+                            "transfer_plan": pd.DataFrame(),
+                            "runtime": None,
+                            "status": "failed",
+                            "error": detail,
+                            "manifest": None,
+                            "iterations": None,
+                        }
+                        print(f"{name} failed: {detail}")
+
+            print(
+                f"All engines finished in {perf_counter() - start_time:.2f} seconds "
+                f"(sum of engine runtimes: "
+                f"{sum(r['runtime'] or 0 for r in results.values()):.2f} seconds)."
+            )
+        finally:
+            # Stops engines still running if the comparison is interrupted
+            for process, connection, _ in running.values():
+                _stop_engine(process)
+                connection.close()
+
+    return {name: results[name] for name in engine_names if name in results}
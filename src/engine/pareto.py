@@ -0,0 +1,268 @@
+"""
+Cost-vs-balance Pareto front.
+
+ResultsManager picks one plan with a hand-weighted score. The Pareto planner
+instead solves the allocation for a sequence of cost weights and returns the
+plans no other plan beats on all of transport cost, inventory imbalance
+(std-dev of days of inventory) and remaining needed units.
+
+For a cost weight w, a unit moved on a lane is worth 1 - w * unit cost, so
+only lanes cheaper than 1 / w are used, cheapest first. Weights are taken in
+decreasing order (thresholds at quantiles of the candidate lane costs):
+
+1. The candidate graph (each receiver's K cheapest donors, per product) is
+   built once and shared by every solve.
+2. Each solve warm-starts from the previous plan: the lanes of the previous
+   weight stay profitable at the next, so the plan is kept and only the lanes
+   that became profitable are allocated, with the supply and needs left over.
+   Every line of a plan is thus a line of all later plans.
+3. Products are independent, so each product's chain of solves runs in a
+   worker process; the points are aggregated across products afterwards.
+
+Because plans are nested, they are stored compactly as one line table where
+each line records the first point it belongs to.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from config import BUDGET_CANDIDATES, PARETO_POINTS
+from engine.budget import build_product_subproblems
+from utils.logger import get_optimization_logger
+
+
+OBJECTIVES = ["transport_cost", "imbalance_std", "remaining_needed_units"]
+
+
+def trace_product(subproblem, thresholds):
+    """
+    Allocate one product for ascending lane cost thresholds, each solve
+    continuing from the previous one.
+
+    Args:
+        subproblem: Candidate graph of the product (see build_product_subproblems)
+        thresholds: Ascending maximum unit cost of a used lane, one per point
+
+    Returns:
+        Tuple of (lane indices, units, first point) of the lines shipped
+    """
+    cost = subproblem["cost"]
+    order = np.argsort(cost, kind="stable")
+    ends = np.searchsorted(cost[order], thresholds, side="right")
+    supply = subproblem["supply"].copy()
+    demand = subproblem["demand"].copy()
+    donor, receiver = subproblem["donor"], subproblem["receiver"]
+
+    lanes, units, points = [], [], []
+    start = 0
+    for point, end in enumerate(ends.tolist()):
+        for lane in order[start:end].tolist():
+            d, r = donor[lane], receiver[lane]
+            shipped = min(supply[d], demand[r])
+            if shipped > 0:
+                supply[d] -= shipped
+                demand[r] -= shipped
+                lanes.append(lane)
+                units.append(shipped)
+                points.append(point)
+        start = max(start, end)
+
+    return (
+        np.array(lanes, dtype=np.int64),
+        np.array(units, dtype=np.int64),
+        np.array(points, dtype=np.int64),
+    )
+
+
+def non_dominated(objectives):
+    """
+    Mask of the rows no other row matches or beats on every objective while
+    beating on at least one (all objectives minimized).
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    no_worse = (objectives[:, None, :] <= objectives[None, :, :]).all(axis=2)
+    better = (objectives[:, None, :] < objectives[None, :, :]).any(axis=2)
+    # dominated[j]: some row i is no worse than j everywhere and better somewhere
+    return ~(no_worse & better).any(axis=0)
+
+
+class ParetoPlanner:
+    def __init__(
+        self,
+        optimizer,
+        num_points=PARETO_POINTS,
+        candidates=BUDGET_CANDIDATES,
+        max_workers=None,
+    ):
+        """
+        Args:
+            optimizer: Engine with loaded lanes (matrices, sparse lanes or store coordinates)
+            num_points: Cost weights solved
+            candidates: Cheapest donors considered per receiver and product (K)
+            max_workers: Worker processes for the per-product solves (default: CPU count)
+        """
+        self.optimizer = optimizer
+        self.num_points = num_points
+        self.candidates = candidates
+        self.max_workers = max_workers
+        self.logger_system = get_optimization_logger()
+
+    def build_front(self, analysis_df, excess_inventory, needed_inventory):
+        """
+        Solve every cost weight and keep the non-dominated plans.
+
+        Args:
+            analysis_df: Output of InventoryAnalyzer.analyze_sales_data
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            Tuple of (front DataFrame, one row per non-dominated point; plan lines
+            DataFrame, where the plan of a point is every line whose point is at
+            most the point's)
+        """
+        start_time = perf_counter()
+        self.logger_system.log_execution_start(
+            "pareto_front",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "points": self.num_points,
+            },
+        )
+
+        subproblems = build_product_subproblems(
+            self.optimizer, excess_inventory, needed_inventory, self.candidates
+        )
+        if not subproblems:
+            print("No excess or needed inventory found. No transfers needed.")
+            self.logger_system.log_execution_end("pareto_front", perf_counter() - start_time, {"points": 0})
+            return pd.DataFrame(), pd.DataFrame()
+
+        # Lane cost thresholds at quantiles of the candidate lanes, the last using every lane
+        costs = np.concatenate([s["cost"] for s in subproblems])
+        thresholds = np.unique(np.quantile(costs, np.linspace(0, 1, self.num_points + 1)[1:]))
+
+        print(
+            f"Solving {len(thresholds)} cost weights for {len(subproblems)} products "
+            f"over {len(costs)} candidate lanes..."
+        )
+        workers = min(self.max_workers or os.cpu_count() or 1, len(subproblems))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                traces = list(
+                    executor.map(
+                        trace_product,
+                        subproblems,
+                        [thresholds] * len(subproblems),
+                        chunksize=max(1, len(subproblems) // (4 * workers)),
+                    )
+                )
+        else:
+            traces = [trace_product(subproblem, thresholds) for subproblem in subproblems]
+
+        lines = self._plan_lines(subproblems, traces)
+        points = self._point_metrics(analysis_df, needed_inventory, lines, thresholds)
+        points = points.drop_duplicates(OBJECTIVES)
+        front = points[non_dominated(points[OBJECTIVES].to_numpy())].reset_index(drop=True)
+        lines = lines[lines["point"] <= front["point"].max()].reset_index(drop=True)
+
+        self._report(front, points, lines, len(thresholds), start_time)
+        return front, lines
+
+    def _plan_lines(self, subproblems, traces):
+        """Plan lines of every product, with the first point each belongs to."""
+        lines = []
+        for subproblem, (lanes, units, points) in zip(subproblems, traces):
+            if len(lanes) == 0:
+                continue
+            lines.append(
+                pd.DataFrame(
+                    {
+                        "point": points,
+                        "from_store_id": subproblem["donor_ids"][subproblem["donor"][lanes]],
+                        "to_store_id": subproblem["receiver_ids"][subproblem["receiver"][lanes]],
+                        "product_id": subproblem["product_id"],
+                        "units": units,
+                        "distance_km": subproblem["distance"][lanes],
+                        "transport_cost": units * subproblem["cost"][lanes],
+                    }
+                )
+            )
+        columns = ["point", "from_store_id", "to_store_id", "product_id", "units", "distance_km", "transport_cost"]
+        if not lines:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(lines, ignore_index=True).sort_values(
+            ["point", "from_store_id", "to_store_id", "product_id"], ignore_index=True
+        )
+
+    def _point_metrics(self, analysis_df, needed_inventory, lines, thresholds):
+        """
+        Objectives of every point, adding each point's new lines to the stock
+        of the previous one.
+
+        Returns:
+            DataFrame with point, cost_weight, max_unit_cost, transfers,
+            units_transferred and the objectives
+        """
+        keys = pd.MultiIndex.from_frame(analysis_df[["store_id", "product_id"]].astype(int))
+        rows = pd.Series(np.arange(len(keys)), index=keys)
+        to_rows = rows.reindex(pd.MultiIndex.from_frame(lines[["to_store_id", "product_id"]].astype(int))).to_numpy()
+        from_rows = rows.reindex(
+            pd.MultiIndex.from_frame(lines[["from_store_id", "product_id"]].astype(int))
+        ).to_numpy()
+
+        stock = analysis_df["current_stock"].to_numpy(dtype=np.float64).copy()
+        daily = analysis_df["avg_daily_sales"].to_numpy(dtype=np.float64)
+        line_points = lines["point"].to_numpy()
+        line_units = lines["units"].to_numpy(dtype=np.float64)
+        line_costs = lines["transport_cost"].to_numpy(dtype=np.float64)
+        needed_units = float(needed_inventory["needed_units"].sum())
+
+        metrics = []
+        transfers, units, cost = 0, 0.0, 0.0
+        for point, threshold in enumerate(thresholds):
+            new = np.flatnonzero(line_points == point)
+            np.add.at(stock, to_rows[new], line_units[new])
+            np.subtract.at(stock, from_rows[new], line_units[new])
+            transfers += len(new)
+            units += float(line_units[new].sum())
+            cost += float(line_costs[new].sum())
+
+            days = stock / daily
+            days[np.isinf(days)] = 365
+            metrics.append(
+                {
+                    "point": point,
+                    "cost_weight": 1.0 / threshold if threshold > 0 else np.inf,
+                    "max_unit_cost": float(threshold),
+                    "transfers": transfers,
+                    "units_transferred": int(units),
+                    "transport_cost": cost,
+                    "imbalance_std": float(np.nanstd(days, ddof=1)),
+                    "remaining_needed_units": int(needed_units - units),
+                }
+            )
+        return pd.DataFrame(metrics)
+
+    def _report(self, front, points, lines, num_solved, start_time):
+        print("Pareto Front Summary:")
+        print(f"- Cost weights solved: {num_solved} ({len(points)} distinct plans, {len(front)} non-dominated)")
+        print(
+            f"- Transport cost: {front['transport_cost'].min():,.0f} - {front['transport_cost'].max():,.0f} VND"
+        )
+        print(
+            f"- Remaining needed units: {front['remaining_needed_units'].min()} - "
+            f"{front['remaining_needed_units'].max()}"
+        )
+        print(f"- Plan lines stored: {len(lines)} for {int(front['transfers'].sum())} transfers across all plans")
+
+        self.logger_system.log_execution_end(
+            "pareto_front",
+            perf_counter() - start_time,
+            {"points": num_solved, "front": len(front), "lines": len(lines)},
+        )
@@ -0,0 +1,104 @@
+"""
+Registry of optimization engines.
+
+Every engine exposes the same interface as RuleBasedOptimizer:
+load_matrices(distance_path, cost_path) and optimize(excess_inventory, needed_inventory)
+returning a transfer plan DataFrame.
+"""
+
+from config import ANYTIME_TIME_BUDGET_S, STOCHASTIC_SCENARIOS
+from engine.anytime import AnytimeOptimizer
+from engine.budget import BudgetOptimizer
+from engine.consolidation import ConsolidationOptimizer
+from engine.hierarchical import HierarchicalOptimizer
+from engine.rule_based import RuleBasedOptimizer
+from engine.stochastic import StochasticOptimizer
+
+
+ENGINE_REGISTRY = {
+    "Rule-based": {
+        "class": RuleBasedOptimizer,
+        "params": {},
+        "description": "Greedy nearest-donor allocation",
+    },
+    "Anytime": {
+        "class": AnytimeOptimizer,
+        "params": {"time_budget": ANYTIME_TIME_BUDGET_S},
+        "description": "Greedy seed improved by local search until a deadline",
+    },
+    "Hierarchical": {
+        "class": HierarchicalOptimizer,
+        "params": {},
+        "description": "Per-city balancing, then aggregated intercity allocation",
+    },
+    "Stochastic": {
+        "class": StochasticOptimizer,
+        "params": {"num_scenarios": STOCHASTIC_SCENARIOS},
+        "description": "Minimizes expected stockout plus transport cost over sampled demand",
+    },
+    "Consolidated": {
+        "class": ConsolidationOptimizer,
+        "params": {},
+        "description": "Fixed trip cost per lane plus unit cost; consolidates products onto lanes",
+    },
+    "Budgeted": {
+        "class": BudgetOptimizer,
+        "params": {},
+        "description": "Maximizes needed units covered within a transport budget (Lagrangian relaxation)",
+    },
+}
+
+
+def register_engine(name, engine_class, params=None, description=""):
+    """
+    Register an optimization engine.
+
+    Args:
+        name: Display name of the engine (used as key in results_dict)
+        engine_class: Engine class implementing load_matrices() and optimize()
+        params: Default constructor parameters
+        description: Short description of the engine
+    """
+    ENGINE_REGISTRY[name] = {
+        "class": engine_class,
+        "params": dict(params or {}),
+        "description": description,
+    }
+
+
+def get_engine_names():
+    """Return the names of all registered engines."""
+    return list(ENGINE_REGISTRY.keys())
+
+
+def get_engine_params(name, **overrides):
+    """
+    Get the constructor parameters of an engine.
+
+    Args:
+        name: Name of the engine
+        **overrides: Parameters overriding the registered defaults
+
+    Returns:
+        Dictionary of constructor parameters
+    """
+    if name not in ENGINE_REGISTRY:
+        raise ValueError(
+            f"Unknown engine '{name}'. Available engines: {', '.join(get_engine_names())}"
+        )
+    return {**ENGINE_REGISTRY[name]["params"], **overrides}
+
+
+def create_engine(name, **overrides):
+    """
+    Instantiate a registered engine.
+
+    Args:
+        name: Name of the engine
+        **overrides: Parameters overriding the registered defaults
+
+    Returns:
+        Engine instance
+    """
+    params = get_engine_params(name, **overrides)
+    return ENGINE_REGISTRY[name]["class"](**params)
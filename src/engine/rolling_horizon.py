@@ -0,0 +1,334 @@
+"""
+Multi-period rolling-horizon planner.
+
+Instead of balancing a single instant, every store-product is projected over
+the next H days from its stock, stock in transit and average daily sales:
+
+- a receiver is a cell whose projected cover drops below min_days within the
+  horizon; it needs enough units to stay covered until the horizon ends, and
+  the day it breaches (minus the lead time) is the day its transfer must ship;
+- a donor is a cell above max_days today; it gives what it holds beyond
+  max(max_days, H + min_days) days of sales, so it is never made short
+  within the horizon.
+
+The horizon is allocated nearest-donor first, per product. Only transfers that
+must ship today are committed; the rest is a tentative plan.
+
+Consecutive days differ by one day of sales and the committed transfers, so
+the next day starts from the previous solution: the tentative lanes are
+replayed first (clipped to the new capacities and needs) and only the residual
+is allocated greedily. The candidate graph of each product (donor x receiver
+lane costs and each receiver's donor ordering) is cached and extended with new
+receivers; it is only rebuilt when new donors appear.
+"""
+
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    MAX_INVENTORY_DAYS,
+    MIN_INVENTORY_DAYS,
+    ROLLING_HORIZON_DAYS,
+    ROLLING_LEAD_TIME_DAYS,
+)
+from engine.analyzer import InventoryAnalyzer
+from utils.logger import get_optimization_logger
+
+
+PLAN_COLUMNS = [
+    "from_store_id", "to_store_id", "product_id", "units",
+    "distance_km", "transport_cost", "dispatch_day",
+]
+
+
+class CandidateGraph:
+    def __init__(self, donor_ids):
+        """
+        Lanes of one product from its donors to the receivers seen so far.
+
+        Args:
+            donor_ids: Store ids of the donors
+        """
+        self.donor_ids = np.asarray(donor_ids, dtype=np.int64)
+        self.donor_positions = {int(s): i for i, s in enumerate(self.donor_ids)}
+        self.receiver_rows = {}
+        # Receiver-major (receivers x donors) so each receiver's lanes are contiguous
+        self.distances = np.empty((0, len(self.donor_ids)))
+        self.costs = np.empty((0, len(self.donor_ids)))
+        self.orders = {}
+
+    def covers(self, donor_ids):
+        """Whether every donor is already in the graph."""
+        return all(int(s) in self.donor_positions for s in donor_ids)
+
+    def add_receivers(self, receiver_ids, optimizer):
+        """
+        Price the lanes of receivers not yet in the graph.
+
+        Returns:
+            Number of receivers added
+        """
+        new = [int(s) for s in receiver_ids if int(s) not in self.receiver_rows]
+        if new:
+            distances, costs = optimizer.lane_block(self.donor_ids, new)
+            start = len(self.costs)
+            self.distances = np.vstack([self.distances, distances.T])
+            self.costs = np.vstack([self.costs, costs.T])
+            for offset, store_id in enumerate(new):
+                self.receiver_rows[store_id] = start + offset
+        return len(new)
+
+    def donor_order(self, receiver_id):
+        """Donor positions by increasing lane cost to a receiver (cached)."""
+        order = self.orders.get(receiver_id)
+        if order is None:
+            costs = self.costs[self.receiver_rows[receiver_id]]
+            order = np.argsort(costs)
+            order = order[np.isfinite(costs[order])]
+            self.orders[receiver_id] = order
+        return order
+
+
+class RollingHorizonPlanner:
+    def __init__(
+        self,
+        optimizer,
+        horizon_days=ROLLING_HORIZON_DAYS,
+        lead_time=ROLLING_LEAD_TIME_DAYS,
+        min_days=None,
+        max_days=None,
+    ):
+        """
+        Args:
+            optimizer: Engine with loaded lanes (matrices, sparse lanes or store coordinates)
+            horizon_days: Days planned ahead
+            lead_time: Days between dispatch and arrival of a transfer
+            min_days: Shortage threshold (days of inventory)
+            max_days: Excess threshold (days of inventory)
+        """
+        self.optimizer = optimizer
+        self.horizon_days = horizon_days
+        self.lead_time = lead_time
+        self.min_days = min_days or MIN_INVENTORY_DAYS
+        self.max_days = max_days or MAX_INVENTORY_DAYS
+
+        # product_id -> CandidateGraph
+        self.graphs = {}
+        # product_id -> tentative lanes [(from_store_id, to_store_id, units)] of the last plan
+        self.previous = {}
+        self.day = 0
+        self.last_stats = {}
+        self.logger_system = get_optimization_logger()
+
+    def horizon_imbalances(self, rows, in_transit=None):
+        """
+        Donors and receivers over the horizon.
+
+        Args:
+            rows: Analysis rows (store_id, product_id, current_stock, avg_daily_sales
+                and optionally safety_days)
+            in_transit: Units already on the way to each row (default none)
+
+        Returns:
+            Tuple of (excess DataFrame, needed DataFrame with dispatch_day)
+        """
+        stock = rows["current_stock"].to_numpy(dtype=np.float64)
+        daily = np.maximum(rows["avg_daily_sales"].to_numpy(dtype=np.float64), 0.01)
+        position = stock if in_transit is None else stock + np.asarray(in_transit, dtype=np.float64)
+        min_days, max_days = InventoryAnalyzer.row_thresholds(rows, self.min_days, self.max_days)
+
+        keep_days = np.maximum(max_days, self.horizon_days + min_days)
+        excess_units = np.floor(stock - daily * keep_days)
+        excess_mask = (stock / daily > max_days) & (excess_units > 0)
+
+        cover = position / daily
+        needed_units = np.floor(daily * (min_days + self.horizon_days) - position)
+        needed_mask = (cover < min_days + self.horizon_days) & (needed_units > 0)
+        # Ship so the units arrive before the cover falls below min_days
+        dispatch_day = np.maximum(np.floor(cover - min_days) - self.lead_time, 0)
+
+        keys = rows[["store_id", "product_id"]].astype(int).reset_index(drop=True)
+        excess = keys[excess_mask].assign(excess_units=excess_units[excess_mask].astype(int))
+        needed = keys[needed_mask].assign(
+            needed_units=needed_units[needed_mask].astype(int),
+            dispatch_day=dispatch_day[needed_mask].astype(int),
+        )
+        return excess.reset_index(drop=True), needed.reset_index(drop=True)
+
+    def plan_day(self, rows, in_transit=None):
+        """
+        Plan the horizon from today's state, warm-started from the previous day.
+
+        Args:
+            rows: Analysis rows of today
+            in_transit: Units already on the way to each row
+
+        Returns:
+            Tuple of (committed plan shipping today, full horizon plan)
+        """
+        start_time = perf_counter()
+        excess, needed = self.horizon_imbalances(rows, in_transit)
+        warm = bool(self.previous)
+        stats = {"graphs_reused": 0, "graphs_built": 0, "receivers_priced": 0, "units_replayed": 0}
+
+        excess_by_product = {
+            product_id: group for product_id, group in excess.groupby("product_id")
+        }
+        transfers = []
+        previous = {}
+
+        for product_id, product_needed in needed.groupby("product_id"):
+            product_excess = excess_by_product.get(product_id)
+            if product_excess is None:
+                continue
+
+            graph = self.graphs.get(product_id)
+            if graph is None or not graph.covers(product_excess["store_id"]):
+                graph = CandidateGraph(product_excess["store_id"])
+                self.graphs[product_id] = graph
+                stats["graphs_built"] += 1
+            else:
+                stats["graphs_reused"] += 1
+            stats["receivers_priced"] += graph.add_receivers(product_needed["store_id"], self.optimizer)
+
+            lanes, replayed = self._allocate(graph, product_excess, product_needed, self.previous.get(product_id, ()))
+            stats["units_replayed"] += replayed
+            previous[product_id] = [(i, j, units) for (i, j), units in lanes.items()]
+
+            dispatch = dict(zip(product_needed["store_id"], product_needed["dispatch_day"]))
+            for (from_store_id, to_store_id), units in lanes.items():
+                lane = graph.receiver_rows[to_store_id], graph.donor_positions[from_store_id]
+                transfers.append(
+                    (
+                        from_store_id, to_store_id, int(product_id), int(units),
+                        float(graph.distances[lane]), float(graph.costs[lane]) * units,
+                        int(dispatch[to_store_id]),
+                    )
+                )
+
+        self.previous = previous
+        horizon_plan = pd.DataFrame(transfers, columns=PLAN_COLUMNS)
+        committed = horizon_plan[horizon_plan["dispatch_day"] == 0].reset_index(drop=True)
+
+        runtime = perf_counter() - start_time
+        self.logger_system.log_progress(
+            "rolling_horizon",
+            f"Day {self.day} ({'warm' if warm else 'cold'}): {len(committed)} of {len(horizon_plan)} "
+            f"transfers committed in {runtime:.3f}s, {stats['graphs_reused']} graphs reused, "
+            f"{stats['graphs_built']} built, {stats['units_replayed']} units replayed",
+        )
+        self.last_stats = {"day": self.day, "warm": warm, "runtime_s": runtime, **stats}
+        self.day += 1
+        return committed, horizon_plan
+
+    def _allocate(self, graph, product_excess, product_needed, previous_lanes):
+        """
+        Allocate one product: replay the previous lanes, then serve the residual
+        needs (largest first) from their nearest donors with capacity left.
+
+        Returns:
+            Tuple of ({(from_store_id, to_store_id): units}, units replayed)
+        """
+        capacity = np.zeros(len(graph.donor_ids))
+        capacity[[graph.donor_positions[int(s)] for s in product_excess["store_id"]]] = product_excess[
+            "excess_units"
+        ].to_numpy()
+        need = dict(zip(product_needed["store_id"].astype(int), product_needed["needed_units"]))
+
+        lanes = {}
+        replayed = 0
+        for from_store_id, to_store_id, units in previous_lanes:
+            row = graph.donor_positions.get(from_store_id)
+            if row is None or need.get(to_store_id, 0) <= 0:
+                continue
+            if not np.isfinite(graph.costs[graph.receiver_rows[to_store_id], row]):
+                continue
+            units = min(units, capacity[row], need[to_store_id])
+            if units > 0:
+                lanes[(from_store_id, to_store_id)] = lanes.get((from_store_id, to_store_id), 0) + units
+                capacity[row] -= units
+                need[to_store_id] -= units
+                replayed += units
+
+        for to_store_id in sorted(need, key=need.get, reverse=True):
+            remaining = need[to_store_id]
+            if remaining <= 0:
+                continue
+            # Nearest donors with capacity left, up to the one that completes the need
+            order = graph.donor_order(to_store_id)
+            order = order[capacity[order] > 0]
+            taken = capacity[order]
+            last = np.searchsorted(np.cumsum(taken), remaining)
+            order, taken = order[: last + 1], taken[: last + 1].copy()
+            if last < len(taken):
+                taken[-1] -= taken.sum() - remaining
+            capacity[order] -= taken
+            for row, units in zip(order, taken):
+                key = (int(graph.donor_ids[row]), to_store_id)
+                lanes[key] = lanes.get(key, 0) + units
+
+        return lanes, int(replayed)
+
+
+def simulate_rolling_horizon(planner, analysis_df, days):
+    """
+    Run the planner over consecutive days: each day the committed transfers
+    ship (arriving after the lead time) and stock decreases by the average
+    daily sales.
+
+    Args:
+        planner: RollingHorizonPlanner
+        analysis_df: Output of InventoryAnalyzer.analyze_sales_data
+        days: Days to simulate
+
+    Returns:
+        Tuple of (committed transfers of every day, per-day statistics DataFrame)
+    """
+    rows = analysis_df.reset_index(drop=True).copy()
+    keys = pd.MultiIndex.from_frame(rows[["store_id", "product_id"]].astype(int))
+    daily = rows["avg_daily_sales"].to_numpy(dtype=np.float64)
+    stock = rows["current_stock"].to_numpy(dtype=np.float64)
+    in_transit = np.zeros(len(rows))
+    arrivals = {}
+
+    committed_plans = []
+    stats = []
+    for day in range(days):
+        if day in arrivals:
+            cells, units = arrivals.pop(day)
+            np.add.at(stock, cells, units)
+            np.subtract.at(in_transit, cells, units)
+
+        rows["current_stock"] = stock
+        committed, horizon_plan = planner.plan_day(rows, in_transit)
+
+        if not committed.empty:
+            from_cells = keys.get_indexer(pd.MultiIndex.from_frame(committed[["from_store_id", "product_id"]]))
+            to_cells = keys.get_indexer(pd.MultiIndex.from_frame(committed[["to_store_id", "product_id"]]))
+            units = committed["units"].to_numpy(dtype=np.float64)
+            np.subtract.at(stock, from_cells, units)
+            if planner.lead_time > 0:
+                np.add.at(in_transit, to_cells, units)
+                arrivals[day + planner.lead_time] = (to_cells, units)
+            else:
+                np.add.at(stock, to_cells, units)
+            committed_plans.append(committed.assign(day=day))
+
+        stats.append(
+            {
+                **planner.last_stats,
+                "committed_transfers": len(committed),
+                "horizon_transfers": len(horizon_plan),
+                "committed_cost": float(committed["transport_cost"].sum()),
+            }
+        )
+        stock = np.maximum(stock - daily, 0)
+
+    committed = (
+        pd.concat(committed_plans, ignore_index=True)
+        if committed_plans
+        else pd.DataFrame(columns=PLAN_COLUMNS + ["day"])
+    )
+    return committed, pd.DataFrame(stats)
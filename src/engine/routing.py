@@ -0,0 +1,346 @@
+"""
+Multi-stop vehicle routes for transfer plans.
+
+A plan lists one line per (origin, destination, product); executed as is,
+every line is a separate out-and-back leg. The route builder runs after
+optimization and turns the plan into vehicle routes:
+
+1. Lines are grouped by origin store (the depot of its routes) and by the
+   origin's city, the unit of parallel work. Units bound for the same
+   destination form one stop; full truckloads of a stop go direct.
+2. The stops of each depot are joined into routes with the Clarke-Wright
+   savings heuristic: every stop starts on its own route, and candidate joins
+   (tail of one route -> head of another) are popped from a heap in order of
+   savings d(i, depot) + d(depot, j) - d(i, j) while vehicle capacity allows.
+   For depots with many stops only joins to each stop's nearest neighbours
+   are considered, so work grows with stops x neighbours instead of stops^2.
+3. Optionally, each route is refined with 2-opt, evaluating all segment
+   reversals of a route at once as an array operation.
+
+Cities are routed in parallel worker processes. Distances come from the
+optimizer's lanes (dense distance matrix, or store coordinates).
+"""
+
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from config import ROUTING_NEIGHBORS, ROUTING_VEHICLE_CAPACITY
+from utils.logger import get_optimization_logger
+
+
+# Stops whose nearest neighbours are searched at once
+NEIGHBOR_BLOCK_ROWS = 1024
+
+
+def clarke_wright(distances, demands, capacity, neighbors=ROUTING_NEIGHBORS):
+    """
+    Savings-based routes from one depot.
+
+    Args:
+        distances: (stops + 1) x (stops + 1) distances, depot first
+        demands: Units delivered at each stop (each at most capacity)
+        capacity: Units a vehicle carries
+        neighbors: Nearest stops each stop may be joined to
+
+    Returns:
+        List of routes, each a list of stop indices (0-based, depot excluded)
+    """
+    n = len(demands)
+    if n == 0:
+        return []
+
+    from_depot = distances[0, 1:]
+    to_depot = distances[1:, 0]
+    between = distances[1:, 1:]
+
+    # Candidate joins: i (end of a route) followed by j (start of another)
+    if n - 1 > neighbors:
+        # Nearest neighbours (plus the stop itself), in row blocks to bound memory
+        nearest = np.concatenate(
+            [
+                np.argpartition(between[start:start + NEIGHBOR_BLOCK_ROWS], neighbors, axis=1)[:, :neighbors + 1]
+                for start in range(0, n, NEIGHBOR_BLOCK_ROWS)
+            ]
+        )
+        tails = np.repeat(np.arange(n), neighbors + 1)
+        heads = nearest.ravel()
+        # Joins are directed: consider both orders of every neighbour pair
+        tails, heads = np.concatenate([tails, heads]), np.concatenate([heads, tails])
+        tails, heads = tails[tails != heads], heads[tails != heads]
+    else:
+        tails, heads = np.nonzero(~np.eye(n, dtype=bool))
+
+    savings = to_depot[tails] + from_depot[heads] - between[tails, heads]
+    useful = savings > 0
+    heap = list(zip((-savings[useful]).tolist(), tails[useful].tolist(), heads[useful].tolist()))
+    heapq.heapify(heap)
+
+    route_of = list(range(n))
+    members = {r: [r] for r in range(n)}
+    head = list(range(n))
+    tail = list(range(n))
+    load = [float(d) for d in demands]
+    next_stop = [-1] * n
+
+    while heap:
+        _, i, j = heapq.heappop(heap)
+        a, b = route_of[i], route_of[j]
+        if a == b or tail[a] != i or head[b] != j or load[a] + load[b] > capacity:
+            continue
+
+        # Append route b after route a, relabelling the shorter one
+        next_stop[i] = j
+        keep, gone = (a, b) if len(members[a]) >= len(members[b]) else (b, a)
+        for stop in members[gone]:
+            route_of[stop] = keep
+        members[keep].extend(members.pop(gone))
+        head[keep], tail[keep] = head[a], tail[b]
+        load[keep] = load[a] + load[b]
+
+    routes = []
+    for r in members:
+        route, stop = [], head[r]
+        while stop != -1:
+            route.append(stop)
+            stop = next_stop[stop]
+        routes.append(route)
+    return routes
+
+
+def two_opt(route, distances, max_passes=50):
+    """
+    Improve a route by reversing segments while that shortens it.
+    Assumes symmetric distances.
+
+    Args:
+        route: Stop indices (0-based, depot excluded)
+        distances: (stops + 1) x (stops + 1) distances, depot first
+        max_passes: Maximum improving reversals
+
+    Returns:
+        Improved list of stop indices
+    """
+    if len(route) < 3:
+        return route
+
+    tour = np.concatenate([[0], np.asarray(route) + 1, [0]])
+    m = len(route)
+    i, k = np.triu_indices(m, 1)
+    i, k = i + 1, k + 1
+
+    for _ in range(max_passes):
+        delta = (
+            distances[tour[i - 1], tour[k]] + distances[tour[i], tour[k + 1]]
+            - distances[tour[i - 1], tour[i]] - distances[tour[k], tour[k + 1]]
+        )
+        best = int(np.argmin(delta))
+        if not delta[best] < -1e-9:
+            break
+        tour[i[best]:k[best] + 1] = tour[i[best]:k[best] + 1][::-1]
+
+    return (tour[1:-1] - 1).tolist()
+
+
+def build_city_routes(depots, capacity, neighbors=ROUTING_NEIGHBORS, use_two_opt=False):
+    """
+    Routes of every depot of one city (executed in a worker process).
+
+    Args:
+        depots: List of (depot store id, stop store ids, stop units, stop products, distances)
+        capacity: Units a vehicle carries
+        neighbors: Nearest stops each stop may be joined to
+        use_two_opt: Refine each route with 2-opt
+
+    Returns:
+        List of stop dictionaries (from_store_id, route_key, stop, to_store_id, units,
+        products, leg_km, return_km)
+    """
+    stops = []
+    route_key = 0
+    for depot_id, stop_ids, units, products, distances in depots:
+        # Full truckloads go direct; the remainder of each stop is routed
+        full_loads = units // capacity
+        for s in np.flatnonzero(full_loads):
+            for _ in range(int(full_loads[s])):
+                stops.append(
+                    {
+                        "from_store_id": depot_id,
+                        "route_key": route_key,
+                        "stop": 1,
+                        "to_store_id": int(stop_ids[s]),
+                        "units": int(capacity),
+                        "products": int(products[s]),
+                        "leg_km": float(distances[0, s + 1]),
+                        "return_km": float(distances[s + 1, 0]),
+                    }
+                )
+                route_key += 1
+
+        remainder = units - full_loads * capacity
+        routed = np.flatnonzero(remainder)
+        block = distances[np.ix_(np.concatenate([[0], routed + 1]), np.concatenate([[0], routed + 1]))]
+        for route in clarke_wright(block, remainder[routed], capacity, neighbors):
+            if use_two_opt:
+                route = two_opt(route, block)
+            tour = [0] + [r + 1 for r in route]
+            for position, r in enumerate(route):
+                s = routed[r]
+                stops.append(
+                    {
+                        "from_store_id": depot_id,
+                        "route_key": route_key,
+                        "stop": position + 1,
+                        "to_store_id": int(stop_ids[s]),
+                        "units": int(remainder[s]),
+                        "products": int(products[s]),
+                        "leg_km": float(block[tour[position], r + 1]),
+                        "return_km": float(block[r + 1, 0]) if position == len(route) - 1 else 0.0,
+                    }
+                )
+            route_key += 1
+
+    return stops
+
+
+class RouteBuilder:
+    def __init__(
+        self,
+        capacity=ROUTING_VEHICLE_CAPACITY,
+        neighbors=ROUTING_NEIGHBORS,
+        use_two_opt=False,
+        max_workers=None,
+    ):
+        """
+        Args:
+            capacity: Units a vehicle carries
+            neighbors: Nearest stops each stop may be joined to by the savings heuristic
+            use_two_opt: Refine every route with 2-opt
+            max_workers: Worker processes for the per-city routing (default: CPU count)
+        """
+        self.capacity = capacity
+        self.neighbors = neighbors
+        self.use_two_opt = use_two_opt
+        self.max_workers = max_workers
+        self.logger_system = get_optimization_logger()
+
+    def build_routes(self, transfer_plan, optimizer, stores):
+        """
+        Build vehicle routes for a transfer plan.
+
+        Args:
+            transfer_plan: DataFrame with from_store_id, to_store_id, product_id and units
+            optimizer: Engine whose lane_block() provides distances between stores
+            stores: DataFrame with store_id and city
+
+        Returns:
+            DataFrame with one row per stop: route_id, from_store_id, city, stop,
+            to_store_id, units, products, leg_km, return_km, route_km, route_units
+        """
+        start_time = perf_counter()
+        self.logger_system.log_execution_start(
+            "route_building",
+            {
+                "transfers": len(transfer_plan),
+                "capacity": self.capacity,
+                "two_opt": self.use_two_opt,
+            },
+        )
+
+        deliveries = transfer_plan.groupby(["from_store_id", "to_store_id"], sort=True).agg(
+            units=("units", "sum"), products=("product_id", "nunique")
+        ).reset_index()
+        city_of = stores.set_index("store_id")["city"]
+        deliveries["city"] = deliveries["from_store_id"].map(city_of).fillna("unknown")
+
+        tasks = []
+        for city, city_deliveries in deliveries.groupby("city", sort=True):
+            depots = []
+            for depot_id, depot_deliveries in city_deliveries.groupby("from_store_id", sort=True):
+                stop_ids = depot_deliveries["to_store_id"].to_numpy(dtype=np.int64)
+                nodes = np.concatenate([[depot_id], stop_ids])
+                distances, _ = optimizer.lane_block(nodes, nodes)
+                depots.append(
+                    (
+                        int(depot_id),
+                        stop_ids,
+                        depot_deliveries["units"].to_numpy(dtype=np.int64),
+                        depot_deliveries["products"].to_numpy(dtype=np.int64),
+                        np.nan_to_num(np.asarray(distances, dtype=np.float64)),
+                    )
+                )
+            tasks.append((city, depots))
+
+        print(
+            f"Building routes for {len(deliveries)} deliveries from "
+            f"{deliveries['from_store_id'].nunique()} origins in {len(tasks)} cities..."
+        )
+
+        workers = min(self.max_workers or os.cpu_count() or 1, len(tasks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(
+                    executor.map(
+                        build_city_routes,
+                        [depots for _, depots in tasks],
+                        [self.capacity] * len(tasks),
+                        [self.neighbors] * len(tasks),
+                        [self.use_two_opt] * len(tasks),
+                    )
+                )
+        else:
+            results = [
+                build_city_routes(depots, self.capacity, self.neighbors, self.use_two_opt)
+                for _, depots in tasks
+            ]
+
+        routes = pd.DataFrame(
+            [
+                {"city": city, **stop}
+                for (city, _), city_stops in zip(tasks, results)
+                for stop in city_stops
+            ]
+        )
+        if routes.empty:
+            self.logger_system.log_execution_end("route_building", perf_counter() - start_time, {"routes": 0})
+            return routes
+
+        routes["route_id"] = routes.groupby(["from_store_id", "route_key"], sort=False).ngroup() + 1
+        totals = routes.groupby("route_id")
+        routes["route_km"] = totals["leg_km"].transform("sum") + totals["return_km"].transform("sum")
+        routes["route_units"] = totals["units"].transform("sum")
+        routes = routes[
+            [
+                "route_id", "from_store_id", "city", "stop", "to_store_id", "units",
+                "products", "leg_km", "return_km", "route_km", "route_units",
+            ]
+        ]
+
+        self._report(routes, transfer_plan, start_time)
+        return routes
+
+    def _report(self, routes, transfer_plan, start_time):
+        """Compare the routes with one out-and-back leg per transfer line."""
+        separate_km = float(2 * transfer_plan["distance_km"].sum())
+        route_km = float(routes.drop_duplicates("route_id")["route_km"].sum())
+        num_routes = int(routes["route_id"].nunique())
+
+        print("Route Summary:")
+        print(f"- Vehicle routes: {num_routes} for {len(transfer_plan)} transfers ({len(routes)} stops)")
+        print(f"- Average stops per route: {len(routes) / num_routes:.1f}")
+        print(f"- Route distance: {route_km:,.1f} km (separate out-and-back legs: {separate_km:,.1f} km)")
+
+        self.logger_system.log_execution_end(
+            "route_building",
+            perf_counter() - start_time,
+            {
+                "routes": num_routes,
+                "stops": len(routes),
+                "route_km": route_km,
+                "separate_legs_km": separate_km,
+            },
+        )
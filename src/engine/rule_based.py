@@ -1,24 +1,80 @@
+import os
 from time import time
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
+from config import SPARSE_LANES_FILE, SPATIAL_INDEX_K
+from utils.geo import haversine_km, transport_cost_per_unit
 from utils.logger import get_optimization_logger
+from utils.sparse_lanes import SparseLaneMatrix
+from utils.spatial_index import StoreSpatialIndex
 
 
 class RuleBasedOptimizer:
-    def __init__(self, distance_matrix=None, transport_cost_matrix=None):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        stores=None,
+        stores_path=None,
+        use_spatial_index=False,
+        spatial_k=SPATIAL_INDEX_K,
+    ):
         """
         Args:
             distance_matrix: Matrix of distances between stores
             transport_cost_matrix: Matrix of transport costs between stores
+            stores: DataFrame with store_id, city, latitude and longitude
+            stores_path: Path of stores.csv (loaded on demand if stores is None)
+            use_spatial_index: Find nearest donors with a spatial index over store
+                coordinates instead of the distance/cost matrices
+            spatial_k: Initial number of nearest donors queried per need
         """
         self.distance_matrix = distance_matrix
         self.transport_cost_matrix = transport_cost_matrix
+        self.stores = stores
+        self.stores_path = stores_path
+        self.use_spatial_index = use_spatial_index
+        self.spatial_k = spatial_k
+        self.sparse_lanes = None
         self.transfer_plan = None 
         self.logger_system = get_optimization_logger()
         
+    def load_stores(self, stores_path=None):
+        """
+        Load store coordinates (once).
+
+        Args:
+            stores_path: Path of stores.csv (defaults to self.stores_path)
+        """
+        if self.stores is not None:
+            return
+        
+        self.stores_path = stores_path or self.stores_path
+        if self.stores_path is None:
+            raise ValueError(
+                "Store coordinates are required: pass stores/stores_path or call load_matrices()"
+            )
+        print(f"Loading store coordinates from {self.stores_path}...")
+        self.stores = pd.read_csv(self.stores_path)
+        
     def load_matrices(self, distance_path, cost_path):
+        if self.use_spatial_index:
+            # Lanes are priced on demand; only the stores.csv next to the matrices is needed
+            self.load_stores(self.stores_path or os.path.join(os.path.dirname(distance_path), "stores.csv"))
+            return
+        
+        # A sparse k-nearest lane file is accepted in place of the dense matrices
+        sparse_path = os.path.join(os.path.dirname(distance_path), SPARSE_LANES_FILE)
+        if distance_path.endswith(".npz") or (
+            not os.path.exists(distance_path) and os.path.exists(sparse_path)
+        ):
+            sparse_path = distance_path if distance_path.endswith(".npz") else sparse_path
+            print(f"Loading sparse k-nearest lane matrix from {sparse_path}...")
+            self.sparse_lanes = SparseLaneMatrix.load(sparse_path)
+            return
+        
         print("Loading distance and transport cost matrices...")
         
         self.distance_matrix = pd.read_csv(distance_path, index_col=0)
@@ -29,6 +85,47 @@ class RuleBasedOptimizer:
         self.transport_cost_matrix.index = self.transport_cost_matrix.index.astype(int)
         self.transport_cost_matrix.columns = self.transport_cost_matrix.columns.astype(int)
         
+    def lane_block(self, from_store_ids, to_store_ids):
+        """
+        Distances and unit costs between two sets of stores (inf = no lane).
+        Taken from the dense matrices when loaded, otherwise priced from store
+        coordinates (sparse lane file or stores.csv) with the utils.geo model.
+
+        Args:
+            from_store_ids: Origin store ids
+            to_store_ids: Destination store ids
+
+        Returns:
+            Tuple of (distances, unit costs), each (len(from) x len(to))
+        """
+        from_store_ids = np.asarray(from_store_ids, dtype=np.int64)
+        to_store_ids = np.asarray(to_store_ids, dtype=np.int64)
+        
+        if self.transport_cost_matrix is not None:
+            costs = self.transport_cost_matrix.reindex(index=from_store_ids, columns=to_store_ids).to_numpy()
+            distances = self.distance_matrix.reindex(index=from_store_ids, columns=to_store_ids).to_numpy()
+        else:
+            if self.sparse_lanes is not None:
+                lanes = self.sparse_lanes
+                stores = pd.DataFrame(
+                    {"latitude": lanes.latitudes, "longitude": lanes.longitudes, "city": lanes.cities},
+                    index=lanes.store_ids,
+                )
+            else:
+                self.load_stores()
+                stores = self.stores.set_index("store_id")
+            stores = stores.reindex(np.concatenate([from_store_ids, to_store_ids]))
+            lat = stores["latitude"].to_numpy(dtype=np.float64)
+            lon = stores["longitude"].to_numpy(dtype=np.float64)
+            city = stores["city"].astype(str).to_numpy()
+            n = len(from_store_ids)
+            distances = haversine_km(lat[:n, None], lon[:n, None], lat[None, n:], lon[None, n:])
+            costs = transport_cost_per_unit(distances, city[:n, None] == city[None, n:])
+        
+        costs = np.where(np.isnan(costs) | (costs <= 0), np.inf, costs)
+        costs[from_store_ids[:, None] == to_store_ids[None, :]] = np.inf
+        return distances, costs
+        
     def optimize(self, excess_inventory, needed_inventory):
         """
         Generate a transfer plan using rule-based approach.
@@ -40,7 +137,7 @@ class RuleBasedOptimizer:
         Returns:
             DataFrame containing transfer recommendations
         """
-        start_time = time.time()
+        start_time = time()
         
         parameters = {
             "excess_items": len(excess_inventory) if not excess_inventory.empty else 0,
@@ -61,7 +158,7 @@ class RuleBasedOptimizer:
             self.logger_system.log_progress("rule_based_optimization", message)
             self.transfer_plan = pd.DataFrame()
             
-            execution_time = time.time() - start_time
+            execution_time = time() - start_time
             results = {
                 "transfers_generated": 0,
                 "reason": "No excess or needed inventory"
@@ -71,20 +168,299 @@ class RuleBasedOptimizer:
             )
             return self.transfer_plan
         
-        transfers = []
-        
         self.logger_system.log_progress(
             "rule_based_optimization", "Sorting excess and needed inventory..."
         )
 
-        excess_sorted = excess_inventory.sort_values("excess_units", ascending=False)
-        needed_sorted = needed_inventory.sort_values("needed_units", ascending=False)
+        # Stable sorts with a store tiebreak, so the order within a product does not
+        # depend on which other products are solved alongside (incremental re-solves)
+        excess_sorted = excess_inventory.sort_values(
+            ["excess_units", "store_id"], ascending=[False, True], kind="stable"
+        )
+        needed_sorted = needed_inventory.sort_values(
+            ["needed_units", "store_id"], ascending=[False, True], kind="stable"
+        )
         
         self.logger_system.log_progress(
             "rule_based_optimization",
             f"Processing {len(excess_sorted)} excess items and {len(needed_sorted)} needed items",
         )
         
+        if self.use_spatial_index:
+            transfers = self._allocate_with_spatial_index(excess_sorted, needed_sorted)
+        elif self.sparse_lanes is not None:
+            transfers = self._allocate_with_sparse_lanes(excess_sorted, needed_sorted)
+        else:
+            transfers = self._allocate_with_matrices(excess_sorted, needed_sorted)
+        
+        self.transfer_plan = pd.DataFrame(transfers)
+    
+        if not self.transfer_plan.empty:
+            total_units = self.transfer_plan["units"].sum()
+            total_cost = self.transfer_plan["transport_cost"].sum()
+            avg_cost_per_unit = total_cost / total_units if total_units > 0 else 0
+            
+            summary_msg = f"Rule_based Transfer Plan Summary:"
+            print(summary_msg)
+            print(f"- Total transfers: {len(self.transfer_plan)}")
+            print(f"- Total units to transfer: {total_units}")
+            print(f"- Total transport cost: {total_cost:,.0f} VND")
+            print(f"- Average cost per unit: {avg_cost_per_unit:,.0f} VND")
+            
+            self.logger_system.log_progress("rule_based_optimization", summary_msg)
+            self.logger_system.log_progress(
+                "rule_based_optimization", f"Total transfers: {len(self.transfer_plan)}"
+            )
+            self.logger_system.log_progress(
+                "rule_based_optimization", f"Total units to transfer: {total_units}"
+            )
+            self.logger_system.log_progress(
+                "rule_based_optimization",
+                f"Total transport cost: {total_cost:,.0f} VND",
+            )
+            self.logger_system.log_progress(
+                "rule_based_optimization",
+                f"Average cost per unit: {avg_cost_per_unit:,.0f} VND",
+            )
+            
+        else:
+            no_transfer_msg = "No transfers recommended."
+            print(no_transfer_msg)
+            self.logger_system.log_progress("rule_based_optimization", no_transfer_msg)
+            
+        execution_time = time() - start_time
+        results = {
+            "transfers_generated": len(self.transfer_plan),
+            "total_units": (
+                self.transfer_plan["units"].sum() if not self.transfer_plan.empty else 0
+            ),
+            "total_costs": (
+                self.transfer_plan["transport_cost"].sum()
+                if not self.transfer_plan.empty
+                else 0
+            ),
+            "avg_cost_oper_unit": (
+                (
+                    self.transfer_plan["transport_cost"].sum()
+                    / self.transfer_plan["units"].sum()
+                )
+                if not self.transfer_plan.empty
+                and self.transfer_plan["units"].sum() > 0
+                else 0
+            ),
+        }
+        
+        self.logger_system.log_execution_end(
+            "rule_based_optimization", execution_time, results
+        )
+        
+        return self.transfer_plan
+    
+    def _allocate_with_spatial_index(self, excess_sorted, needed_sorted):
+        """
+        Nearest-donor allocation using k-nearest queries on store coordinates.
+        Distance and cost are only computed for the queried lanes.
+
+        Args:
+            excess_sorted: Excess inventory sorted by excess_units (descending)
+            needed_sorted: Needed inventory sorted by needed_units (descending)
+
+        Returns:
+            List of transfer dictionaries
+        """
+        self.load_stores()
+        index = StoreSpatialIndex(self.stores)
+        
+        # product_id -> {store_id: units left}, a KD-tree over its donors and the
+        # number of donors in the tree that still hold stock
+        remaining = {}
+        donor_indexes = {}
+        active_donors = {}
+        for product_id, product_excess in excess_sorted.groupby("product_id"):
+            remaining[product_id] = dict(
+                zip(product_excess["store_id"].astype(int), product_excess["excess_units"])
+            )
+            donor_indexes[product_id] = index.subset(remaining[product_id])
+            active_donors[product_id] = sum(
+                1 for store_id in donor_indexes[product_id].store_ids.tolist()
+                if remaining[product_id][store_id] > 0
+            )
+        
+        transfers = []
+        skipped = 0
+        
+        for need_store_id, need_product_id, needed_units in tqdm(
+            zip(
+                needed_sorted["store_id"].astype(int),
+                needed_sorted["product_id"],
+                needed_sorted["needed_units"],
+            ),
+            total=len(needed_sorted),
+            desc="Processing needed inventory",
+            unit="item",
+        ):
+            product_remaining = remaining.get(need_product_id)
+            if not product_remaining:
+                continue
+            if need_store_id not in index:
+                skipped += 1
+                continue
+            
+            donors = donor_indexes[need_product_id]
+            k = self.spatial_k
+            while needed_units > 0:
+                for excess_store_id, distance in donors.nearest(need_store_id, k):
+                    excess_units = product_remaining[excess_store_id]
+                    if excess_store_id == need_store_id or excess_units <= 0:
+                        continue
+                    
+                    transfer_units = min(needed_units, excess_units)
+                    transfers.append(
+                        {
+                            "from_store_id": excess_store_id,
+                            "to_store_id": need_store_id,
+                            "product_id": need_product_id,
+                            "units": int(transfer_units),
+                            "distance_km": distance,
+                            "transport_cost": index.lane_cost(
+                                excess_store_id, need_store_id, distance
+                            )
+                            * transfer_units,
+                        }
+                    )
+                    product_remaining[excess_store_id] -= transfer_units
+                    if product_remaining[excess_store_id] <= 0:
+                        active_donors[need_product_id] -= 1
+                    needed_units -= transfer_units
+                    if needed_units <= 0:
+                        break
+                
+                if k >= len(donors):
+                    break
+                k *= 2
+            
+            # Drop exhausted donors from the tree once they dominate the queries
+            exhausted = len(donors) - active_donors[need_product_id]
+            if exhausted and exhausted * 2 >= len(donors):
+                donor_indexes[need_product_id] = index.subset(
+                    [s for s, units in product_remaining.items() if units > 0]
+                )
+                remaining[need_product_id] = {
+                    s: units for s, units in product_remaining.items() if units > 0
+                }
+                active_donors[need_product_id] = len(donor_indexes[need_product_id])
+        
+        if skipped:
+            self.logger_system.log_progress(
+                "rule_based_optimization",
+                f"Skipped {skipped} needs of stores without coordinates",
+            )
+        
+        return transfers
+    
+    def _allocate_with_sparse_lanes(self, excess_sorted, needed_sorted):
+        """
+        Nearest-donor allocation using the sparse k-nearest lane matrix.
+        Donors among the stored neighbours of a need are used first; if they
+        cannot cover it, the remaining donors are priced from coordinates.
+
+        Args:
+            excess_sorted: Excess inventory sorted by excess_units (descending)
+            needed_sorted: Needed inventory sorted by needed_units (descending)
+
+        Returns:
+            List of transfer dictionaries
+        """
+        lanes = self.sparse_lanes
+        
+        remaining = {
+            product_id: dict(
+                zip(product_excess["store_id"].astype(int), product_excess["excess_units"])
+            )
+            for product_id, product_excess in excess_sorted.groupby("product_id")
+        }
+        
+        transfers = []
+        skipped = 0
+        fallback_lookups = 0
+        
+        for need_store_id, need_product_id, needed_units in tqdm(
+            zip(
+                needed_sorted["store_id"].astype(int),
+                needed_sorted["product_id"],
+                needed_sorted["needed_units"],
+            ),
+            total=len(needed_sorted),
+            desc="Processing needed inventory",
+            unit="item",
+        ):
+            product_remaining = remaining.get(need_product_id)
+            if not product_remaining:
+                continue
+            if need_store_id not in lanes:
+                skipped += 1
+                continue
+            
+            neighbor_ids, distances, costs = lanes.neighbors_of(need_store_id)
+            candidates = [
+                (int(store_id), distance, cost)
+                for store_id, distance, cost in zip(neighbor_ids, distances, costs)
+                if product_remaining.get(int(store_id), 0) > 0
+            ]
+            
+            if sum(product_remaining[s] for s, _, _ in candidates) < needed_units:
+                # Lanes outside the sparse set: price the other donors on the fly
+                stored = set(neighbor_ids.tolist())
+                others = [
+                    s for s, units in product_remaining.items()
+                    if units > 0 and s != need_store_id and s not in stored and s in lanes
+                ]
+                if others:
+                    fallback_lookups += 1
+                    other_distances, other_costs = lanes.lanes_to(need_store_id, others)
+                    order = np.argsort(other_distances, kind="stable")
+                    candidates.extend(
+                        (others[i], other_distances[i], other_costs[i]) for i in order
+                    )
+            
+            for excess_store_id, distance, cost in candidates:
+                transfer_units = min(needed_units, product_remaining[excess_store_id])
+                transfers.append(
+                    {
+                        "from_store_id": excess_store_id,
+                        "to_store_id": need_store_id,
+                        "product_id": need_product_id,
+                        "units": int(transfer_units),
+                        "distance_km": float(distance),
+                        "transport_cost": float(cost) * transfer_units,
+                    }
+                )
+                product_remaining[excess_store_id] -= transfer_units
+                needed_units -= transfer_units
+                if needed_units <= 0:
+                    break
+        
+        self.logger_system.log_progress(
+            "rule_based_optimization",
+            f"Sparse lanes: {fallback_lookups} needs priced outside the stored neighbours"
+            + (f", {skipped} needs of unknown stores skipped" if skipped else ""),
+        )
+        
+        return transfers
+    
+    def _allocate_with_matrices(self, excess_sorted, needed_sorted):
+        """
+        Nearest-donor allocation using the distance and transport cost matrices.
+
+        Args:
+            excess_sorted: Excess inventory sorted by excess_units (descending)
+            needed_sorted: Needed inventory sorted by needed_units (descending)
+
+        Returns:
+            List of transfer dictionaries
+        """
+        transfers = []
+        
         transferred_from = {}
         for _, row in excess_sorted.iterrows():
             key = (row["store_id"], row["product_id"])
@@ -113,7 +489,9 @@ class RuleBasedOptimizer:
                 if needed_units <= 0:
                     continue
                 
-                excess_for_product = excess_for_product.copy()
+                excess_for_product = excess_sorted[
+                    excess_sorted["product_id"] == need_product_id
+                ].copy()
                 
                 excess_for_product["distance"] = excess_for_product["store_id"].apply(
                     lambda x: (
@@ -125,7 +503,7 @@ class RuleBasedOptimizer:
                     )
                 )
                 
-                excess_for_product = excess_for_product.sort_values("distance")
+                excess_for_product = excess_for_product.sort_values("distance", kind="stable")
                 
                 for _, excess_row in excess_for_product.iterrows():
                     excess_store_id = excess_row['store_id']
@@ -205,70 +583,9 @@ class RuleBasedOptimizer:
                             break
                         
                 pbar.set_postfix({"product": need_product_id, "store": need_store_id})
-                
-        self.transfer_plan = pd.DataFrame(transfers)
-    
-        if not self.transfer_plan.empty:
-            total_units = self.transfer_plan["units"].sum()
-            total_cost = self.transfer_plan["transport_cost"].sum()
-            avg_cost_per_unit = total_cost / total_units if total_units > 0 else 0
-            
-            summary_msg = f"Rule_based Transfer Plan Summary:"
-            print(summary_msg)
-            print(f"- Total transfers: {len(self.transfer_plan)}")
-            print(f"- Total units to transfer: {total_units}")
-            print(f"- Total transport cost: {total_cost:,.0f} VND")
-            print(f"- Average cost per unit: {avg_cost_per_unit:,.0f} VND")
-            
-            self.logger_system.log_progress("rule_based_optimization", summary_msg)
-            self.logger_system.log_progress(
-                "rule_based_optimization", f"Total transfers: {len(self.transfer_plan)}"
-            )
-            self.logger_system.log_progress(
-                "rule_based_optimization", f"Total units to transfer: {total_units}"
-            )
-            self.logger_system.log_progress(
-                "rule_based_optimization",
-                f"Total transport cost: {total_cost:,.0f} VND",
-            )
-            self.logger_system.log_progress(
-                "rule_based_optimization",
-                f"Average cost per unit: {avg_cost_per_unit:,.0f} VND",
-            )
-            
-        else:
-            no_transfer_msg = "No transfers recommended."
-            print(no_transfer_msg)
-            self.logger_system.log_progress("rule_based_optimization", no_transfer_msg)
-            
-        execution_time = time.time() - start_time
-        results = {
-            "transfers_generated": len(self.transfer_plan),
-            "total_units": (
-                self.transfer_plan["units"].sum() if not self.transfer_plan.empty else 0
-            ),
-            "total_costs": (
-                self.transfer_plan["transport_cost"].sum()
-                if not self.transfer_plan.empty
-                else 0
-            ),
-            "avg_cost_oper_unit": (
-                (
-                    self.transfer_plan["transport_cost"].sum()
-                    / self.transfer_plan["units"].sum()
-                )
-                if not self.transfer_plan.empty
-                and self.transfer_plan["units"].sum() > 0
-                else 0
-            ),
-        }
-        
-        self.logger_system.log_execution_end(
-            "rule_based_optimization", execution_time, results
-        )
-        
-        return self.transfer_plan
-    
+
+        return transfers
+
     def add_store_product_names(self, stores_df=None, product_df=None):
         """
         Add store names and product names to the transfer plan for better readability.
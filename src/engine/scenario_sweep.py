@@ -0,0 +1,260 @@
+"""
+Multi-threshold scenario sweep.
+
+Tuning --min-days/--max-days used to mean one full run per pair. The sweep
+loads the data and computes the sales aggregates once, derives the excess and
+needed sets of every (min_days, max_days) grid point with vectorized threshold
+comparisons over the shared days-of-inventory array, runs the optimizer for
+each scenario in parallel worker processes (matrices shared through shared
+memory) and returns one comparison table.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from engine.registry import create_engine
+from utils.shared_frames import SharedFrameStore, attach_frame
+
+
+IMBALANCE_COLUMNS = ["store_id", "product_id", "current_stock", "avg_daily_sales", "days_of_inventory"]
+
+
+def build_scenario_grid(min_days_values, max_days_values):
+    """
+    Cartesian product of thresholds, keeping pairs with min_days < max_days.
+
+    Returns:
+        List of (min_days, max_days) tuples
+    """
+    return [
+        (min_days, max_days)
+        for min_days, max_days in itertools.product(sorted(set(min_days_values)), sorted(set(max_days_values)))
+        if min_days < max_days
+    ]
+
+
+def split_imbalance_grid(analysis_df, grid):
+    """
+    Excess and needed inventory of every grid point in one vectorized pass.
+    Equivalent to InventoryAnalyzer.split_imbalances for each pair.
+
+    Args:
+        analysis_df: Output of InventoryAnalyzer.analyze_sales_data
+        grid: List of (min_days, max_days)
+
+    Returns:
+        List of (excess_inventory_df, needed_inventory_df), one per grid point
+    """
+    # Demand spread used by the Stochastic engine, as in split_imbalances
+    columns = IMBALANCE_COLUMNS + [column for column in ("quantity_std",) if column in analysis_df.columns]
+    base = analysis_df[columns].reset_index(drop=True)
+    stock = base["current_stock"].to_numpy(dtype=np.float64)
+    daily = base["avg_daily_sales"].to_numpy(dtype=np.float64)
+    days = base["days_of_inventory"].to_numpy(dtype=np.float64)
+
+    min_days = np.array([pair[0] for pair in grid], dtype=np.float64)[:, None]
+    max_days = np.array([pair[1] for pair in grid], dtype=np.float64)[:, None]
+    if "safety_days" in analysis_df.columns:
+        # Per-row safety stock shifts every scenario's thresholds
+        safety = np.nan_to_num(analysis_df["safety_days"].to_numpy(dtype=np.float32))[None, :]
+        min_days = min_days.astype(np.float32) + safety
+        max_days = max_days.astype(np.float32) + safety
+
+    # (scenarios x items) arrays
+    excess_units = (stock[None, :] - daily[None, :] * max_days).astype(int)
+    excess_mask = (days[None, :] > max_days) & (excess_units > 0)
+    needed_units = (daily[None, :] * min_days - stock[None, :]).astype(int)
+    needed_mask = (days[None, :] < min_days) & (needed_units > 0)
+
+    scenarios = []
+    for s in range(len(grid)):
+        excess_rows = np.flatnonzero(excess_mask[s])
+        needed_rows = np.flatnonzero(needed_mask[s])
+        scenarios.append(
+            (
+                base.iloc[excess_rows].assign(excess_units=excess_units[s, excess_rows]).reset_index(drop=True),
+                base.iloc[needed_rows].assign(needed_units=needed_units[s, needed_rows]).reset_index(drop=True),
+            )
+        )
+    return scenarios
+
+
+def _optimize_scenario(engine_name, engine_params, engine_state, descriptors, excess, needed):
+    """Run one scenario (executed in a worker process when running in parallel)."""
+    attached = {}
+    try:
+        engine = create_engine(engine_name, **engine_params)
+        for key, value in engine_state.items():
+            setattr(engine, key, value)
+        for key, descriptor in (descriptors or {}).items():
+            attached[key] = attach_frame(descriptor)
+            setattr(engine, key, attached[key][0])
+
+        start_time = perf_counter()
+        transfer_plan = engine.optimize(excess, needed)
+        runtime = perf_counter() - start_time
+
+        # Detach the result from shared buffers before they are closed
+        return transfer_plan.copy(deep=True), runtime
+    finally:
+        for _, shm in attached.values():
+            shm.close()
+
+
+def scenario_metrics(analysis_df, excess, needed, transfer_plan):
+    """
+    Cost and balance metrics of one scenario.
+
+    Args:
+        analysis_df: Shared analysis rows
+        excess: Scenario excess inventory
+        needed: Scenario needed inventory
+        transfer_plan: Scenario transfer plan
+
+    Returns:
+        Dictionary of metrics
+    """
+    needed_units = needed["needed_units"].sum() if not needed.empty else 0
+    metrics = {
+        "excess_items": len(excess),
+        "excess_units": int(excess["excess_units"].sum()) if not excess.empty else 0,
+        "needed_items": len(needed),
+        "needed_units": int(needed_units),
+        "transfers": 0,
+        "units_transferred": 0,
+        "transport_cost": 0.0,
+        "cost_per_unit": 0.0,
+        "need_fill_rate": 0.0,
+    }
+
+    days_before = analysis_df["days_of_inventory"].to_numpy(dtype=np.float64)
+    stock_after = analysis_df["current_stock"].to_numpy(dtype=np.float64)
+
+    if transfer_plan is not None and not transfer_plan.empty:
+        units = transfer_plan["units"].sum()
+        cost = transfer_plan["transport_cost"].sum()
+        received = transfer_plan.groupby(["to_store_id", "product_id"])["units"].sum()
+        shipped = transfer_plan.groupby(["from_store_id", "product_id"])["units"].sum()
+
+        keys = pd.MultiIndex.from_frame(analysis_df[["store_id", "product_id"]].astype(int))
+        stock_after = (
+            stock_after
+            + received.reindex(keys).fillna(0).to_numpy()
+            - shipped.reindex(keys).fillna(0).to_numpy()
+        )
+        filled = np.minimum(
+            received.reindex(pd.MultiIndex.from_frame(needed[["store_id", "product_id"]].astype(int)))
+            .fillna(0)
+            .to_numpy(),
+            needed["needed_units"].to_numpy(),
+        ).sum()
+
+        metrics.update(
+            {
+                "transfers": len(transfer_plan),
+                "units_transferred": int(units),
+                "transport_cost": float(cost),
+                "cost_per_unit": float(cost / units) if units > 0 else 0.0,
+                "need_fill_rate": float(filled / needed_units * 100) if needed_units > 0 else 0.0,
+            }
+        )
+
+    days_after = stock_after / analysis_df["avg_daily_sales"].to_numpy(dtype=np.float64)
+    std_before, std_after = np.std(days_before, ddof=1), np.std(days_after, ddof=1)
+    metrics.update(
+        {
+            "days_std_before": float(std_before),
+            "days_std_after": float(std_after),
+            "balance_improvement": float((std_before - std_after) / std_before * 100) if std_before > 0 else 0.0,
+        }
+    )
+    return metrics
+
+
+def run_scenario_sweep(
+    analysis_df,
+    grid,
+    engine_name="Rule-based",
+    engine_params=None,
+    loader=None,
+    max_workers=None,
+):
+    """
+    Optimize every threshold scenario and compare them.
+
+    Args:
+        analysis_df: Output of InventoryAnalyzer.analyze_sales_data (computed once)
+        grid: List of (min_days, max_days)
+        engine_name: Registered engine used for every scenario
+        engine_params: Constructor parameter overrides of the engine
+        loader: Engine instance whose matrices/stores are already loaded and shared
+        max_workers: Worker processes (default: CPU count)
+
+    Returns:
+        Comparison DataFrame, one row per scenario
+    """
+    engine_params = engine_params or {}
+    print(f"Deriving excess/needed sets for {len(grid)} threshold scenarios...")
+    scenarios = split_imbalance_grid(analysis_df, grid)
+
+    # Loaded inputs every scenario reuses: dense matrices go through shared memory
+    matrices = {
+        key: getattr(loader, key, None) for key in ("distance_matrix", "transport_cost_matrix")
+    }
+    engine_state = {
+        key: getattr(loader, key)
+        for key in ("sparse_lanes", "stores")
+        if getattr(loader, key, None) is not None
+    }
+
+    workers = min(max_workers or os.cpu_count() or 1, len(grid))
+    outcomes = [None] * len(grid)
+    start_time = perf_counter()
+
+    if workers > 1:
+        print(f"Running {len(grid)} scenarios on {workers} processes with {engine_name}...")
+        with SharedFrameStore() as store:
+            descriptors = {
+                key: store.publish(matrix) for key, matrix in matrices.items() if matrix is not None
+            }
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        _optimize_scenario, engine_name, engine_params, engine_state, descriptors, excess, needed
+                    )
+                    for excess, needed in scenarios
+                ]
+                for s, future in enumerate(futures):
+                    try:
+                        outcomes[s] = future.result()
+                    except Exception as e:
+                        outcomes[s] = e
+    else:
+        print(f"Running {len(grid)} scenarios sequentially with {engine_name}...")
+        state = {**engine_state, **{key: m for key, m in matrices.items() if m is not None}}
+        for s, (excess, needed) in enumerate(scenarios):
+            try:
+                outcomes[s] = _optimize_scenario(engine_name, engine_params, state, None, excess, needed)
+            except Exception as e:
+                outcomes[s] = e
+
+    rows = []
+    for (min_days, max_days), (excess, needed), outcome in zip(grid, scenarios, outcomes):
+        row = {"min_days": min_days, "max_days": max_days}
+        if isinstance(outcome, Exception):
+            print(f"Scenario min {min_days} / max {max_days} days failed: {outcome}")
+            row.update(scenario_metrics(analysis_df, excess, needed, None))
+            row.update({"runtime_s": None, "status": f"failed: {outcome}"})
+        else:
+            transfer_plan, runtime = outcome
+            row.update(scenario_metrics(analysis_df, excess, needed, transfer_plan))
+            row.update({"runtime_s": runtime, "status": "completed"})
+        rows.append(row)
+
+    print(f"Scenario sweep finished in {perf_counter() - start_time:.2f} seconds.")
+    return pd.DataFrame(rows)
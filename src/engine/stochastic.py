@@ -0,0 +1,364 @@
+"""
+Stochastic (scenario-based) optimizer.
+
+The deterministic engines move units until every store reaches its threshold
+under the average daily sales, so a plan can look balanced and still stock out
+when demand spikes. This engine samples K demand scenarios over a planning
+horizon for every donor and receiver (gamma draws matching the mean and
+standard deviation from analyze_sales_data) and allocates so as to minimize
+expected lost margin plus transport cost:
+
+1. Every need and excess is split into lots. The expected shortfall
+   E[max(D - stock, 0)] of each cell is evaluated at every lot boundary against
+   all scenarios at once, as (K x cells) array operations over blocks of cells
+   sized to STOCHASTIC_BLOCK_MB.
+2. A lot of a receiver is worth its drop in expected shortfall times the
+   product's margin; taking a lot from a donor costs its rise in expected
+   shortfall. Receiver lots are served in order of value from the donor with
+   the lowest transport plus expected-loss cost, and only while the expected
+   gain exceeds that cost.
+
+Lanes come from the dense cost matrix when loaded, otherwise they are priced
+from store coordinates with the utils.geo cost model.
+"""
+
+import os
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    RANDOM_SEED,
+    STOCHASTIC_BLOCK_MB,
+    STOCHASTIC_HORIZON_DAYS,
+    STOCHASTIC_LOTS,
+    STOCHASTIC_SCENARIOS,
+    STOCHASTIC_STOCKOUT_COST,
+)
+from engine.rule_based import RuleBasedOptimizer
+
+
+def sample_demand(mean, std, num_scenarios, rng):
+    """
+    Draw demand scenarios from gamma distributions matching mean and std
+    (deterministic where std is 0).
+
+    Args:
+        mean: Mean demand per cell
+        std: Standard deviation of demand per cell
+        num_scenarios: Scenarios to draw (K)
+        rng: numpy Generator
+
+    Returns:
+        (K x cells) array of demand
+    """
+    mean = np.maximum(mean, 1e-9)
+    variance = np.square(std)
+    random = variance > 0
+    shape = np.where(random, mean * mean / np.where(random, variance, 1), 1.0)
+    scale = np.where(random, variance / mean, 1.0)
+    samples = rng.gamma(shape, scale, size=(num_scenarios, len(mean)))
+    return np.where(random, samples, mean)
+
+
+def expected_shortfall(mean, std, levels, num_scenarios, block_mb=STOCHASTIC_BLOCK_MB, seed=RANDOM_SEED):
+    """
+    Expected units short, E[max(D - level, 0)], of every cell at several stock
+    levels, estimated over sampled demand scenarios. Cells are processed in
+    blocks so the (K x block) scenario array stays within block_mb; the same
+    seed and cells reproduce the same scenarios.
+
+    Args:
+        mean: Mean horizon demand per cell
+        std: Standard deviation of horizon demand per cell
+        levels: (cells x levels) stock levels to evaluate
+        num_scenarios: Scenarios per cell (K)
+        block_mb: Memory bound of a block of scenarios
+        seed: Random seed
+
+    Returns:
+        (cells x levels) array of expected shortfall
+    """
+    levels = np.asarray(levels, dtype=np.float64).reshape(len(mean), -1)
+    shortfall = np.empty(levels.shape)
+    # Scenario block plus one temporary of the same size
+    block = max(1, int(block_mb * 2**20 // (16 * num_scenarios)))
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, len(mean), block):
+        end = min(start + block, len(mean))
+        demand = sample_demand(mean[start:end], std[start:end], num_scenarios, rng)
+        short = np.empty_like(demand)
+        for level in range(levels.shape[1]):
+            np.subtract(demand, levels[start:end, level], out=short)
+            np.maximum(short, 0, out=short)
+            shortfall[start:end, level] = short.mean(axis=0)
+
+    return shortfall
+
+
+class StochasticOptimizer(RuleBasedOptimizer):
+    def __init__(
+        self,
+        distance_matrix=None,
+        transport_cost_matrix=None,
+        stores=None,
+        stores_path=None,
+        products_path=None,
+        num_scenarios=STOCHASTIC_SCENARIOS,
+        horizon_days=STOCHASTIC_HORIZON_DAYS,
+        lots=STOCHASTIC_LOTS,
+        block_mb=STOCHASTIC_BLOCK_MB,
+        stockout_cost=STOCHASTIC_STOCKOUT_COST,
+        seed=RANDOM_SEED,
+    ):
+        """
+        Args:
+            distance_matrix: Matrix of distances between stores
+            transport_cost_matrix: Matrix of transport costs between stores
+            stores: DataFrame with store_id, city, latitude and longitude
+            stores_path: Path of stores.csv (used when no dense matrices are loaded)
+            products_path: Path of products.csv; price - cost is the lost margin per unit short
+            num_scenarios: Demand scenarios sampled per cell (K)
+            horizon_days: Days of demand each scenario covers
+            lots: Lots each need and excess is split into
+            block_mb: Memory bound of a block of the scenario array
+            stockout_cost: Lost margin per unit short for products without price/cost
+            seed: Random seed of the scenarios
+        """
+        super().__init__(distance_matrix, transport_cost_matrix, stores=stores, stores_path=stores_path)
+        self.products_path = products_path
+        self.num_scenarios = num_scenarios
+        self.horizon_days = horizon_days
+        self.lots = lots
+        self.block_mb = block_mb
+        self.stockout_cost = stockout_cost
+        self.seed = seed
+        self.margins = {}
+        self.expected_shortfall_before = None
+        self.expected_shortfall_after = None
+
+    def load_matrices(self, distance_path, cost_path):
+        data_dir = os.path.dirname(distance_path)
+        if os.path.exists(distance_path) and os.path.exists(cost_path):
+            super().load_matrices(distance_path, cost_path)
+        else:
+            self.load_stores(self.stores_path or os.path.join(data_dir, "stores.csv"))
+
+        products_path = self.products_path or os.path.join(data_dir, "products.csv")
+        if os.path.exists(products_path):
+            products = pd.read_csv(products_path)
+            if {"price", "cost"} <= set(products.columns):
+                self.margins = (
+                    (products["price"] - products["cost"]).clip(lower=0)
+                    .set_axis(products["product_id"].astype(int)).to_dict()
+                )
+
+    def optimize(self, excess_inventory, needed_inventory):
+        """
+        Generate a transfer plan minimizing expected lost margin plus transport cost.
+
+        Args:
+            excess_inventory: DataFrame containing excess inventory
+            needed_inventory: DataFrame containing needed inventory
+
+        Returns:
+            DataFrame containing transfer recommendations
+        """
+        start_time = time()
+        self.logger_system.log_execution_start(
+            "stochastic_optimization",
+            {
+                "excess_items": len(excess_inventory),
+                "needed_items": len(needed_inventory),
+                "scenarios": self.num_scenarios,
+                "horizon_days": self.horizon_days,
+                "algorithm": "Scenario-based expected cost allocation",
+            },
+        )
+
+        if excess_inventory.empty or needed_inventory.empty:
+            print("No excess or needed inventory found. No transfers needed.")
+            self.transfer_plan = pd.DataFrame()
+            self.logger_system.log_execution_end(
+                "stochastic_optimization", time() - start_time, {"transfers_generated": 0}
+            )
+            return self.transfer_plan
+
+        print(
+            f"Generating stochastic transfer plan ({self.num_scenarios} demand scenarios "
+            f"over {self.horizon_days} days)..."
+        )
+
+        donors = excess_inventory.reset_index(drop=True)
+        receivers = needed_inventory.reset_index(drop=True)
+        cells = pd.concat([donors, receivers], ignore_index=True)
+        stock = cells["current_stock"].to_numpy(dtype=np.float64)
+        units = np.concatenate(
+            [donors["excess_units"].to_numpy(dtype=np.float64), receivers["needed_units"].to_numpy(dtype=np.float64)]
+        )
+        mean, std = self._horizon_demand(cells)
+
+        # Stock levels at every lot boundary: donors give lots away, receivers gain them
+        lot_sizes = np.ceil(units / self.lots)
+        steps = np.minimum(lot_sizes[:, None] * np.arange(self.lots + 1)[None, :], units[:, None])
+        direction = np.where(np.arange(len(cells)) < len(donors), -1.0, 1.0)[:, None]
+        shortfall = expected_shortfall(
+            mean, std, stock[:, None] + direction * steps, self.num_scenarios, self.block_mb, self.seed
+        )
+
+        # Per-unit expected loss of each donor lot (non-decreasing) and gain of
+        # each receiver lot (non-increasing), smoothing out sampling noise
+        lot_units = np.maximum(np.diff(steps, axis=1), 1)
+        rates = np.abs(np.diff(shortfall, axis=1)) / lot_units
+        donor_rates = np.maximum.accumulate(rates[: len(donors)], axis=1)
+        receiver_rates = np.minimum.accumulate(rates[len(donors):], axis=1)
+
+        transfers = []
+        for product_id, receiver_rows in receivers.groupby("product_id").indices.items():
+            donor_rows = np.flatnonzero(donors["product_id"].to_numpy() == product_id)
+            if len(donor_rows):
+                transfers.extend(
+                    self._allocate_product(
+                        product_id, donors, receivers, donor_rows, receiver_rows,
+                        units[: len(donors)], units[len(donors):], lot_sizes[: len(donors)],
+                        lot_sizes[len(donors):], donor_rates, receiver_rates,
+                    )
+                )
+
+        self.transfer_plan = pd.DataFrame(
+            transfers,
+            columns=["from_store_id", "to_store_id", "product_id", "units", "distance_km", "transport_cost"],
+        )
+        if not self.transfer_plan.empty:
+            self.transfer_plan = self.transfer_plan.groupby(
+                ["from_store_id", "to_store_id", "product_id"], as_index=False, sort=False
+            ).agg({"units": "sum", "distance_km": "first", "transport_cost": "sum"})
+
+        self._report(cells, stock, mean, std, donors, start_time)
+        return self.transfer_plan
+
+    def _horizon_demand(self, cells):
+        """Mean and standard deviation of demand over the horizon per cell (Poisson when std is unknown)."""
+        daily_mean = cells["avg_daily_sales"].to_numpy(dtype=np.float64)
+        if "quantity_std" in cells.columns:
+            daily_std = cells["quantity_std"].to_numpy(dtype=np.float64)
+        else:
+            daily_std = np.full(len(cells), np.nan)
+        daily_std = np.where(np.isnan(daily_std), np.sqrt(daily_mean), daily_std)
+        return daily_mean * self.horizon_days, daily_std * np.sqrt(self.horizon_days)
+
+    def _allocate_product(
+        self, product_id, donors, receivers, donor_rows, receiver_rows,
+        excess_units, needed_units, donor_lots, receiver_lots, donor_rates, receiver_rates,
+    ):
+        """
+        Serve the lots of one product's receivers in order of expected value.
+
+        Returns:
+            List of transfer dictionaries
+        """
+        margin = self.margins.get(int(product_id), self.stockout_cost)
+        from_ids = donors["store_id"].to_numpy()[donor_rows].astype(int)
+        to_ids = receivers["store_id"].to_numpy()[receiver_rows].astype(int)
+        distances, costs = self.lane_block(from_ids, to_ids)
+        # Receiver-major so each receiver's lanes are contiguous
+        receiver_costs = np.ascontiguousarray(costs.T)
+
+        taken = np.zeros(len(donor_rows))
+        available = excess_units[donor_rows]
+        lots = donor_lots[donor_rows]
+        loss = margin * donor_rates[donor_rows]
+        # Expected loss per unit of each donor's current lot (inf once exhausted)
+        donor_loss = loss[:, 0].copy()
+
+        # Receiver lots, most valuable first
+        values = margin * receiver_rates[receiver_rows]
+        order = np.argsort(-values, axis=None, kind="stable")
+        closed = np.zeros(len(receiver_rows), dtype=bool)
+
+        transfers = []
+        for flat in order:
+            j, lot = divmod(int(flat), self.lots)
+            if closed[j]:
+                continue
+            row = receiver_rows[j]
+            remaining = min(receiver_lots[row], needed_units[row] - receiver_lots[row] * lot)
+
+            while remaining > 0:
+                scores = receiver_costs[j] + donor_loss
+                i = int(np.argmin(scores))
+                if not scores[i] < values[j, lot]:
+                    # Later lots of this receiver are worth less: stop serving it
+                    closed[j] = True
+                    break
+
+                # Stay within the donor's current lot so its loss rate holds
+                donor_lot = min(int(taken[i] // lots[i]), self.lots - 1)
+                shipped = min(remaining, min(lots[i] * (donor_lot + 1), available[i]) - taken[i])
+                transfers.append(
+                    {
+                        "from_store_id": int(from_ids[i]),
+                        "to_store_id": int(to_ids[j]),
+                        "product_id": int(product_id),
+                        "units": int(shipped),
+                        "distance_km": float(distances[i, j]),
+                        "transport_cost": float(costs[i, j]) * shipped,
+                    }
+                )
+                taken[i] += shipped
+                remaining -= shipped
+                if taken[i] >= available[i]:
+                    donor_loss[i] = np.inf
+                else:
+                    donor_loss[i] = loss[i, min(int(taken[i] // lots[i]), self.lots - 1)]
+
+        return transfers
+
+    def _report(self, cells, stock, mean, std, donors, start_time):
+        """Expected shortfall of the involved cells before and after the plan."""
+        after = stock.copy()
+        if not self.transfer_plan.empty:
+            keys = pd.MultiIndex.from_arrays(
+                [cells["store_id"].astype(int), cells["product_id"].astype(int)]
+            )
+            shipped = self.transfer_plan.groupby(["from_store_id", "product_id"])["units"].sum()
+            received = self.transfer_plan.groupby(["to_store_id", "product_id"])["units"].sum()
+            is_donor = np.arange(len(cells)) < len(donors)
+            after -= np.where(is_donor, shipped.reindex(keys).fillna(0).to_numpy(), 0)
+            after += np.where(~is_donor, received.reindex(keys).fillna(0).to_numpy(), 0)
+
+        # Same seed and cells: both states are evaluated on identical scenarios
+        shortfall = expected_shortfall(
+            mean, std, np.column_stack([stock, after]), self.num_scenarios, self.block_mb, self.seed
+        ).sum(axis=0)
+        self.expected_shortfall_before, self.expected_shortfall_after = float(shortfall[0]), float(shortfall[1])
+
+        total_units = int(self.transfer_plan["units"].sum()) if not self.transfer_plan.empty else 0
+        total_cost = float(self.transfer_plan["transport_cost"].sum()) if not self.transfer_plan.empty else 0.0
+
+        print("Stochastic Transfer Plan Summary:")
+        print(f"- Total transfers: {len(self.transfer_plan)}")
+        print(f"- Total units to transfer: {total_units}")
+        print(f"- Total transport cost: {total_cost:,.0f} VND")
+        print(
+            f"- Expected units short over {self.horizon_days} days: "
+            f"{self.expected_shortfall_before:,.1f} -> {self.expected_shortfall_after:,.1f}"
+        )
+        self.logger_system.log_progress(
+            "stochastic_optimization",
+            f"Expected shortfall {self.expected_shortfall_before:,.1f} -> "
+            f"{self.expected_shortfall_after:,.1f} units with {total_units} units moved",
+        )
+        self.logger_system.log_execution_end(
+            "stochastic_optimization",
+            time() - start_time,
+            {
+                "transfers_generated": len(self.transfer_plan),
+                "total_units": total_units,
+                "total_costs": total_cost,
+                "expected_shortfall_before": self.expected_shortfall_before,
+                "expected_shortfall_after": self.expected_shortfall_after,
+            },
+        )
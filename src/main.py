@@ -1,14 +1,21 @@
 from time import time
 import pandas as pd
 from data_generator.data_generator_main import generate_all_data
+from data_generator.matrix_updater import MatrixUpdater
 from engine.results_manager import ResultsManager
-from src.engine.analyzer import InventoryAnalyzer
+from engine.analyzer import InventoryAnalyzer
 import argparse
 from pathlib import Path
 import os
 
-from src.config import (
+from config import (
+    CACHE_DIR,
+    ANYTIME_TIME_BUDGET_S,
+    BACKTEST_LEAD_TIME_DAYS,
+    BACKTEST_REVIEW_DAYS,
     DATA_DIR,
+    ENGINE_TIME_BUDGET_S,
+    EXCESS_PERCENT,
     GA_CROSSOVER_PROB,
     GA_GENERATIONS,
     GA_MUTATION_PROB,
@@ -20,12 +27,40 @@ from src.config import (
     SHORTAGE_PERCENT,
     VISUALIZATIONS_DIR,
     NUM_PRODUCTS,
+    PLAN_CACHE_MAX_MB,
     SALE_DAYS,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_WORKERS,
     REQUIRED_DATA_FILES,
+    SAFETY_STOCK_LEAD_TIME_DAYS,
+    ROLLING_HORIZON_DAYS,
+    PARETO_POINTS,
+    ROLLING_SIMULATION_DAYS,
+    SPARSE_LANES_FILE,
+    STOCHASTIC_SCENARIOS,
+    CONSOLIDATION_TRIP_COST,
+    CONSOLIDATION_TRUCK_CAPACITY,
+    TRANSPORT_BUDGET,
+    ROUTING_VEHICLE_CAPACITY,
+    WAREHOUSES_FILE,
     create_directories,
 )
 
-from src.engine.rule_based import RuleBasedOptimizer
+from api.planning_service import run_service
+from engine.incremental import IncrementalOptimizer
+from engine.local_search import LocalSearchImprover
+from engine.parallel_runner import run_engines_concurrently
+from engine.registry import create_engine, get_engine_names, get_engine_params
+from engine.backtest import Backtester, run_backtests
+from engine.scenario_sweep import build_scenario_grid, run_scenario_sweep
+from engine.pareto import ParetoPlanner
+from engine.rolling_horizon import RollingHorizonPlanner, simulate_rolling_horizon
+from engine.routing import RouteBuilder
+from engine.rule_based import RuleBasedOptimizer
+from utils.hub_network import HubNetwork
+from utils.plan_cache import PlanCache, make_cache_key
+from utils.profiler import StageProfiler
 
 def setup_directories():
     return create_directories()
@@ -40,41 +75,176 @@ def run_data_generation(args):
         random_seed=args.seed,
         min_days=args.min_days,
         max_days=args.max_days,
-        excess_percent = args.excess_percent ,
-        shortage_percent=args.shortage_percent
+        excess_percent=args.excess_percent,
+        shortage_percent=args.shortage_percent,
+        sparse_k=args.sparse_k,
+        road_network_dir=args.road_network,
     )
+
+
+def run_store_update(args):
+    """Apply an updated stores file to the existing matrices."""
+    print("\n=== STORE UPDATE ===")
+    MatrixUpdater(
+        pd.read_csv(args.update_stores), road_network_dir=args.road_network
+    ).update_data_dir(args.data_dir)
           
           
-def run_rule_based_optimization(analyzer, excess_df, needed_df, args):
-    print("\n=== RULE-BASED OPTIMIZATION ===")
+def get_engine_file_prefix(engine_name):
+    """File name prefix of an engine's results (e.g. "Rule-based" -> "rule_based")."""
+    return engine_name.lower().replace("-", "_").replace(" ", "_")
+
+
+def get_engine_overrides(engine_name, args):
+    """Engine parameters set on the command line."""
+    if engine_name == "Anytime":
+        return {"time_budget": args.time_budget}
+    if engine_name == "Hierarchical":
+        return {"stores_path": os.path.join(args.data_dir, "stores.csv")}
+    if engine_name == "Stochastic":
+        return {
+            "stores_path": os.path.join(args.data_dir, "stores.csv"),
+            "products_path": os.path.join(args.data_dir, "products.csv"),
+            "num_scenarios": args.scenarios,
+        }
+    if engine_name == "Consolidated":
+        return {
+            "stores_path": os.path.join(args.data_dir, "stores.csv"),
+            "trip_cost": args.trip_cost,
+            "truck_capacity": args.truck_capacity,
+        }
+    if engine_name == "Budgeted":
+        return {
+            "stores_path": os.path.join(args.data_dir, "stores.csv"),
+            "budget": args.budget,
+        }
+    if engine_name == "Rule-based" and args.spatial_index:
+        return {
+            "use_spatial_index": True,
+            "stores_path": os.path.join(args.data_dir, "stores.csv"),
+        }
+    return {}
+
+
+def run_local_search(transfer_plan, excess_df, optimizer, profiler, engine_name=None, trip_priced=False):
+    """Post-optimize a transfer plan with local search moves."""
+    if transfer_plan.empty:
+        return transfer_plan
+    if trip_priced:
+        # Moves are priced per unit; they would drop the lane trip costs and spread the plan over more lanes
+        print(f"Skipping local search: {engine_name} prices truck trips per lane.")
+        return transfer_plan
+    if optimizer.transport_cost_matrix is None:
+        print("Skipping local search: no transport cost matrix loaded for this engine.")
+        return transfer_plan
     
-    optimizer = RuleBasedOptimizer()
+    with profiler.stage("local_search", rows=len(transfer_plan)):
+        improver = LocalSearchImprover(optimizer.distance_matrix, optimizer.transport_cost_matrix)
+        return improver.optimize_plan(transfer_plan, excess_df)
+
+
+def load_hub_network(optimizer, stores_df, args, profiler):
+    """Cheapest store-to-store paths through the warehouses, applied to an engine's lane prices."""
+    with profiler.stage("hub_paths", rows=len(stores_df)):
+        hub_network = HubNetwork.from_csv(
+            os.path.join(args.data_dir, WAREHOUSES_FILE), cache_dir=args.cache_dir
+        )
+        hub_network.build(optimizer, stores_df)
+        hub_network.apply(optimizer)
+    return hub_network
+
+
+def run_hub_routing(transfer_plan, hub_network, trip_priced=False):
+    """
+    Break a plan down into hub legs. Plans priced per truck trip keep their
+    line costs: their unit prices already follow the cheapest paths and the
+    lines also carry their lane's trip costs.
+    """
+    routed, legs = hub_network.route_plan(transfer_plan)
+    if trip_priced:
+        routed["transport_cost"] = transfer_plan["transport_cost"].to_numpy()
+    return routed, legs
+
+
+def save_engine_outputs(file_prefix, manifest, iterations, args):
+    """Save an engine's lane manifest and dual iterations, when it produces them."""
+    if manifest is not None:
+        manifest.to_csv(os.path.join(args.results_dir, f"{file_prefix}_manifest.csv"), index=False)
+    if iterations is not None:
+        iterations.to_csv(os.path.join(args.results_dir, f"{file_prefix}_duality.csv"), index=False)
+
+
+def run_route_building(transfer_plan, optimizer, stores_df, file_prefix, args, profiler):
+    """Build multi-stop vehicle routes for a transfer plan and save them."""
+    with profiler.stage("build_routes", rows=len(transfer_plan)) as span:
+        builder = RouteBuilder(capacity=args.vehicle_capacity, use_two_opt=args.two_opt)
+        routes = builder.build_routes(transfer_plan, optimizer, stores_df)
+        span["routes"] = int(routes["route_id"].nunique()) if not routes.empty else 0
     
-    optimizer.load_matrices(
-        distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
-        cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
-    )
+    routes.to_csv(os.path.join(args.results_dir, f"{file_prefix}_routes.csv"), index=False)
+    return routes
+
+
+def run_engine_optimization(engine_name, analyzer, excess_df, needed_df, args, profiler=None):
+    print(f"\n=== {engine_name.upper()} OPTIMIZATION ===")
+    
+    profiler = profiler or StageProfiler()
+    optimizer = create_engine(engine_name, **get_engine_overrides(engine_name, args))
+    
+    with profiler.stage("load_matrices"):
+        optimizer.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
+    hub_network = load_hub_network(optimizer, stores_df, args, profiler) if args.hubs else None
     
     start_time = time()
     
-    transfer_plan = optimizer.optimize(excess_df, needed_df)
+    with profiler.stage("optimize", rows=len(needed_df)) as span:
+        transfer_plan = optimizer.optimize(excess_df, needed_df)
+        span["transfers"] = len(transfer_plan)
     
     execution_time = time() - start_time
-    print(f"Rule-based optimization completed in {execution_time:.2f} seconds.")
+    print(f"{engine_name} optimization completed in {execution_time:.2f} seconds.")
+    
+    manifest = getattr(optimizer, "manifest", None)
+    trip_priced = manifest is not None
+    if args.local_search:
+        transfer_plan = run_local_search(
+            transfer_plan, excess_df, optimizer, profiler, engine_name, trip_priced
+        )
+        optimizer.transfer_plan = transfer_plan
+    
+    legs = None
+    if hub_network is not None and not transfer_plan.empty:
+        transfer_plan, legs = run_hub_routing(transfer_plan, hub_network, trip_priced)
+        optimizer.transfer_plan = transfer_plan
+    if trip_priced and not transfer_plan.empty:
+        # The manifest describes the final plan (e.g. hub path distances)
+        manifest = optimizer.build_manifest(transfer_plan)
+        optimizer.manifest = manifest
     
-    stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
     products_df = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
     optimizer.add_store_product_names(stores_df=stores_df, product_df=products_df)
     
     if not transfer_plan.empty:
+        file_prefix = get_engine_file_prefix(engine_name)
         transfer_plan.to_csv(
-            os.path.join(args.results_dir, "rule_based_transfer_plan.csv"), index=False
+            os.path.join(args.results_dir, f"{file_prefix}_transfer_plan.csv"), index=False
         )
+        save_engine_outputs(file_prefix, manifest, getattr(optimizer, "iterations", None), args)
+        if legs is not None:
+            legs.to_csv(os.path.join(args.results_dir, f"{file_prefix}_legs.csv"), index=False)
+        if args.routes:
+            run_route_building(transfer_plan, optimizer, stores_df, file_prefix, args, profiler)
         
-        impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
+        with profiler.stage("evaluate_plan_impact", rows=len(transfer_plan)):
+            impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
         
         pd.DataFrame(impact_df).to_csv(
-            os.path.join(args.results_dir, "rule_based_impact.csv")
+            os.path.join(args.results_dir, f"{file_prefix}_impact.csv")
         )
 
         return transfer_plan, impact_df
@@ -82,24 +252,219 @@ def run_rule_based_optimization(analyzer, excess_df, needed_df, args):
     return transfer_plan, None
 
 
-def run_analysis(args):
-    """Run inventory analysis."""
-    print("\n=== INVENTORY ANALYSIS ===")
+def run_all_engines(analyzer, excess_df, needed_df, args, profiler=None):
+    """
+    Run every registered engine concurrently on shared inputs.
+
+    Returns:
+        Tuple of (dictionary {engine_name: (transfer_plan, impact_df)},
+        names of the engines that completed within their budget)
+    """
+    print("\n=== ALL OPTIMIZATION ENGINES ===")
     
-    analyzer = InventoryAnalyzer()
+    profiler = profiler or StageProfiler()
+    loader = RuleBasedOptimizer()
+    
+    with profiler.stage("load_matrices"):
+        loader.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
+    hub_network = load_hub_network(loader, stores_df, args, profiler) if args.hubs else None
+    
+    with profiler.stage("optimize_all_engines", rows=len(needed_df)):
+        engine_names = get_engine_names()
+        engine_results = run_engines_concurrently(
+            engine_names,
+            excess_df,
+            needed_df,
+            loader.distance_matrix,
+            loader.transport_cost_matrix,
+            time_budget=args.engine_time_budget,
+            engine_params={name: get_engine_overrides(name, args) for name in engine_names},
+        )
     
-    analyzer.load_data(
-        sales_path=os.path.join(args.data_dir, "sales_data.csv"),
-        inventory_path=os.path.join(args.data_dir, "inventory_data.csv"),
-        stores_path=os.path.join(args.data_dir, "stores.csv"),
-        products_path=os.path.join(args.data_dir, "products.csv"),
+    products_df = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
+    
+    results_dict = {}
+    for engine_name, result in engine_results.items():
+        transfer_plan = result["transfer_plan"]
+        manifest = result.get("manifest")
+        trip_priced = manifest is not None
+        impact_df = None
+        
+        if args.local_search:
+            transfer_plan = run_local_search(
+                transfer_plan, excess_df, loader, profiler, engine_name, trip_priced
+            )
+        
+        if not transfer_plan.empty:
+            legs = None
+            if hub_network is not None:
+                transfer_plan, legs = run_hub_routing(transfer_plan, hub_network, trip_priced)
+            if trip_priced:
+                manifest = create_engine(
+                    engine_name, **get_engine_overrides(engine_name, args)
+                ).build_manifest(transfer_plan)
+            loader.transfer_plan = transfer_plan
+            loader.add_store_product_names(stores_df=stores_df, product_df=products_df)
+            
+            file_prefix = get_engine_file_prefix(engine_name)
+            transfer_plan.to_csv(
+                os.path.join(args.results_dir, f"{file_prefix}_transfer_plan.csv"),
+                index=False,
+            )
+            save_engine_outputs(file_prefix, manifest, result.get("iterations"), args)
+            if legs is not None:
+                legs.to_csv(os.path.join(args.results_dir, f"{file_prefix}_legs.csv"), index=False)
+            if args.routes:
+                run_route_building(transfer_plan, loader, stores_df, file_prefix, args, profiler)
+            
+            with profiler.stage(f"evaluate_plan_impact[{engine_name}]", rows=len(transfer_plan)):
+                impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
+            
+            pd.DataFrame(impact_df).to_csv(
+                os.path.join(args.results_dir, f"{file_prefix}_impact.csv")
+            )
+        
+        results_dict[engine_name] = (transfer_plan, impact_df)
+    
+    completed = {name for name, result in engine_results.items() if result["status"] == "completed"}
+    return results_dict, completed
+
+
+def run_incremental_optimization(args, profiler=None):
+    """
+    Run rule-based optimization incrementally.
+
+    The first run solves from scratch and saves the incremental state to the
+    results directory. Later runs with --inventory-delta load that state, apply
+    the stock corrections and re-solve only the products they affect.
+    """
+    print("\n=== INCREMENTAL RULE-BASED OPTIMIZATION ===")
+    
+    profiler = profiler or StageProfiler()
+    state_path = os.path.join(args.results_dir, "incremental_state.pkl")
+    
+    optimizer = RuleBasedOptimizer()
+    with profiler.stage("load_matrices"):
+        optimizer.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    # Inputs and analysis settings the state depends on
+    fingerprint = make_cache_key(
+        args.data_dir,
+        args.min_days,
+        args.max_days,
+        "Incremental",
+        {
+            "forecast": args.forecast,
+            "safety_stock": (args.service_level, args.lead_time_days),
+        },
+        get_required_files(["Rule-based"], args),
     )
     
-    analysis_df = analyzer.analyze_sales_data()
+    loaded = False
+    if args.inventory_delta and os.path.exists(state_path):
+        # Stores and products are needed to value the impact; the analysis rows come from the state
+        analyzer = create_analyzer(args)
+        analyzer.stores = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
+        analyzer.products = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
+        incremental = IncrementalOptimizer(
+            analyzer, optimizer, min_days=args.min_days, max_days=args.max_days
+        )
+        with profiler.stage("load_incremental_state"):
+            loaded = incremental.load_state(state_path, fingerprint)
+    
+    if not loaded:
+        analyzer, _, excess_df, needed_df = run_analysis(args, profiler)
+        incremental = IncrementalOptimizer(
+            analyzer, optimizer, min_days=args.min_days, max_days=args.max_days
+        )
+        with profiler.stage("optimize", rows=len(needed_df)):
+            incremental.initialize(excess_df, needed_df)
+    
+    if args.inventory_delta:
+        inventory_delta = pd.read_csv(args.inventory_delta)
+        with profiler.stage("apply_inventory_delta", rows=len(inventory_delta)):
+            incremental.apply_delta(inventory_delta)
+    
+    if args.verify_incremental:
+        with profiler.stage("verify_incremental"):
+            identical, differing, incremental_cost, full_cost = incremental.verify()
+        if identical:
+            print(f"Incremental plan matches a from-scratch solve ({incremental_cost:,.0f} VND)")
+        else:
+            print(
+                f"WARNING: incremental plan differs from a from-scratch solve in {differing} lines "
+                f"({incremental_cost:,.0f} vs {full_cost:,.0f} VND)"
+            )
+    
+    incremental.save_state(state_path, fingerprint)
+    
+    # Copy so that store/product names are not written into the saved plans
+    transfer_plan = incremental.transfer_plan.copy()
+    optimizer.transfer_plan = transfer_plan
+    
+    stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
+    products_df = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
+    optimizer.add_store_product_names(stores_df=stores_df, product_df=products_df)
+    
+    if transfer_plan.empty:
+        return analyzer.analysis_df, transfer_plan, None
+    
+    transfer_plan.to_csv(
+        os.path.join(args.results_dir, "rule_based_transfer_plan.csv"), index=False
+    )
+    
+    with profiler.stage("evaluate_plan_impact", rows=len(transfer_plan)):
+        impact_df, _ = analyzer.evaluate_plan_impact(transfer_plan)
+    
+    pd.DataFrame(impact_df).to_csv(
+        os.path.join(args.results_dir, "rule_based_impact.csv")
+    )
     
-    excess_df, needed_df = analyzer.identify_inventory_imbalances(
-        min_days=args.min_days, max_days=args.max_days
+    return analyzer.analysis_df, transfer_plan, impact_df
+
+
+def create_analyzer(args):
+    """Inventory analyzer with the demand and safety-stock settings of the command line."""
+    return InventoryAnalyzer(
+        use_forecast=args.forecast,
+        service_level=args.service_level,
+        lead_time_days=args.lead_time_days,
     )
+
+
+def run_analysis(args, profiler=None):
+    """Run inventory analysis."""
+    print("\n=== INVENTORY ANALYSIS ===")
+    
+    profiler = profiler or StageProfiler()
+    analyzer = create_analyzer(args)
+    
+    with profiler.stage("load_data") as span:
+        analyzer.load_data(
+            sales_path=os.path.join(args.data_dir, "sales_data.csv"),
+            inventory_path=os.path.join(args.data_dir, "inventory_data.csv"),
+            stores_path=os.path.join(args.data_dir, "stores.csv"),
+            products_path=os.path.join(args.data_dir, "products.csv"),
+        )
+        span["rows"] = len(analyzer.sales_df) + len(analyzer.inventory_df)
+    
+    with profiler.stage("analyze_sales_data", rows=len(analyzer.sales_df)):
+        analysis_df = analyzer.analyze_sales_data()
+    
+    with profiler.stage("identify_inventory_imbalances", rows=len(analysis_df)) as span:
+        excess_df, needed_df = analyzer.identify_inventory_imbalances(
+            min_days=args.min_days, max_days=args.max_days
+        )
+        span["excess_items"] = len(excess_df)
+        span["needed_items"] = len(needed_df)
     
     analysis_df.to_csv(
         os.path.join(args.results_dir, "inventory_analysis.csv"), index=False
@@ -120,17 +485,318 @@ def run_analysis(args):
     
     return analyzer, analysis_df, excess_df, needed_df
 
-def create_results(analysis_df, results_dict, analyzer, args):
+def run_threshold_sweep(args, profiler):
+    """Optimize a grid of (min_days, max_days) scenarios from one analysis pass."""
+    analyzer, analysis_df, _, _ = run_analysis(args, profiler)
+    
+    engine_names = get_requested_engines(args) or ["Rule-based"]
+    engine_name = engine_names[0]
+    if len(engine_names) > 1:
+        print(f"Scenario sweep uses one engine: {engine_name}")
+    
+    print(f"\n=== SCENARIO SWEEP ({engine_name.upper()}) ===")
+    engine_params = get_engine_overrides(engine_name, args)
+    loader = create_engine(engine_name, **engine_params)
+    with profiler.stage("load_matrices"):
+        loader.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    grid = build_scenario_grid(
+        args.sweep_min_days or [args.min_days], args.sweep_max_days or [args.max_days]
+    )
+    with profiler.stage("scenario_sweep", rows=len(grid)):
+        comparison = run_scenario_sweep(
+            analysis_df, grid, engine_name, engine_params, loader, max_workers=args.sweep_workers
+        )
+    
+    output_path = os.path.join(args.results_dir, "scenario_sweep.csv")
+    comparison.to_csv(output_path, index=False)
+    
+    print("\nScenario comparison:")
+    print(
+        comparison[
+            [
+                "min_days", "max_days", "excess_items", "needed_items", "transfers",
+                "units_transferred", "transport_cost", "cost_per_unit",
+                "need_fill_rate", "balance_improvement", "status",
+            ]
+        ].to_string(index=False, float_format=lambda value: f"{value:,.1f}")
+    )
+    print(f"Scenario comparison saved to {output_path}")
+
+def run_rolling_horizon(args, profiler):
+    """Plan consecutive days over a rolling horizon, warm-starting each day."""
+    analyzer, analysis_df, _, _ = run_analysis(args, profiler)
+    
+    engine_name = (get_requested_engines(args) or ["Rule-based"])[0]
+    print(f"\n=== ROLLING HORIZON ({args.horizon_days} days ahead, {args.rolling_days} days) ===")
+    loader = create_engine(engine_name, **get_engine_overrides(engine_name, args))
+    with profiler.stage("load_matrices"):
+        loader.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    planner = RollingHorizonPlanner(
+        loader, horizon_days=args.horizon_days, min_days=args.min_days, max_days=args.max_days
+    )
+    with profiler.stage("rolling_horizon", rows=args.rolling_days):
+        committed, daily = simulate_rolling_horizon(planner, analysis_df, args.rolling_days)
+    
+    committed.to_csv(os.path.join(args.results_dir, "rolling_horizon_plan.csv"), index=False)
+    daily.to_csv(os.path.join(args.results_dir, "rolling_horizon_days.csv"), index=False)
+    
+    print(
+        daily[
+            [
+                "day", "warm", "committed_transfers", "horizon_transfers", "committed_cost",
+                "graphs_reused", "graphs_built", "units_replayed", "runtime_s",
+            ]
+        ].to_string(index=False, float_format=lambda value: f"{value:,.3f}")
+    )
+    warm = daily.loc[daily["warm"], "runtime_s"]
+    if not warm.empty:
+        cold = daily["runtime_s"].iloc[0]
+        print(
+            f"Cold solve {cold:.3f}s, warm re-plans {warm.mean():.3f}s on average "
+            f"({warm.mean() / cold:.0%} of cold)"
+        )
+    print(f"Rolling-horizon results saved to {args.results_dir}/rolling_horizon_plan.csv and rolling_horizon_days.csv")
+
+def run_pareto_front(args, profiler):
+    """Solve a sequence of cost weights and save the cost-vs-balance Pareto front."""
+    analyzer, analysis_df, excess_df, needed_df = run_analysis(args, profiler)
+    
+    engine_name = (get_requested_engines(args) or ["Rule-based"])[0]
+    print(f"\n=== PARETO FRONT ({args.pareto_points} cost weights) ===")
+    loader = create_engine(engine_name, **get_engine_overrides(engine_name, args))
+    with profiler.stage("load_matrices"):
+        loader.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    
+    planner = ParetoPlanner(loader, num_points=args.pareto_points, max_workers=args.pareto_workers)
+    with profiler.stage("pareto_front", rows=args.pareto_points):
+        front, lines = planner.build_front(analysis_df, excess_df, needed_df)
+    
+    if front.empty:
+        return
+    front.to_csv(os.path.join(args.results_dir, "pareto_front.csv"), index=False)
+    lines.to_csv(os.path.join(args.results_dir, "pareto_plans.csv"), index=False)
+    
+    print(
+        front[
+            [
+                "point", "cost_weight", "transfers", "units_transferred", "transport_cost",
+                "imbalance_std", "remaining_needed_units",
+            ]
+        ].to_string(index=False, float_format=lambda value: f"{value:,.6g}")
+    )
+    print(
+        f"Pareto front saved to {args.results_dir}/pareto_front.csv; the plan of point k is "
+        f"every line of pareto_plans.csv with point <= k"
+    )
+
+def run_backtest(args, profiler):
+    """Replay the sales history with and without transfers."""
+    print("\n=== BACKTEST ===")
+    engine_name = (get_requested_engines(args) or ["Rule-based"])[0]
+    engine_params = get_engine_overrides(engine_name, args)
+    
+    loader = create_engine(engine_name, **engine_params)
+    with profiler.stage("load_matrices"):
+        loader.load_matrices(
+            distance_path=os.path.join(args.data_dir, "distance_matrix.csv"),
+            cost_path=os.path.join(args.data_dir, "transport_cost_matrix.csv"),
+        )
+    engine_state = {
+        key: getattr(loader, key)
+        for key in ("distance_matrix", "transport_cost_matrix", "sparse_lanes", "stores")
+        if getattr(loader, key, None) is not None
+    }
+    
+    with profiler.stage("load_backtest_data"):
+        backtester = Backtester(
+            pd.read_csv(os.path.join(args.data_dir, "sales_data.csv")),
+            pd.read_csv(args.backtest_inventory or os.path.join(args.data_dir, "inventory_data.csv")),
+            engine_name,
+            engine_params,
+            engine_state,
+            receipts_df=pd.read_csv(args.backtest_receipts) if args.backtest_receipts else None,
+        )
+    print(
+        f"Replaying {backtester.num_days} days over {backtester.num_cells} store-product cells "
+        f"with {engine_name}"
+    )
+    
+    configs = [{"name": "no_transfers"}]
+    for review_days in args.backtest_review_days:
+        for lead_time in args.backtest_lead_days:
+            configs.append(
+                {
+                    "name": f"review_{review_days}d_lead_{lead_time}d",
+                    "review_days": review_days,
+                    "lead_time": lead_time,
+                    "min_days": args.min_days,
+                    "max_days": args.max_days,
+                }
+            )
+    
+    with profiler.stage("backtest", rows=len(configs)):
+        summary, daily = run_backtests(backtester, configs, max_workers=args.backtest_workers)
+    
+    summary.to_csv(os.path.join(args.results_dir, "backtest_summary.csv"), index=False)
+    daily.to_csv(os.path.join(args.results_dir, "backtest_daily.csv"), index=False)
+    
+    print("\nBacktest results:")
+    print(
+        summary[
+            [
+                "config", "reviews", "stockout_days", "lost_units", "lost_revenue",
+                "transfers", "units_transferred", "transport_cost", "runtime_s",
+            ]
+        ].to_string(index=False, float_format=lambda value: f"{value:,.1f}")
+    )
+    print(f"Backtest results saved to {args.results_dir}/backtest_summary.csv and backtest_daily.csv")
+
+def get_requested_engines(args):
+    """Return the names of the optimization engines requested on the command line."""
+    if args.all:
+        return get_engine_names()
+    
+    engine_names = []
+    if args.rule_based:
+        engine_names.append("Rule-based")
+    if args.anytime:
+        engine_names.append("Anytime")
+    if args.hierarchical:
+        engine_names.append("Hierarchical")
+    if args.stochastic:
+        engine_names.append("Stochastic")
+    if args.consolidated:
+        engine_names.append("Consolidated")
+    if args.budgeted:
+        engine_names.append("Budgeted")
+    return engine_names
+
+def get_required_files(engine_names, args):
+    """
+    Input files needed for this run. The dense matrices are skipped when every
+    requested engine prices lanes from store coordinates.
+    """
+    files = get_lane_files(engine_names, args)
+    return files + [WAREHOUSES_FILE] if args.hubs else files
+
+def get_lane_files(engine_names, args):
+    """Data files of this run, with the lane source the engines need."""
+    matrix_free = bool(engine_names) and all(
+        engine_name in ("Hierarchical", "Stochastic", "Consolidated", "Budgeted")
+        or (engine_name == "Rule-based" and args.spatial_index)
+        for engine_name in engine_names
+    )
+    dense_files = ("distance_matrix.csv", "transport_cost_matrix.csv")
+    if matrix_free and not (args.local_search or args.incremental or args.serve):
+        return [file for file in REQUIRED_DATA_FILES if file not in dense_files]
+    
+    # The sparse lane file replaces the dense matrices for single-engine runs
+    sparse_only = (Path(args.data_dir) / SPARSE_LANES_FILE).exists() and not any(
+        (Path(args.data_dir) / file).exists() for file in dense_files
+    )
+    if sparse_only and not (args.all or args.local_search or args.incremental or args.serve):
+        return [
+            file for file in REQUIRED_DATA_FILES if file not in dense_files
+        ] + [SPARSE_LANES_FILE]
+    
+    return REQUIRED_DATA_FILES
+
+def get_cache_keys(engine_names, args):
+    """Build the plan cache key of every requested engine."""
+    cache_keys = {}
+    # Every file the run reads, including warehouses.csv under --hubs
+    data_files = get_required_files(engine_names, args)
+    for engine_name in engine_names:
+        engine_params = get_engine_params(engine_name, **get_engine_overrides(engine_name, args))
+        if args.local_search:
+            engine_params["local_search"] = True
+        if args.forecast:
+            engine_params["forecast"] = True
+        if args.service_level is not None:
+            engine_params["safety_stock"] = (args.service_level, args.lead_time_days)
+        if args.hubs:
+            engine_params["hubs"] = True
+        cache_keys[engine_name] = make_cache_key(
+            args.data_dir, args.min_days, args.max_days, engine_name, engine_params, data_files
+        )
+    return cache_keys
+
+def load_cached_results(plan_cache, cache_keys):
+    """
+    Load the results of every requested engine from the plan cache.
+
+    Returns:
+        Tuple of (analysis_df, results_dict), or None unless every engine hits
+    """
+    analysis_df = None
+    results_dict = {}
+
+    for engine_name, key in cache_keys.items():
+        entry = plan_cache.get(key)
+        if entry is None:
+            print(f"Plan cache miss for {engine_name} ({key[:12]})")
+            return None
+        print(f"Plan cache hit for {engine_name} ({key[:12]})")
+        analysis_df = entry["analysis_df"]
+        results_dict[engine_name] = (entry["transfer_plan"], entry["impact_df"])
+
+    return analysis_df, results_dict
+
+def store_cached_result(plan_cache, key, engine_name, frames, args):
+    """Store the analysis and optimization results of one engine in the plan cache."""
+    plan_cache.put(
+        key,
+        frames,
+        meta={
+            "engine": engine_name,
+            "min_days": args.min_days,
+            "max_days": args.max_days,
+            "data_dir": args.data_dir,
+        },
+    )
+    print(f"Stored {engine_name} results in plan cache ({key[:12]})")
+
+def create_results(analysis_df, results_dict, analyzer, args, profiler=None):
     """Create simplified results: summary and best transfer plan."""
     print("\n=== GENERATING RESULTS ===")
 
-    # Load store and product data
-    stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
-    products_df = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
+    profiler = profiler or StageProfiler()
+
+    with profiler.stage("create_final_results", rows=len(results_dict)):
+        # Load store and product data
+        stores_df = pd.read_csv(os.path.join(args.data_dir, "stores.csv"))
+        products_df = pd.read_csv(os.path.join(args.data_dir, "products.csv"))
+
+        # Create results manager and generate final results
+        results_manager = ResultsManager(args.results_dir)
+        results_manager.create_final_results(results_dict, stores_df, products_df)
+
+def probability(value):
+    """argparse type of a probability strictly between 0 and 1."""
+    p = float(value)
+    if not 0 < p < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1 (exclusive), got {value}")
+    return p
+
+
+def positive_float(value):
+    """argparse type of a strictly positive number."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be positive, got {value}")
+    return number
 
-    # Create results manager and generate final results
-    results_manager = ResultsManager(args.results_dir)
-    results_manager.create_final_results(results_dict, stores_df, products_df)
 
 def main():
     parser = argparse.ArgumentParser(description="Goods Allocation Optimization System")
@@ -157,11 +823,35 @@ def main():
         "--days", type=int, default=SALE_DAYS, help="Number of days of sales data"
     )
     parser.add_argument(
-        "--excess-percent ",
+        "--excess-percent",
         type=int,
-        default=SHORTAGE_PERCENT,
+        default=EXCESS_PERCENT,
         help="Percentage of excess inventory",
     )
+    parser.add_argument(
+        "--shortage-percent",
+        type=int,
+        default=SHORTAGE_PERCENT,
+        help="Percentage of shortage inventory",
+    )
+    parser.add_argument(
+        "--sparse-k",
+        type=int,
+        default=None,
+        help=f"Write a sparse k-nearest lane matrix ({SPARSE_LANES_FILE}) instead of the dense matrices",
+    )
+    parser.add_argument(
+        "--road-network",
+        type=str,
+        default=None,
+        help="Directory with road_nodes.csv/road_edges.csv for offline road distances",
+    )
+    parser.add_argument(
+        "--update-stores",
+        type=str,
+        default=None,
+        help="Updated stores CSV: recompute only the matrix rows/columns of added, removed or moved stores",
+    )
     
     # Analysis options
     parser.add_argument(
@@ -176,6 +866,23 @@ def main():
         default=MAX_INVENTORY_DAYS,
         help="Maximum days of inventory",
     )
+    parser.add_argument(
+        "--forecast",
+        action="store_true",
+        help="Use forecast daily demand (exponential smoothing with seasonality) instead of the flat average",
+    )
+    parser.add_argument(
+        "--service-level",
+        type=probability,
+        default=None,
+        help="Target service level (e.g. 0.95): shift thresholds per item by its safety stock in days",
+    )
+    parser.add_argument(
+        "--lead-time-days",
+        type=positive_float,
+        default=SAFETY_STOCK_LEAD_TIME_DAYS,
+        help="Replenishment lead time used for the safety stock",
+    )
     
     # Optimization options
     parser.add_argument(
@@ -184,10 +891,105 @@ def main():
     parser.add_argument(
         "--ga", action="store_true", help="Run genetic algorithm optimization"
     )
+    parser.add_argument(
+        "--anytime",
+        action="store_true",
+        help="Run the deadline-aware optimizer (greedy seed + local search)",
+    )
+    parser.add_argument(
+        "--hierarchical",
+        action="store_true",
+        help="Run the city-cluster hierarchical optimizer (for very large networks)",
+    )
+    parser.add_argument(
+        "--stochastic",
+        action="store_true",
+        help="Run the scenario-based optimizer (expected stockout + transport cost)",
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=int,
+        default=STOCHASTIC_SCENARIOS,
+        help="Demand scenarios sampled per store-product by the stochastic optimizer",
+    )
+    parser.add_argument(
+        "--consolidated",
+        action="store_true",
+        help="Run the shipment consolidation optimizer (fixed trip cost per lane + unit cost)",
+    )
+    parser.add_argument(
+        "--trip-cost",
+        type=float,
+        default=CONSOLIDATION_TRIP_COST,
+        help="Consolidation: fixed cost (VND) of one truck trip on a lane",
+    )
+    parser.add_argument(
+        "--truck-capacity",
+        type=int,
+        default=CONSOLIDATION_TRUCK_CAPACITY,
+        help="Consolidation: units carried per truck trip",
+    )
+    parser.add_argument(
+        "--budgeted",
+        action="store_true",
+        help="Run the budget-constrained optimizer (most needed units covered within --budget)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=TRANSPORT_BUDGET,
+        help="Budget-constrained: total transport cost (VND) the plan may spend",
+    )
+    parser.add_argument(
+        "--spatial-index",
+        action="store_true",
+        help="Rule-based: find nearest donors with a spatial index over store coordinates "
+        "instead of loading the distance/cost matrices",
+    )
     parser.add_argument(
         "--all", action="store_true", help="Run all optimization engines"
     )
     
+    parser.add_argument(
+        "--local-search",
+        action="store_true",
+        help="Improve every engine's plan with reassign/swap/merge local search moves",
+    )
+    parser.add_argument(
+        "--hubs",
+        action="store_true",
+        help=f"Transship through the warehouses of {WAREHOUSES_FILE} where a path through hubs is cheaper",
+    )
+    parser.add_argument(
+        "--routes",
+        action="store_true",
+        help="Turn every engine's plan into multi-stop vehicle routes (Clarke-Wright savings)",
+    )
+    parser.add_argument(
+        "--vehicle-capacity",
+        type=int,
+        default=ROUTING_VEHICLE_CAPACITY,
+        help="Units a vehicle carries on a route",
+    )
+    parser.add_argument(
+        "--two-opt",
+        action="store_true",
+        help="Refine every route with 2-opt",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=ANYTIME_TIME_BUDGET_S,
+        help="Seconds the anytime optimizer may spend before returning its best plan",
+    )
+    
+    parser.add_argument(
+        "--engine-time-budget",
+        type=float,
+        default=ENGINE_TIME_BUDGET_S,
+        help="Seconds each engine may run under --all",
+    )
+    
     # GA options
     parser.add_argument(
         "--ga-population",
@@ -214,43 +1016,282 @@ def main():
         help="GA mutation probability",
     )
     
+    # Incremental options
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep rule-based optimization state and re-solve only products affected by --inventory-delta",
+    )
+    parser.add_argument(
+        "--inventory-delta",
+        type=str,
+        default=None,
+        help="CSV of stock corrections (store_id, product_id, current_stock) for --incremental",
+    )
+    parser.add_argument(
+        "--verify-incremental",
+        action="store_true",
+        help="After --incremental, re-solve from scratch and check the plans are identical",
+    )
+    
+    # Service options
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run the planning service with data loaded once in memory",
+    )
+    parser.add_argument("--host", type=str, default=SERVICE_HOST, help="Service host")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Service port")
+    parser.add_argument(
+        "--workers", type=int, default=SERVICE_WORKERS, help="Service worker threads"
+    )
+    
+    # Scenario sweep options
+    parser.add_argument(
+        "--sweep-min-days",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Sweep these shortage thresholds (crossed with --sweep-max-days)",
+    )
+    parser.add_argument(
+        "--sweep-max-days",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Sweep these excess thresholds (crossed with --sweep-min-days)",
+    )
+    parser.add_argument(
+        "--sweep-workers",
+        type=int,
+        default=None,
+        help="Worker processes for the scenario sweep (default: CPU count)",
+    )
+    
+    # Rolling-horizon options
+    parser.add_argument(
+        "--rolling-horizon",
+        action="store_true",
+        help="Plan consecutive days over a rolling horizon, committing each day's transfers",
+    )
+    parser.add_argument(
+        "--horizon-days",
+        type=int,
+        default=ROLLING_HORIZON_DAYS,
+        help="Days planned ahead by the rolling-horizon planner",
+    )
+    parser.add_argument(
+        "--rolling-days",
+        type=int,
+        default=ROLLING_SIMULATION_DAYS,
+        help="Consecutive days planned by --rolling-horizon",
+    )
+    
+    # Pareto front options
+    parser.add_argument(
+        "--pareto",
+        action="store_true",
+        help="Solve a sequence of cost weights and save the cost-vs-balance Pareto front",
+    )
+    parser.add_argument(
+        "--pareto-points",
+        type=int,
+        default=PARETO_POINTS,
+        help="Cost weights solved by --pareto",
+    )
+    parser.add_argument(
+        "--pareto-workers",
+        type=int,
+        default=None,
+        help="Worker processes for the per-product solves of --pareto (default: CPU count)",
+    )
+    
+    # Backtest options
+    parser.add_argument(
+        "--backtest",
+        action="store_true",
+        help="Replay sales history day by day and measure stockouts with and without transfers",
+    )
+    parser.add_argument(
+        "--backtest-inventory",
+        type=str,
+        default=None,
+        help="Initial inventory CSV for the backtest (default: inventory_data.csv)",
+    )
+    parser.add_argument(
+        "--backtest-receipts",
+        type=str,
+        default=None,
+        help="Supplier receipts CSV (date, store_id, product_id, units) replayed during the backtest",
+    )
+    parser.add_argument(
+        "--backtest-review-days",
+        type=int,
+        nargs="+",
+        default=[BACKTEST_REVIEW_DAYS],
+        help="Optimizer cadences (days) to backtest",
+    )
+    parser.add_argument(
+        "--backtest-lead-days",
+        type=int,
+        nargs="+",
+        default=[BACKTEST_LEAD_TIME_DAYS],
+        help="Transfer lead times (days) to backtest",
+    )
+    parser.add_argument(
+        "--backtest-workers",
+        type=int,
+        default=None,
+        help="Worker processes for backtest configurations (default: CPU count)",
+    )
+    
+    # Cache options
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse analysis and optimization results for identical inputs",
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=CACHE_DIR, help="Plan cache directory"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=PLAN_CACHE_MAX_MB,
+        help="Maximum plan cache size in MB before LRU eviction",
+    )
+    
+    # Profiling options
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-stage timing and memory and write profile_report.json",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        type=str,
+        default=None,
+        help="Stage to dump a cProfile file for (e.g. optimize, analyze_sales_data)",
+    )
+    
     # Display options
     parser.add_argument(
         "--summary-only", action="store_true", help="Display summary results only"
     )
     
     args = parser.parse_args()
+    if args.sparse_k and args.road_network:
+        parser.error("--sparse-k builds haversine k-nearest lanes and cannot be combined with --road-network")
     
     directories = setup_directories()
     args.data_dir = str(directories["data"])
     args.vis_dir = str(directories["visualizations"])
     args.results_dir = str(directories["results"])
     
+    profiler = StageProfiler(enabled=args.profile, cprofile_stage=args.profile_stage)
+    
     if args.generate_data:
-        run_data_generation(args)
+        with profiler.stage("generate_all_data"):
+            run_data_generation(args)
+    
+    if args.update_stores:
+        with profiler.stage("update_store_matrices"):
+            run_store_update(args)
         
-    for file in REQUIRED_DATA_FILES:
+    engine_names = get_requested_engines(args)
+    
+    for file in get_required_files(engine_names, args):
         file_path = Path(args.data_dir) / file
         if not file_path.exists():
             print(
                 f"Required file {file} not found. Please run with --generate-data first."
             )
             return
-        
-    analyzer, analysis_df, excess_df, needed_df = run_analysis(args)
     
-    results_dict = {}
-    
-    if args.rule_based or args.all:
-        transfer_plan, impact_df = run_rule_based_optimization(
-            analyzer, excess_df, needed_df, args
+    if args.serve:
+        run_service(
+            args.data_dir,
+            args.host,
+            args.port,
+            workers=args.workers,
+            min_days=args.min_days,
+            max_days=args.max_days,
         )
-        results_dict["Rule-based"] = (transfer_plan, impact_df)
+        return
+    
+    if args.backtest or args.rolling_horizon or args.pareto or args.sweep_min_days or args.sweep_max_days:
+        if args.backtest:
+            run_backtest(args, profiler)
+        elif args.rolling_horizon:
+            run_rolling_horizon(args, profiler)
+        elif args.pareto:
+            run_pareto_front(args, profiler)
+        else:
+            run_threshold_sweep(args, profiler)
+        if args.profile:
+            profiler.print_summary()
+            profiler.write_report(args.results_dir)
+        return
+    
+    plan_cache = None
+    cache_keys = {}
+    cached_results = None
+    
+    if args.cache and engine_names and not args.incremental:
+        plan_cache = PlanCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+        with profiler.stage("plan_cache_lookup"):
+            cache_keys = get_cache_keys(engine_names, args)
+            cached_results = load_cached_results(plan_cache, cache_keys)
+    
+    if args.incremental:
+        analysis_df, transfer_plan, impact_df = run_incremental_optimization(args, profiler)
+        results_dict = {"Rule-based": (transfer_plan, impact_df)}
+        analyzer = None
+    elif cached_results is not None:
+        analysis_df, results_dict = cached_results
+        analyzer = None
+    else:
+        analyzer, analysis_df, excess_df, needed_df = run_analysis(args, profiler)
+        
+        results_dict = {}
         
-    # if args.ga or args.all:
+        if args.all:
+            results_dict, completed = run_all_engines(analyzer, excess_df, needed_df, args, profiler)
+        else:
+            for engine_name in engine_names:
+                results_dict[engine_name] = run_engine_optimization(
+                    engine_name, analyzer, excess_df, needed_df, args, profiler
+                )
+            completed = set(results_dict)
+            
+        # if args.ga or args.all:
+        
+        if plan_cache is not None:
+            for engine_name, (transfer_plan, impact_df) in results_dict.items():
+                # Timed-out or failed engines are solved again on the next run
+                if engine_name not in completed:
+                    print(f"Not caching {engine_name}: it did not complete")
+                    continue
+                store_cached_result(
+                    plan_cache,
+                    cache_keys[engine_name],
+                    engine_name,
+                    {
+                        "analysis_df": analysis_df,
+                        "excess_df": excess_df,
+                        "needed_df": needed_df,
+                        "transfer_plan": transfer_plan,
+                        "impact_df": impact_df,
+                    },
+                    args,
+                )
     
     if results_dict:
-        create_results(analysis_df, results_dict, analyzer, args)
+        create_results(analysis_df, results_dict, analyzer, args, profiler)
+        
+    if args.profile:
+        profiler.print_summary()
+        profiler.write_report(args.results_dir)
         
     print("\n=== INVENTORY TRANSFER OPTIMIZATION COMPLETE ===")
     print(f"Results saved to {args.results_dir} directory:")
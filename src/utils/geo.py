@@ -0,0 +1,53 @@
+"""
+Geographic distance and transport cost model.
+
+Shared by DistanceCalculator, which prices every store pair up front, and by
+engines that price lanes on demand from store coordinates.
+"""
+
+import numpy as np
+
+from config import DISTANCE_COST_FACTORS, INTERCITY_COST_FACTOR, TRANSPORT_COST_PER_KM
+
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in km between points given in decimal degrees.
+    Works on scalars and on broadcastable numpy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+
+
+def transport_cost_per_unit(distance_km, same_city):
+    """
+    Transport cost (VND per unit) of a lane.
+
+    Short lanes are more expensive per km (fixed costs), long lanes cheaper
+    (economies of scale) and intercity lanes carry INTERCITY_COST_FACTOR.
+
+    Args:
+        distance_km: Lane distance(s) in km
+        same_city: Whether the lane(s) stay inside one city
+
+    Returns:
+        Cost per unit, with the shape of the inputs
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+
+    thresholds = sorted(DISTANCE_COST_FACTORS.items())
+    distance_factor = np.full(distance_km.shape, thresholds[-1][1])
+    for threshold, factor in reversed(thresholds):
+        distance_factor = np.where(distance_km < threshold, factor, distance_factor)
+
+    city_factor = np.where(same_city, 1.0, INTERCITY_COST_FACTOR)
+    cost = TRANSPORT_COST_PER_KM * distance_km * city_factor * distance_factor
+
+    return cost.item() if cost.ndim == 0 else cost
@@ -0,0 +1,401 @@
+"""
+Hub-and-spoke transshipment through warehouses.
+
+Warehouses (warehouses.csv) are hub nodes next to the stores. A unit may go
+straight from store to store, or store -> hub -> ... -> hub -> store, where
+hub-to-hub linehaul is cheaper per km (HUB_LINEHAUL_FACTOR) and every unit
+leaving a hub pays its handling cost. Stores do not cross-dock, so only hubs
+are intermediate nodes of a path.
+
+All-pairs cheapest paths over the store + hub graph are computed with:
+
+- a vectorized Floyd-Warshall pivoting on the hubs, over the dense matrix of
+  direct lanes, for graphs up to HUB_FLOYD_MAX_NODES nodes;
+- multi-source Dijkstra (scipy.sparse.csgraph) in chunks of sources across a
+  process pool for larger graphs. Each store is split into an origin and a
+  destination node so paths cannot pass through stores; the graph keeps each
+  store's SPARSE_NEIGHBORS_K nearest direct lanes plus all hub lanes, and
+  every pair is finally compared with its direct lane.
+
+Costs and predecessors are cached in an .npz file keyed by a fingerprint of
+the stores, warehouses, lane prices and parameters. Engines price lanes from
+the cheapest-path cost matrix, and plans are annotated leg by leg.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from config import (
+    HUB_DIJKSTRA_CHUNK,
+    HUB_FLOYD_MAX_NODES,
+    HUB_HANDLING_COST,
+    HUB_LINEHAUL_FACTOR,
+    SPARSE_NEIGHBORS_K,
+)
+from utils.geo import haversine_km, transport_cost_per_unit
+
+
+NO_PREDECESSOR = -9999
+
+
+def floyd_warshall(costs, pivots=None):
+    """
+    All-pairs cheapest paths, one vectorized relaxation per pivot node.
+
+    Args:
+        costs: (N x N) direct edge costs (inf = no edge), diagonal 0
+        pivots: Nodes allowed as intermediates (default: all)
+
+    Returns:
+        Tuple of (N x N path costs, N x N predecessor of each target on its path)
+    """
+    costs = np.array(costs, dtype=np.float64)
+    n = len(costs)
+    predecessors = np.where(np.isfinite(costs), np.arange(n)[:, None], NO_PREDECESSOR).astype(np.int32)
+    np.fill_diagonal(predecessors, NO_PREDECESSOR)
+
+    for k in range(n) if pivots is None else pivots:
+        through = costs[:, k, None] + costs[None, k, :]
+        improved = through < costs
+        np.copyto(costs, through, where=improved)
+        np.copyto(predecessors, np.broadcast_to(predecessors[k], predecessors.shape), where=improved)
+
+    return costs, predecessors
+
+
+def hub_paths(graph, sources, num_stores, num_hubs):
+    """
+    Cheapest paths from origin store nodes over the split store graph
+    (executed in a worker process).
+
+    Args:
+        graph: CSR graph: origins 0..S-1, hubs S..S+H-1, destinations S+H..2S+H-1
+        sources: Origin nodes
+        num_stores: Number of stores (S)
+        num_hubs: Number of hubs (H)
+
+    Returns:
+        Tuple of (sources x S path costs to every store, sources x (S + H)
+        predecessors of every store and hub in store + hub node numbering)
+    """
+    costs, predecessors = dijkstra(graph, directed=True, indices=sources, return_predecessors=True)
+    destinations = slice(num_stores + num_hubs, None)
+    hubs = slice(num_stores, num_stores + num_hubs)
+    return costs[:, destinations], np.hstack([predecessors[:, destinations], predecessors[:, hubs]]).astype(np.int32)
+
+
+class HubNetwork:
+    def __init__(
+        self,
+        warehouses,
+        handling_cost=HUB_HANDLING_COST,
+        linehaul_factor=HUB_LINEHAUL_FACTOR,
+        floyd_max_nodes=HUB_FLOYD_MAX_NODES,
+        neighbors=SPARSE_NEIGHBORS_K,
+        cache_dir=None,
+        max_workers=None,
+        chunk_size=HUB_DIJKSTRA_CHUNK,
+    ):
+        """
+        Args:
+            warehouses: DataFrame with warehouse_id, city, latitude, longitude and
+                optionally handling_cost (VND per unit leaving the hub)
+            handling_cost: Handling cost of warehouses without their own
+            linehaul_factor: Cost factor of hub-to-hub lanes
+            floyd_max_nodes: Largest graph solved with Floyd-Warshall (else Dijkstra)
+            neighbors: Direct lanes kept per store in the Dijkstra graph
+            cache_dir: Directory of the path cache (None = no cache)
+            max_workers: Dijkstra worker processes (default: CPU count)
+            chunk_size: Source stores per Dijkstra task
+        """
+        if warehouses.empty:
+            raise ValueError("The warehouse table is empty: at least one hub is required")
+        self.warehouses = warehouses.reset_index(drop=True)
+        self.linehaul_factor = linehaul_factor
+        self.floyd_max_nodes = floyd_max_nodes
+        self.neighbors = neighbors
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        if "handling_cost" in self.warehouses.columns:
+            self.handling = self.warehouses["handling_cost"].fillna(handling_cost).to_numpy(dtype=np.float64)
+        else:
+            self.handling = np.full(len(self.warehouses), float(handling_cost))
+        self.costs = None
+        self.predecessors = None
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """Load the hubs of a warehouses.csv file."""
+        print(f"Loading warehouses from {path}...")
+        return cls(pd.read_csv(path), **kwargs)
+
+    def build(self, optimizer, stores):
+        """
+        Compute (or load from the cache) the cheapest paths between all stores.
+
+        Args:
+            optimizer: Engine whose lane_block() prices direct store-to-store lanes
+            stores: DataFrame with store_id, city, latitude and longitude
+        """
+        self.optimizer = optimizer
+        stores = stores.sort_values("store_id").reset_index(drop=True)
+        self.store_ids = stores["store_id"].astype(int).to_numpy()
+        self.num_stores, self.num_hubs = len(stores), len(self.warehouses)
+        self.labels = np.array(
+            [str(s) for s in self.store_ids] + [f"W{w}" for w in self.warehouses["warehouse_id"]]
+        )
+        self.latitudes = np.concatenate([stores["latitude"], self.warehouses["latitude"]]).astype(np.float64)
+        self.longitudes = np.concatenate([stores["longitude"], self.warehouses["longitude"]]).astype(np.float64)
+        self.cities = np.concatenate([stores["city"], self.warehouses["city"]]).astype(str)
+
+        num_nodes = self.num_stores + self.num_hubs
+        dense = num_nodes <= self.floyd_max_nodes
+        direct = self.edge_block(np.arange(num_nodes), np.arange(num_nodes))[1] if dense else None
+
+        cache_path = None
+        if self.cache_dir:
+            cache_path = os.path.join(self.cache_dir, f"hub_paths_{self._fingerprint(direct)[:16]}.npz")
+            if os.path.exists(cache_path):
+                with np.load(cache_path) as data:
+                    self.costs, self.predecessors = data["costs"], data["predecessors"]
+                print(f"Loaded cheapest paths of {num_nodes} stores and hubs from {cache_path}")
+                return
+
+        if dense:
+            print(f"Computing cheapest paths over {num_nodes} stores and hubs (Floyd-Warshall)...")
+            np.fill_diagonal(direct, 0.0)
+            costs, predecessors = floyd_warshall(direct, pivots=range(self.num_stores, num_nodes))
+            self.costs = costs[: self.num_stores, : self.num_stores].copy()
+            self.predecessors = predecessors[: self.num_stores].copy()
+        else:
+            print(f"Computing cheapest paths over {num_nodes} stores and hubs (Dijkstra)...")
+            self.costs, self.predecessors = self._dijkstra()
+        np.fill_diagonal(self.costs, np.nan)
+
+        if cache_path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(cache_path, costs=self.costs, predecessors=self.predecessors)
+            print(f"Saved cheapest paths to {cache_path}")
+
+    def edge_block(self, from_nodes, to_nodes):
+        """
+        Direct edges between two sets of nodes (stores first, then hubs).
+
+        Returns:
+            Tuple of (distances, unit costs), each (len(from) x len(to)); inf = no edge
+        """
+        from_nodes, to_nodes = np.asarray(from_nodes), np.asarray(to_nodes)
+        from_hub, to_hub = from_nodes >= self.num_stores, to_nodes >= self.num_stores
+
+        distances = haversine_km(
+            self.latitudes[from_nodes, None], self.longitudes[from_nodes, None],
+            self.latitudes[None, to_nodes], self.longitudes[None, to_nodes],
+        )
+        costs = transport_cost_per_unit(distances, self.cities[from_nodes, None] == self.cities[None, to_nodes])
+        costs = np.where(from_hub[:, None] & to_hub[None, :], costs * self.linehaul_factor, costs)
+        handling = np.where(from_hub, self.handling[np.maximum(from_nodes - self.num_stores, 0)], 0.0)
+        costs = costs + handling[:, None]
+
+        # Store-to-store lanes are priced like the engines price them
+        from_stores, to_stores = np.flatnonzero(~from_hub), np.flatnonzero(~to_hub)
+        if len(from_stores) and len(to_stores):
+            lane_distances, lane_costs = self.optimizer.lane_block(
+                self.store_ids[from_nodes[from_stores]], self.store_ids[to_nodes[to_stores]]
+            )
+            distances[np.ix_(from_stores, to_stores)] = lane_distances
+            costs[np.ix_(from_stores, to_stores)] = lane_costs
+
+        costs[from_nodes[:, None] == to_nodes[None, :]] = np.inf
+        return distances, costs
+
+    def _fingerprint(self, direct):
+        """Digest of everything the cheapest paths depend on."""
+        digest = hashlib.sha256()
+        for array in (self.store_ids, self.latitudes, self.longitudes, self.handling):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update("|".join(self.cities).encode())
+        digest.update(np.array([self.linehaul_factor, self.neighbors], dtype=np.float64).tobytes())
+        if direct is not None:
+            digest.update(np.ascontiguousarray(direct).tobytes())
+        elif self.optimizer.transport_cost_matrix is not None:
+            digest.update(np.ascontiguousarray(self.optimizer.transport_cost_matrix.to_numpy()).tobytes())
+        return digest.hexdigest()
+
+    def _dijkstra(self):
+        """Cheapest paths of a large graph on the split store graph, in parallel chunks."""
+        S, H = self.num_stores, self.num_hubs
+        stores, hubs = np.arange(S), np.arange(S, S + H)
+        k = min(self.neighbors, S - 1)
+
+        # Nearest direct lanes: origin s -> destination t
+        rows, cols, weights = [], [], []
+        block = max(1, 2**22 // S)
+        for start in range(0, S, block):
+            chunk = stores[start:start + block]
+            _, costs = self.edge_block(chunk, stores)
+            nearest = np.argpartition(costs, k - 1, axis=1)[:, :k]
+            rows.append(np.repeat(chunk, k))
+            cols.append(S + H + nearest.ravel())
+            weights.append(np.take_along_axis(costs, nearest, axis=1).ravel())
+
+        # Hub lanes: origin -> hub, hub -> hub, hub -> destination
+        for from_nodes, to_nodes, offset in ((stores, hubs, 0), (hubs, hubs, 0), (hubs, stores, S + H)):
+            _, costs = self.edge_block(from_nodes, to_nodes)
+            r, c = np.nonzero(np.isfinite(costs))
+            rows.append(from_nodes[r])
+            cols.append(to_nodes[c] + offset)
+            weights.append(costs[r, c])
+
+        rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+        usable = np.isfinite(weights)
+        graph = csr_matrix((weights[usable], (rows[usable], cols[usable])), shape=(2 * S + H, 2 * S + H))
+
+        chunks = [stores[start:start + self.chunk_size] for start in range(0, S, self.chunk_size)]
+        workers = min(self.max_workers or os.cpu_count() or 1, len(chunks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(hub_paths, [graph] * len(chunks), chunks, [S] * len(chunks), [H] * len(chunks)))
+        else:
+            results = [hub_paths(graph, chunk, S, H) for chunk in chunks]
+
+        costs = np.vstack([result[0] for result in results])
+        predecessors = np.vstack([result[1] for result in results])
+
+        # Direct lanes beyond the nearest neighbours win where cheaper
+        for start in range(0, S, block):
+            chunk = stores[start:start + block]
+            _, direct = self.edge_block(chunk, stores)
+            cheaper = direct < costs[chunk]
+            costs[chunk] = np.where(cheaper, direct, costs[chunk])
+            predecessors[chunk, :S] = np.where(cheaper, chunk[:, None], predecessors[chunk, :S])
+
+        return costs, predecessors
+
+    def apply(self, optimizer):
+        """
+        Make an engine price lanes at the cheapest path. Distances stay those of
+        the direct lanes.
+
+        Args:
+            optimizer: Engine with transport_cost_matrix/distance_matrix attributes
+        """
+        if optimizer.distance_matrix is None:
+            distances, _ = optimizer.lane_block(self.store_ids, self.store_ids)
+            optimizer.distance_matrix = pd.DataFrame(distances, index=self.store_ids, columns=self.store_ids)
+        optimizer.transport_cost_matrix = pd.DataFrame(self.costs, index=self.store_ids, columns=self.store_ids)
+        optimizer.sparse_lanes = None
+
+    def path(self, from_store_id, to_store_id):
+        """Nodes of the cheapest path between two stores (store + hub numbering)."""
+        positions = np.searchsorted(self.store_ids, [from_store_id, to_store_id])
+        source, node = int(positions[0]), int(positions[1])
+        nodes = [node]
+        while node != source:
+            node = int(self.predecessors[source, node])
+            if node == NO_PREDECESSOR:
+                return []
+            nodes.append(node)
+        return nodes[::-1]
+
+    def leg_prices(self, from_nodes, to_nodes):
+        """
+        Distance and unit cost of individual legs. A store-to-store leg is the
+        whole (direct) path, so its cost is the path cost.
+
+        Args:
+            from_nodes: Origin node of each leg (stores first, then hubs)
+            to_nodes: Destination node of each leg
+
+        Returns:
+            Tuple of (distances, unit costs), one per leg
+        """
+        f, t = np.asarray(from_nodes, dtype=np.int64), np.asarray(to_nodes, dtype=np.int64)
+        from_hub, to_hub = f >= self.num_stores, t >= self.num_stores
+
+        distances = np.asarray(
+            haversine_km(self.latitudes[f], self.longitudes[f], self.latitudes[t], self.longitudes[t]),
+            dtype=np.float64,
+        )
+        costs = np.asarray(transport_cost_per_unit(distances, self.cities[f] == self.cities[t]), dtype=np.float64)
+        costs = np.where(from_hub & to_hub, costs * self.linehaul_factor, costs)
+        costs = costs + np.where(from_hub, self.handling[np.maximum(f - self.num_stores, 0)], 0.0)
+
+        direct = ~from_hub & ~to_hub
+        if direct.any():
+            costs[direct] = self.costs[f[direct], t[direct]]
+            matrix = self.optimizer.distance_matrix
+            if matrix is not None:
+                rows = matrix.index.get_indexer(self.store_ids[f[direct]])
+                cols = matrix.columns.get_indexer(self.store_ids[t[direct]])
+                known = (rows >= 0) & (cols >= 0)
+                lane_distances = distances[direct]
+                lane_distances[known] = matrix.to_numpy()[rows[known], cols[known]]
+                distances[direct] = lane_distances
+
+        return distances, costs
+
+    def route_plan(self, transfer_plan):
+        """
+        Price every transfer at its cheapest path and break it down into legs.
+
+        Args:
+            transfer_plan: DataFrame with from_store_id, to_store_id, product_id and units
+
+        Returns:
+            Tuple of (plan with transport_cost, distance_km and route updated,
+            DataFrame with one row per leg of every transfer)
+        """
+        if transfer_plan.empty:
+            return transfer_plan, pd.DataFrame()
+
+        plan = transfer_plan.reset_index(drop=True)
+        from_ids = plan["from_store_id"].astype(int).to_numpy()
+        to_ids = plan["to_store_id"].astype(int).to_numpy()
+        lanes, lane_of_line = np.unique(np.column_stack([from_ids, to_ids]), axis=0, return_inverse=True)
+        lane_of_line = lane_of_line.ravel()
+
+        paths = [
+            self.path(a, b) or list(np.searchsorted(self.store_ids, [a, b]))
+            for a, b in lanes.tolist()
+        ]
+        hops = np.array([len(path) - 1 for path in paths])
+        lane_of_leg = np.repeat(np.arange(len(lanes)), hops)
+        leg_from = np.concatenate([path[:-1] for path in paths])
+        leg_to = np.concatenate([path[1:] for path in paths])
+        leg_distances, leg_costs = self.leg_prices(leg_from, leg_to)
+
+        units = plan["units"].to_numpy(dtype=np.float64)
+        plan["transport_cost"] = units * np.bincount(lane_of_leg, leg_costs, len(lanes))[lane_of_line]
+        plan["distance_km"] = np.bincount(lane_of_leg, leg_distances, len(lanes))[lane_of_line]
+        plan["route"] = np.array([" > ".join(self.labels[path]) for path in paths])[lane_of_line]
+
+        # Legs of every line: the legs of its lane, in order
+        first_leg = np.concatenate([[0], np.cumsum(hops)[:-1]])
+        line_hops = hops[lane_of_line]
+        line_of_leg = np.repeat(np.arange(len(plan)), line_hops)
+        leg_number = np.arange(len(line_of_leg)) - np.repeat(np.cumsum(line_hops) - line_hops, line_hops)
+        leg = first_leg[lane_of_line][line_of_leg] + leg_number
+        legs = pd.DataFrame(
+            {
+                "from_store_id": from_ids[line_of_leg],
+                "to_store_id": to_ids[line_of_leg],
+                "product_id": plan["product_id"].to_numpy()[line_of_leg],
+                "leg": leg_number + 1,
+                "from_node": self.labels[leg_from[leg]],
+                "to_node": self.labels[leg_to[leg]],
+                "units": plan["units"].to_numpy()[line_of_leg],
+                "distance_km": leg_distances[leg],
+                "transport_cost": leg_costs[leg] * units[line_of_leg],
+            }
+        )
+
+        via_hubs = int((line_hops > 1).sum())
+        print(f"Hub routing: {via_hubs} of {len(plan)} transfers go through warehouses")
+        return plan, legs
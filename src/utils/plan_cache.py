@@ -0,0 +1,211 @@
+"""
+Content-addressed on-disk cache of optimization results.
+
+Entries are keyed by a hash of the input data files, the inventory thresholds,
+the engine name and its parameters. Each entry stores the analysis frame, the
+excess/needed frames, the transfer plan and the impact table. Least recently
+used entries are evicted once the cache exceeds its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from config import REQUIRED_DATA_FILES
+
+
+CACHE_FORMAT_VERSION = 1
+
+CACHED_FRAMES = ["analysis_df", "excess_df", "needed_df", "transfer_plan", "impact_df"]
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 of a file's content.
+
+    Args:
+        path: File path
+        chunk_size: Read size in bytes
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_input_files(data_dir, data_files=None):
+    """
+    Resolve the input files of a run: exactly the files it reads.
+
+    Args:
+        data_dir: Data directory
+        data_files: File names to resolve (defaults to REQUIRED_DATA_FILES)
+
+    Returns:
+        List of existing file paths
+    """
+    paths = [Path(data_dir) / file_name for file_name in data_files or REQUIRED_DATA_FILES]
+    return [path for path in paths if path.exists()]
+
+
+def make_cache_key(data_dir, min_days, max_days, engine_name, engine_params=None, data_files=None):
+    """
+    Build the cache key of an optimization run.
+
+    Args:
+        data_dir: Directory containing the input data files
+        min_days: Shortage threshold (days of inventory)
+        max_days: Excess threshold (days of inventory)
+        engine_name: Name of the optimization engine
+        engine_params: Engine parameters
+        data_files: File names the run reads (defaults to REQUIRED_DATA_FILES)
+
+    Returns:
+        Hex digest identifying the run
+    """
+    fingerprint = {
+        "version": CACHE_FORMAT_VERSION,
+        "inputs": {
+            path.name: hash_file(path) for path in resolve_input_files(data_dir, data_files)
+        },
+        "min_days": min_days,
+        "max_days": max_days,
+        "engine": engine_name,
+        "engine_params": engine_params or {},
+    }
+    payload = json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class PlanCache:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory holding cache entries
+            max_bytes: Maximum total size of the cache before LRU eviction
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key
+
+    def get(self, key):
+        """
+        Load a cache entry and mark it as recently used.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            Dictionary of cached frames, or None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = entry_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            entry = {}
+            for name in CACHED_FRAMES:
+                frame_path = entry_dir / f"{name}.pkl"
+                entry[name] = pd.read_pickle(frame_path) if frame_path.exists() else None
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Discarding unreadable cache entry {key[:12]}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        meta["last_access"] = time.time()
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+        entry["meta"] = meta
+        return entry
+
+    def put(self, key, frames, meta=None):
+        """
+        Store a cache entry and evict least recently used entries if needed.
+
+        Args:
+            key: Cache key from make_cache_key
+            frames: Dictionary with any of CACHED_FRAMES
+            meta: Optional extra metadata stored with the entry
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        for name in CACHED_FRAMES:
+            frame = frames.get(name)
+            if frame is not None:
+                pd.to_pickle(frame, tmp_dir / f"{name}.pkl")
+
+        now = time.time()
+        entry_meta = {**(meta or {}), "key": key, "created": now, "last_access": now}
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump(entry_meta, f, indent=2, default=str)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry_dir in self.cache_dir.iterdir():
+            meta_path = entry_dir / "meta.json"
+            if entry_dir.name.startswith(".") or not meta_path.exists():
+                continue
+            try:
+                with open(meta_path) as f:
+                    last_access = json.load(f).get("last_access", 0)
+            except (OSError, ValueError):
+                last_access = 0
+            size = sum(p.stat().st_size for p in entry_dir.iterdir() if p.is_file())
+            entries.append((last_access, size, entry_dir))
+        return entries
+
+    def total_size(self):
+        """Return the total size of all cache entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            Number of evicted entries
+        """
+        entries = sorted(self._entries(), key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+
+        if evicted:
+            print(f"Evicted {evicted} plan cache entries ({total / (1024 * 1024):.1f} MB left)")
+        return evicted
+
+    def clear(self):
+        """Remove every cache entry."""
+        for entry_dir in self.cache_dir.iterdir():
+            shutil.rmtree(entry_dir, ignore_errors=True)
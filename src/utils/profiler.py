@@ -0,0 +1,177 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def get_peak_rss_mb():
+    """
+    Get the peak resident set size of the current process in MB.
+
+    Returns:
+        Peak RSS in MB, or None when the platform does not expose it
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if os.uname().sysname == "Darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class StageProfiler:
+    def __init__(self, enabled=False, cprofile_stage=None):
+        """
+        Lightweight per-stage instrumentation for the optimization pipeline.
+
+        Args:
+            enabled: Whether spans are recorded. When False every stage is a no-op.
+            cprofile_stage: Optional stage name to run under cProfile
+        """
+        self.enabled = enabled
+        self.cprofile_stage = cprofile_stage
+        self.stages = []
+        self.cprofile_stats = None
+        self._stack = []
+        self._started_at = None
+
+        if self.enabled:
+            self._started_at = datetime.now()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Record wall time, CPU time, peak memory and row count of a pipeline stage.
+
+        Usage:
+            with profiler.stage("optimize") as span:
+                plan = optimizer.optimize(excess_df, needed_df)
+                span["rows"] = len(plan)
+
+        Args:
+            name: Stage name
+            rows: Optional number of rows processed (can also be set on the span)
+
+        Yields:
+            Dictionary with the stage record
+        """
+        span = {"stage": name, "rows": rows}
+
+        if not self.enabled:
+            yield span
+            return
+
+        span["depth"] = len(self._stack)
+        span["_child_peak"] = 0
+        self._stack.append(span)
+        self.stages.append(span)
+
+        profile = None
+        if self.cprofile_stage == name:
+            profile = cProfile.Profile()
+
+        tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+
+        if profile is not None:
+            profile.enable()
+        try:
+            yield span
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.cprofile_stats = profile
+
+            span["wall_time_s"] = time.perf_counter() - start_wall
+            span["cpu_time_s"] = time.process_time() - start_cpu
+
+            _, traced_peak = tracemalloc.get_traced_memory()
+            traced_peak = max(traced_peak, span.pop("_child_peak"))
+            span["tracemalloc_peak_mb"] = traced_peak / (1024 * 1024)
+            span["peak_rss_mb"] = get_peak_rss_mb()
+            if span["rows"] is not None and span["wall_time_s"] > 0:
+                span["rows_per_s"] = span["rows"] / span["wall_time_s"]
+
+            self._stack.pop()
+            if self._stack:
+                parent = self._stack[-1]
+                parent["_child_peak"] = max(parent["_child_peak"], traced_peak)
+
+    def get_report(self):
+        """
+        Build the profiling report.
+
+        Returns:
+            Dictionary with per-stage records and totals
+        """
+        top_level = [s for s in self.stages if s.get("depth", 0) == 0]
+
+        return {
+            "started_at": self._started_at.isoformat() if self._started_at else None,
+            "cprofile_stage": self.cprofile_stage,
+            "stages": self.stages,
+            "totals": {
+                "wall_time_s": sum(s["wall_time_s"] for s in top_level),
+                "cpu_time_s": sum(s["cpu_time_s"] for s in top_level),
+                "tracemalloc_peak_mb": max(
+                    (s["tracemalloc_peak_mb"] for s in self.stages), default=0
+                ),
+                "peak_rss_mb": get_peak_rss_mb(),
+            },
+        }
+
+    def write_report(self, results_dir, filename="profile_report.json"):
+        """
+        Write the JSON report (and the cProfile dump, if any) to the results directory.
+
+        Args:
+            results_dir: Directory to save the report to
+            filename: Report file name
+
+        Returns:
+            Path of the JSON report, or None when profiling is disabled
+        """
+        if not self.enabled:
+            return None
+
+        os.makedirs(results_dir, exist_ok=True)
+        report_path = os.path.join(results_dir, filename)
+
+        with open(report_path, "w") as f:
+            json.dump(self.get_report(), f, indent=2, default=str)
+        print(f"Saved profile report to {report_path}")
+
+        if self.cprofile_stats is not None:
+            prof_path = os.path.join(results_dir, f"{self.cprofile_stage}.prof")
+            self.cprofile_stats.dump_stats(prof_path)
+            print(f"Saved cProfile dump for stage '{self.cprofile_stage}' to {prof_path}")
+
+        return report_path
+
+    def print_summary(self):
+        """Print a per-stage timing table."""
+        if not self.enabled or not self.stages:
+            return
+
+        print("\n=== PROFILE SUMMARY ===")
+        print(f"{'Stage':<32}{'Wall (s)':>10}{'CPU (s)':>10}{'Peak MB':>10}{'Rows':>10}")
+        for span in self.stages:
+            name = "  " * span.get("depth", 0) + span["stage"]
+            rows = span["rows"] if span["rows"] is not None else "-"
+            print(
+                f"{name:<32}{span['wall_time_s']:>10.3f}{span['cpu_time_s']:>10.3f}"
+                f"{span['tracemalloc_peak_mb']:>10.1f}{rows:>10}"
+            )
@@ -0,0 +1,87 @@
+"""
+Publish DataFrames once through multiprocessing.shared_memory so worker
+processes can attach to them without pickling or reloading.
+"""
+
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+class SharedFrameStore:
+    def __init__(self):
+        """Owner of shared memory blocks; unlinks them on close()."""
+        self.blocks = []
+
+    def publish(self, df):
+        """
+        Copy a DataFrame into a shared memory block.
+
+        All columns are stored as one float64 block (NaN preserved); the
+        descriptor records the original dtypes so attach_frame can restore them.
+
+        Args:
+            df: DataFrame with numeric columns
+
+        Returns:
+            Picklable descriptor for attach_frame
+        """
+        values = df.to_numpy(dtype=np.float64, na_value=np.nan)
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        block = np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)
+        block[:] = values
+        self.blocks.append(shm)
+
+        return {
+            "name": shm.name,
+            "shape": values.shape,
+            "columns": list(df.columns),
+            "dtypes": [str(dtype) for dtype in df.dtypes],
+            "index": df.index.to_numpy(),
+        }
+
+    def close(self):
+        """Release and unlink every published block."""
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def attach_frame(descriptor):
+    """
+    Attach to a DataFrame published by SharedFrameStore.
+
+    Float columns are zero-copy, read-only views on the shared block; other
+    columns are converted back to their original dtype.
+
+    Args:
+        descriptor: Descriptor returned by SharedFrameStore.publish
+
+    Returns:
+        Tuple of (DataFrame, SharedMemory). Keep the SharedMemory referenced while
+        the DataFrame is in use and close() it afterwards.
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    # The creating process owns the block. Forked workers share its resource
+    # tracker; other start methods get their own, which must not unlink the block.
+    if multiprocessing.get_start_method(allow_none=True) not in (None, "fork"):
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    block = np.ndarray(descriptor["shape"], dtype=np.float64, buffer=shm.buf)
+    block.flags.writeable = False
+
+    df = pd.DataFrame(block, index=descriptor["index"], columns=descriptor["columns"], copy=False)
+    for column, dtype in zip(descriptor["columns"], descriptor["dtypes"]):
+        if dtype != "float64":
+            df[column] = df[column].astype(dtype)
+
+    return df, shm
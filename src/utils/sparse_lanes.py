@@ -0,0 +1,171 @@
+"""
+Sparse k-nearest-neighbour lane matrix.
+
+Instead of the dense n x n distance and cost matrices, every store keeps only
+its k nearest neighbours in CSR form (indptr / neighbour positions / distances
+/ costs), saved as a single binary .npz file. Lanes outside the sparse set are
+priced on the fly from the store coordinates with the same cost model.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils.geo import haversine_km, transport_cost_per_unit
+from utils.spatial_index import to_unit_vectors
+
+
+def nearest_lanes(latitudes, longitudes, cities, k, rows=None):
+    """
+    The k nearest lanes of some stores.
+
+    Args:
+        latitudes: Latitude of every store
+        longitudes: Longitude of every store
+        cities: City of every store
+        k: Neighbours per store
+        rows: Positions of the stores to query (default: all)
+
+    Returns:
+        Tuple of (neighbour positions, distances, costs per unit), each (len(rows) x k)
+    """
+    rows = np.arange(len(latitudes)) if rows is None else np.asarray(rows, dtype=np.int64)
+    points = to_unit_vectors(latitudes, longitudes)
+
+    _, neighbors = cKDTree(points).query(points[rows], k=k + 1)
+    neighbors = neighbors.reshape(len(rows), k + 1)
+
+    # Drop each store itself (normally column 0, but co-located stores may swap)
+    keep = neighbors != rows[:, None]
+    keep[keep.sum(axis=1) > k, -1] = False
+    neighbors = neighbors[keep].reshape(len(rows), k)
+    origins = np.repeat(rows[:, None], k, axis=1)
+
+    distances = haversine_km(
+        latitudes[origins], longitudes[origins], latitudes[neighbors], longitudes[neighbors]
+    )
+    costs = transport_cost_per_unit(distances, cities[origins] == cities[neighbors])
+    return neighbors, np.asarray(distances).reshape(len(rows), k), np.asarray(costs).reshape(len(rows), k)
+
+
+class SparseLaneMatrix:
+    def __init__(self, store_ids, latitudes, longitudes, cities, indptr, neighbors, distances, costs):
+        """
+        Args:
+            store_ids: Store id of every row
+            latitudes: Latitude of every store
+            longitudes: Longitude of every store
+            cities: City of every store
+            indptr: CSR row pointer (len(store_ids) + 1 entries)
+            neighbors: Row position of each neighbour, nearest first within a row
+            distances: Distance in km of each stored lane
+            costs: Transport cost per unit of each stored lane
+        """
+        self.store_ids = np.asarray(store_ids, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.cities = np.asarray(cities)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.costs = np.asarray(costs, dtype=np.float64)
+        self.positions = {int(store_id): i for i, store_id in enumerate(self.store_ids)}
+
+    @classmethod
+    def from_stores(cls, stores, k):
+        """
+        Build the k nearest neighbours of every store.
+
+        Args:
+            stores: DataFrame with store_id, city, latitude and longitude
+            k: Neighbours kept per store
+
+        Returns:
+            SparseLaneMatrix
+        """
+        latitudes = stores["latitude"].to_numpy(dtype=np.float64)
+        longitudes = stores["longitude"].to_numpy(dtype=np.float64)
+        cities = stores["city"].astype(str).to_numpy()
+        k = min(k, len(stores) - 1)
+
+        neighbors, distances, costs = nearest_lanes(latitudes, longitudes, cities, k)
+
+        return cls(
+            stores["store_id"].to_numpy(),
+            latitudes,
+            longitudes,
+            cities,
+            np.arange(len(stores) + 1) * k,
+            neighbors.ravel(),
+            distances.ravel(),
+            costs.ravel(),
+        )
+
+    def save(self, path):
+        """Write the matrix to a binary .npz file."""
+        np.savez(
+            path,
+            store_ids=self.store_ids,
+            latitudes=self.latitudes,
+            longitudes=self.longitudes,
+            cities=self.cities.astype(str),
+            indptr=self.indptr,
+            neighbors=self.neighbors,
+            distances=self.distances,
+            costs=self.costs,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Read a matrix written by save()."""
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def __contains__(self, store_id):
+        return store_id in self.positions
+
+    def neighbors_of(self, store_id):
+        """
+        Stored lanes of a store, nearest first.
+
+        Returns:
+            Tuple of (neighbour store ids, distances, costs per unit)
+        """
+        i = self.positions[store_id]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.store_ids[self.neighbors[start:end]], self.distances[start:end], self.costs[start:end]
+
+    def lanes_to(self, store_id, from_store_ids):
+        """
+        Price lanes from many stores to one store from the coordinates.
+
+        Args:
+            store_id: Destination store
+            from_store_ids: Array of origin stores
+
+        Returns:
+            Tuple of (distances, costs per unit) arrays
+        """
+        j = self.positions[store_id]
+        rows = np.array([self.positions[s] for s in from_store_ids], dtype=np.int64)
+        distances = haversine_km(
+            self.latitudes[rows], self.longitudes[rows], self.latitudes[j], self.longitudes[j]
+        )
+        costs = transport_cost_per_unit(distances, self.cities[rows] == self.cities[j])
+        return np.atleast_1d(distances), np.atleast_1d(costs)
+
+    def lane(self, from_store_id, to_store_id):
+        """
+        Distance and cost per unit of one lane; the stored value if the lane is
+        in the sparse set, otherwise computed from the coordinates.
+        """
+        neighbor_ids, distances, costs = self.neighbors_of(from_store_id)
+        hit = np.flatnonzero(neighbor_ids == to_store_id)
+        if hit.size:
+            return float(distances[hit[0]]), float(costs[hit[0]])
+
+        distances, costs = self.lanes_to(to_store_id, [from_store_id])
+        return float(distances[0]), float(costs[0])
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.neighbors.nbytes + self.distances.nbytes + self.costs.nbytes
@@ -0,0 +1,106 @@
+"""
+Spatial index over store coordinates.
+
+Stores are placed on the unit sphere and indexed with a KD-tree; the chord
+distance between two points grows monotonically with their great-circle
+distance, so nearest neighbours in the tree are nearest by haversine as well.
+Only the lanes actually queried are priced, which keeps memory at O(n)
+instead of the O(n²) of a dense distance matrix.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from utils.geo import haversine_km, transport_cost_per_unit
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """Convert decimal degree coordinates to 3D points on the unit sphere."""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+class StoreSpatialIndex:
+    def __init__(self, stores):
+        """
+        Args:
+            stores: DataFrame with store_id, city, latitude and longitude
+        """
+        self.store_ids = stores["store_id"].astype(int).to_numpy()
+        self.positions = {store_id: i for i, store_id in enumerate(self.store_ids)}
+        self.latitudes = stores["latitude"].to_numpy(dtype=np.float64)
+        self.longitudes = stores["longitude"].to_numpy(dtype=np.float64)
+        self.cities = stores["city"].to_numpy() if "city" in stores.columns else None
+        self.points = to_unit_vectors(self.latitudes, self.longitudes)
+
+    def __contains__(self, store_id):
+        return store_id in self.positions
+
+    def distance_km(self, from_store_id, to_store_id):
+        """Haversine distance between two stores."""
+        i, j = self.positions[from_store_id], self.positions[to_store_id]
+        return float(
+            haversine_km(self.latitudes[i], self.longitudes[i], self.latitudes[j], self.longitudes[j])
+        )
+
+    def lane_cost(self, from_store_id, to_store_id, distance_km=None):
+        """Transport cost per unit between two stores (same model as DistanceCalculator)."""
+        if distance_km is None:
+            distance_km = self.distance_km(from_store_id, to_store_id)
+        same_city = (
+            self.cities is None
+            or self.cities[self.positions[from_store_id]] == self.cities[self.positions[to_store_id]]
+        )
+        return transport_cost_per_unit(distance_km, same_city)
+
+    def subset(self, store_ids):
+        """
+        Build a KD-tree over a subset of stores (e.g. the donors of one product).
+
+        Args:
+            store_ids: Store ids to index
+
+        Returns:
+            StoreSubsetIndex
+        """
+        return StoreSubsetIndex(self, store_ids)
+
+
+class StoreSubsetIndex:
+    def __init__(self, index, store_ids):
+        """
+        Args:
+            index: StoreSpatialIndex holding the coordinates
+            store_ids: Store ids to index
+        """
+        self.index = index
+        self.store_ids = np.array([s for s in store_ids if s in index.positions], dtype=np.int64)
+        self.tree = cKDTree(index.points[[index.positions[s] for s in self.store_ids]])
+
+    def __len__(self):
+        return len(self.store_ids)
+
+    def nearest(self, store_id, k):
+        """
+        Query the k stores of the subset nearest to a store.
+
+        Args:
+            store_id: Store to search around
+            k: Number of neighbours
+
+        Returns:
+            List of (store_id, distance_km) sorted by distance
+        """
+        k = min(k, len(self.store_ids))
+        if k == 0:
+            return []
+
+        _, neighbours = self.tree.query(self.index.points[self.index.positions[store_id]], k=k)
+        neighbours = np.atleast_1d(neighbours)
+        return [
+            (int(self.store_ids[n]), self.index.distance_km(int(self.store_ids[n]), store_id))
+            for n in neighbours
+        ]